@@ -5,7 +5,11 @@ Handles image serving, annotation CRUD operations, and YOLO format conversion
 """
 
 import os
+import sys
 import json
+import importlib
+import threading
+import time
 from pathlib import Path
 from flask import Flask, request, jsonify, send_file, send_from_directory
 from flask_cors import CORS
@@ -24,9 +28,71 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
-# PDF page cache directory
+# PDF page rasterization mode: rgb, gray (8-bit single channel) or
+# bilevel (1-bit PNG). Line drawings lose nothing in gray/bilevel and the
+# cached pages are roughly 3x smaller to store, encode and decode.
+PDF_COLOR_MODE = os.environ.get('PDF_COLOR_MODE', 'rgb').lower()
+if PDF_COLOR_MODE not in ('rgb', 'gray', 'bilevel'):
+    logger.warning(f"Unknown PDF_COLOR_MODE '{PDF_COLOR_MODE}', falling back to rgb")
+    PDF_COLOR_MODE = 'rgb'
+
+# PDF page cache directory (non-rgb pages get their own subfolder so
+# switching modes never serves a stale cached page)
 PDF_CACHE_DIR = Path(__file__).parent / "pdf_cache"
-PDF_CACHE_DIR.mkdir(exist_ok=True)
+if PDF_COLOR_MODE != 'rgb':
+    PDF_CACHE_DIR = PDF_CACHE_DIR / PDF_COLOR_MODE
+PDF_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+# Repository root - shared inference helpers (tiled_inference.py etc.) live there, next to models/
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+# Tiled auto-labelling for large drawings: pages are cut into overlapping
+# tiles so small shapes aren't lost when the model downsamples (0 = whole page)
+AUTO_LABEL_TILE_SIZE = int(os.environ.get('AUTO_LABEL_TILE_SIZE', 0))
+AUTO_LABEL_TILE_OVERLAP = float(os.environ.get('AUTO_LABEL_TILE_OVERLAP', 0.2))
+AUTO_LABEL_TILE_BATCH = int(os.environ.get('AUTO_LABEL_TILE_BATCH', 8))
+
+# Skip blank tiles, and crop full pages to their inked region, before running the model
+AUTO_LABEL_SKIP_BLANK = os.environ.get('AUTO_LABEL_SKIP_BLANK', '1') != '0'
+
+# Lowest confidence kept in the .pred.npz prediction sidecars written next to auto-generated labels
+AUTO_LABEL_RAW_CONFIDENCE = float(os.environ.get('AUTO_LABEL_RAW_CONFIDENCE', 0.05))
+
+# Inference runtime for auto-labelling: torch (ultralytics), onnxruntime or openvino
+# (the last two load the exported models/best.onnx)
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'torch')
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', 0)) or None
+
+# Use the model held by a running inference_server.py (http://host:port or unix:///path)
+# instead of loading the weights in this process
+INFERENCE_SERVER = os.environ.get('INFERENCE_SERVER') or None
+
+# Reuse cached detections for images this model has already seen (location and size cap
+# come from YOLO_PREDICTION_CACHE / YOLO_PREDICTION_CACHE_MB)
+AUTO_LABEL_CACHE = os.environ.get('AUTO_LABEL_CACHE', '1') != '0'
+
+def import_shared_module(name: str):
+    """Import one of the shared inference modules from the repository root"""
+    if str(REPO_ROOT) not in sys.path:
+        sys.path.insert(0, str(REPO_ROOT))
+    return importlib.import_module(name)
+
+# Thread count and page image size tuned for this machine by inference_profile.py
+# (stored in config.json); INFERENCE_THREADS / INFERENCE_IMGSZ override them
+try:
+    TUNED_INFERENCE = import_shared_module('inference_profile').tuned_settings('interactive', INFERENCE_BACKEND)
+except ImportError:
+    TUNED_INFERENCE = {}
+INFERENCE_THREADS = INFERENCE_THREADS or TUNED_INFERENCE.get('threads')
+INFERENCE_IMGSZ = int(os.environ.get('INFERENCE_IMGSZ', 0)) or TUNED_INFERENCE.get('imgsz', 640)
+
+# POST /api/predict: concurrent requests share one warm model; images arriving within
+# PREDICT_MAX_WAIT_MS of each other run as one batch of up to PREDICT_MAX_BATCH
+PREDICT_MAX_BATCH = int(os.environ.get('PREDICT_MAX_BATCH', 8))
+PREDICT_MAX_WAIT_MS = float(os.environ.get('PREDICT_MAX_WAIT_MS', 10))
+DEFAULT_MODEL_PATH = "../../models/best.pt"
+_predictor = None
+_predictor_lock = threading.Lock()
 
 # Configuration - Now dynamic, set via API
 DATA_DIR: Optional[Path] = None
@@ -99,7 +165,8 @@ def get_pdf_page_count(pdf_path: Path) -> int:
         logger.error(f"Error reading PDF {pdf_path}: {e}")
         return 1  # Default to 1 page if error
 
-def convert_pdf_page_to_image(pdf_path: Path, page_num: int, dpi: int = 150) -> Optional[Image.Image]:
+def convert_pdf_page_to_image(pdf_path: Path, page_num: int, dpi: int = 150,
+                              color_mode: Optional[str] = None) -> Optional[Image.Image]:
     """
     Convert a specific page of a PDF to a PIL Image
 
@@ -107,10 +174,12 @@ def convert_pdf_page_to_image(pdf_path: Path, page_num: int, dpi: int = 150) ->
         pdf_path: Path to PDF file
         page_num: Page number (0-indexed)
         dpi: Resolution for conversion (default 150)
+        color_mode: 'rgb', 'gray' or 'bilevel' (default PDF_COLOR_MODE)
 
     Returns:
-        PIL Image or None if error
+        PIL Image (mode RGB, L or 1) or None if error
     """
+    color_mode = color_mode or PDF_COLOR_MODE
     try:
         doc = fitz.open(str(pdf_path))
 
@@ -125,11 +194,16 @@ def convert_pdf_page_to_image(pdf_path: Path, page_num: int, dpi: int = 150) ->
         # zoom = dpi / 72 (72 is default DPI)
         zoom = dpi / 72
         mat = fitz.Matrix(zoom, zoom)
-        pix = page.get_pixmap(matrix=mat)
+        colorspace = fitz.csRGB if color_mode == 'rgb' else fitz.csGRAY
+        pix = page.get_pixmap(matrix=mat, colorspace=colorspace, alpha=False)
+
+        # Wrap the raw samples directly instead of a PNG encode/decode round trip
+        pil_mode = 'RGB' if pix.n == 3 else 'L'
+        img = Image.frombytes(pil_mode, (pix.width, pix.height), pix.samples, 'raw', pil_mode, pix.stride)
 
-        # Convert to PIL Image
-        img_data = pix.tobytes("png")
-        img = Image.open(io.BytesIO(img_data))
+        if color_mode == 'bilevel':
+            # Threshold (no dithering) and let PIL pack the PNG to 1 bit per pixel
+            img = img.point(lambda value: 255 if value >= 128 else 0).convert('1', dither=0)
 
         doc.close()
         return img
@@ -180,7 +254,74 @@ def ensure_directories():
         LABELS_DIR.mkdir(parents=True, exist_ok=True)
         logger.info(f"Created labels directory: {LABELS_DIR}")
 
-def generate_missing_labels(images_dir: Path, labels_dir: Path, model_path: str = "../../models/best.pt", confidence: float = 0.25) -> Tuple[int, int]:
+def detect_objects(model, image, confidence: float, cache=None, weights_digest=None, stats=None):
+    """
+    Run the model on one BGR page image with the configured tiling and blank skipping
+
+    Returns:
+        (xyxy, conf, cls) numpy arrays in page pixel coordinates
+    """
+    prediction_cache = import_shared_module('prediction_cache')
+    if AUTO_LABEL_TILE_SIZE:
+        # Tiled inference on the full-resolution page
+        return prediction_cache.cached_predict_tiled(
+            model, image, confidence, AUTO_LABEL_TILE_SIZE, AUTO_LABEL_TILE_OVERLAP,
+            AUTO_LABEL_TILE_BATCH, stats=stats, skip_blank=AUTO_LABEL_SKIP_BLANK,
+            cache=cache, weights_digest=weights_digest)
+
+    if AUTO_LABEL_SKIP_BLANK:
+        # Inference on the inked region only; blank pages skip the model
+        crop, origin = import_shared_module('tiled_inference').crop_to_content(image, stats)
+        if crop is None:
+            return import_shared_module('yolo_labels').boxes_to_arrays(None)
+        xyxy, conf, cls = prediction_cache.cached_predict(model, crop, confidence, cache, weights_digest,
+                                                          imgsz=INFERENCE_IMGSZ)
+        return xyxy + np.array([origin[0], origin[1], origin[0], origin[1]], dtype=np.float32), conf, cls
+
+    return prediction_cache.cached_predict(model, image, confidence, cache, weights_digest, imgsz=INFERENCE_IMGSZ)
+
+def load_inference_model(model_path: str = DEFAULT_MODEL_PATH):
+    """
+    Load the auto-label model (or connect to INFERENCE_SERVER)
+
+    Returns:
+        (model, model weights hash)
+    """
+    inference_backends = import_shared_module('inference_backends')
+    prediction_cache = import_shared_module('prediction_cache')
+    if INFERENCE_SERVER:
+        logger.info(f"Using the model served at {INFERENCE_SERVER}")
+        model = inference_backends.load_model(None, server=INFERENCE_SERVER)
+        return model, model.model_hash
+
+    # Get absolute model path (the exported .onnx next to it for ONNX Runtime/OpenVINO)
+    model_abs_path = inference_backends.resolve_model_path(Path(__file__).parent / model_path, INFERENCE_BACKEND)
+    if not model_abs_path.exists():
+        raise FileNotFoundError(f"Model not found at {model_abs_path}")
+
+    logger.info(f"Loading YOLO model from {model_abs_path} ({INFERENCE_BACKEND}, "
+                f"{INFERENCE_THREADS or 'default'} threads, imgsz {INFERENCE_IMGSZ})")
+    model = inference_backends.load_model(model_abs_path, INFERENCE_BACKEND, INFERENCE_THREADS)
+    return model, prediction_cache.model_hash(model_abs_path)
+
+def get_predictor():
+    """
+    Shared warm model behind a micro-batcher, loaded on first use
+
+    Returns:
+        (MicroBatcher, model weights hash)
+    """
+    global _predictor
+    with _predictor_lock:
+        if _predictor is None:
+            model, weights_digest = load_inference_model()
+            logger.info(f"Predictions batched up to {PREDICT_MAX_BATCH} images within {PREDICT_MAX_WAIT_MS:g} ms")
+            batcher = import_shared_module('micro_batching').MicroBatcher(model, PREDICT_MAX_BATCH,
+                                                                          PREDICT_MAX_WAIT_MS)
+            _predictor = (batcher, weights_digest)
+        return _predictor
+
+def generate_missing_labels(images_dir: Path, labels_dir: Path, model_path: str = DEFAULT_MODEL_PATH, confidence: float = 0.25) -> Tuple[int, int]:
     """
     Run YOLO on images without labels (PNG and JPG only - PDFs need conversion first)
 
@@ -188,18 +329,21 @@ def generate_missing_labels(images_dir: Path, labels_dir: Path, model_path: str
         Tuple of (generated_count, error_count)
     """
     try:
-        # Import YOLO only when needed
-        from ultralytics import YOLO
-
-        # Get absolute model path
-        model_abs_path = Path(__file__).parent / model_path
-        if not model_abs_path.exists():
-            logger.error(f"Model not found at {model_abs_path}")
+        # Load the model only when needed
+        try:
+            model, weights_digest = load_inference_model(model_path)
+        except (FileNotFoundError, ConnectionError) as e:
+            logger.error(str(e))
             return 0, 0
 
-        # Load model
-        logger.info(f"Loading YOLO model from {model_abs_path}")
-        model = YOLO(str(model_abs_path))
+        yolo_labels = import_shared_module('yolo_labels')
+        prediction_cache = import_shared_module('prediction_cache')
+        cache = prediction_cache.PredictionCache() if AUTO_LABEL_CACHE else None
+        tiled_inference = import_shared_module('tiled_inference')
+        tile_stats = {}
+        if AUTO_LABEL_TILE_SIZE:
+            logger.info(f"Tiled inference enabled: {AUTO_LABEL_TILE_SIZE}px tiles, "
+                        f"{AUTO_LABEL_TILE_OVERLAP:.0%} overlap, batch {AUTO_LABEL_TILE_BATCH}")
 
         # Ensure labels directory exists
         labels_dir.mkdir(parents=True, exist_ok=True)
@@ -262,45 +406,52 @@ def generate_missing_labels(images_dir: Path, labels_dir: Path, model_path: str
                 img_name = img_path.name if hasattr(img_path, 'name') else str(img_path)
                 logger.info(f"Processing: {idx}/{total_unlabeled} images ({img_name})")
 
-                # Run inference
-                results = model(str(img_path), conf=confidence, verbose=False)
-
-                if results and len(results) > 0:
-                    result = results[0]
-
-                    if result.boxes and len(result.boxes) > 0:
-                        # Get image dimensions
-                        img_height, img_width = result.orig_shape
-
-                        # Write YOLO format labels
-                        with open(label_path, 'w') as f:
-                            for box in result.boxes:
-                                cls = int(box.cls[0])
-                                # Convert xyxy to xywh normalized
-                                x1, y1, x2, y2 = box.xyxy[0].tolist()
-                                x_center = ((x1 + x2) / 2) / img_width
-                                y_center = ((y1 + y2) / 2) / img_height
-                                width = (x2 - x1) / img_width
-                                height = (y2 - y1) / img_height
-
-                                f.write(f"{cls} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n")
-
-                        generated_count += 1
-                        logger.info(f"✓ Generated {len(result.boxes)} labels for {img_name}")
-                    else:
-                        # Create empty label file for images with no detections
-                        label_path.touch()
-                        logger.info(f"✓ No detections for {img_name}, created empty label file")
+                # Detect down to the raw confidence floor; the threshold is applied
+                # after every detection is cached in the prediction sidecar
+                raw_confidence = min(AUTO_LABEL_RAW_CONFIDENCE, confidence)
+                if AUTO_LABEL_TILE_SIZE or AUTO_LABEL_SKIP_BLANK:
+                    image = cv2.imread(str(img_path))
+                    if image is None:
+                        raise ValueError(f"Could not read image {img_path}")
+                    img_height, img_width = image.shape[:2]
+                    xyxy, conf, cls = detect_objects(model, image, raw_confidence, cache, weights_digest, tile_stats)
+                else:
+                    # Whole page straight from the file (cached by its bytes)
+                    img_width, img_height = get_image_dimensions(img_path)
+                    xyxy, conf, cls = prediction_cache.cached_predict(
+                        model, img_path, raw_confidence, cache, weights_digest, imgsz=INFERENCE_IMGSZ)
+
+                # Write YOLO format labels and the raw detections with their confidences
+                raw_labels = yolo_labels.xyxy_to_yolo(xyxy, cls, img_width, img_height)
+                labels = raw_labels[conf >= confidence]
+                yolo_labels.write_yolo_labels(label_path, labels)
+                yolo_labels.save_predictions(yolo_labels.predictions_path(label_path), raw_labels, conf,
+                                             img_width, img_height, confidence, raw_confidence)
+
+                if len(labels) > 0:
+                    generated_count += 1
+                    logger.info(f"✓ Generated {len(labels)} labels for {img_name}")
+                else:
+                    # Empty label file for images with no detections
+                    logger.info(f"✓ No detections for {img_name}, created empty label file")
 
             except Exception as e:
                 logger.error(f"✗ Error processing {img_name}: {e}")
                 error_count += 1
 
         logger.info(f"Auto-generation complete: {generated_count}/{total_unlabeled} labels generated, {error_count} errors")
+        if AUTO_LABEL_TILE_SIZE:
+            logger.info(tiled_inference.format_tile_report(tile_stats))
+        if AUTO_LABEL_SKIP_BLANK:
+            logger.info(tiled_inference.format_skip_report(tile_stats))
+        if cache is not None:
+            logger.info(cache.report())
+            cache.close()
         return generated_count, error_count
 
-    except ImportError:
-        logger.error("ultralytics package not installed. Please install with: pip install ultralytics")
+    except ImportError as e:
+        logger.error(f"Inference runtime not installed ({e}). Install ultralytics, or onnxruntime/openvino "
+                     f"for INFERENCE_BACKEND={INFERENCE_BACKEND}")
         return 0, 0
     except Exception as e:
         logger.error(f"Error in generate_missing_labels: {e}")
@@ -792,6 +943,144 @@ def get_annotations(filename):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/predictions/<filename>', methods=['GET'])
+def get_predictions(filename):
+    """
+    Get cached model predictions for specific image
+
+    Returns every raw detection from the prediction sidecar with its confidence,
+    highest first, so the UI can re-filter by threshold without running the model
+    """
+    try:
+        # Check if directory is set
+        if not LABELS_DIR:
+            return jsonify({'error': 'No directory selected'}), 400
+
+        yolo_labels = import_shared_module('yolo_labels')
+        sidecar = yolo_labels.predictions_path(LABELS_DIR / f"{Path(filename).stem}.txt")
+        predictions = yolo_labels.load_predictions(sidecar)
+        if predictions is None:
+            return jsonify({'error': 'No cached predictions for this image'}), 404
+
+        img_width, img_height = predictions['image_size']
+        annotations = []
+        order = predictions['conf'].argsort()[::-1]
+        for i, index in enumerate(order):
+            bbox = yolo_to_bbox(predictions['labels'][index].tolist(), img_width, img_height)
+            bbox['class_id'] = int(bbox['class_id'])
+            bbox['id'] = i
+            bbox['class_name'] = CLASSES.get(bbox['class_id'], 'unknown')
+            bbox['confidence'] = round(float(predictions['conf'][index]), 4)
+            annotations.append(bbox)
+
+        return jsonify({
+            'filename': filename,
+            'width': img_width,
+            'height': img_height,
+            'confidence': predictions['confidence'],
+            'raw_confidence': predictions['raw_confidence'],
+            'annotations': annotations
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/predict/<filename>', methods=['POST'])
+def predict_image(filename):
+    """
+    Run the model on one image now
+
+    Optional JSON body: {"confidence": 0.25, "roi": {"x1", "y1", "x2", "y2"}} (ROI in image pixels).
+    Concurrent requests share one warm model and are micro-batched. Returns boxes in
+    the get_annotations schema plus their confidences, highest first; nothing is saved.
+    """
+    try:
+        # Check if directory is set
+        if not IMAGES_DIR:
+            return jsonify({'error': 'No directory selected'}), 400
+
+        data = request.get_json(silent=True) or {}
+        try:
+            confidence = float(data.get('confidence', 0.25))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'confidence must be a number'}), 400
+
+        # PDF pages (filename_pageN.png) come from the page cache
+        image_path = IMAGES_DIR / filename
+        if '_page' in filename and filename.endswith('.png') and not image_path.exists():
+            pdf_stem, _, page = filename[:-len('.png')].rpartition('_page')
+            pdf_path = IMAGES_DIR / f"{pdf_stem}.pdf"
+            if not pdf_path.exists() or not page.isdigit():
+                return jsonify({'error': f'Source PDF not found: {pdf_stem}.pdf'}), 404
+            image_path = get_or_create_pdf_page_cache(pdf_path, int(page))
+        if image_path is None or not image_path.exists():
+            return jsonify({'error': 'Image not found'}), 404
+
+        image = cv2.imread(str(image_path))
+        if image is None:
+            return jsonify({'error': f'Could not read image {filename}'}), 500
+        img_height, img_width = image.shape[:2]
+
+        # Region of interest, clamped to the image
+        x_offset, y_offset, x_end, y_end = 0, 0, img_width, img_height
+        roi = data.get('roi')
+        if roi:
+            try:
+                x_offset, x_end = sorted(min(max(int(roi[k]), 0), img_width) for k in ('x1', 'x2'))
+                y_offset, y_end = sorted(min(max(int(roi[k]), 0), img_height) for k in ('y1', 'y2'))
+            except (KeyError, TypeError, ValueError):
+                return jsonify({'error': 'roi must have numeric x1, y1, x2, y2'}), 400
+            if x_end - x_offset < 2 or y_end - y_offset < 2:
+                return jsonify({'error': 'roi is empty'}), 400
+
+        try:
+            model, weights_digest = get_predictor()
+        except (FileNotFoundError, ConnectionError) as e:
+            return jsonify({'error': str(e)}), 503
+
+        # The SQLite index can't be shared across request threads, so each request opens the cache
+        cache = import_shared_module('prediction_cache').PredictionCache() if AUTO_LABEL_CACHE else None
+        start = time.perf_counter()
+        try:
+            xyxy, conf, cls = detect_objects(model, image[y_offset:y_end, x_offset:x_end], confidence,
+                                             cache, weights_digest)
+        finally:
+            if cache is not None:
+                cache.close()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        annotations = []
+        for i, index in enumerate(conf.argsort()[::-1]):
+            x1, y1, x2, y2 = (int(v) for v in xyxy[index] + [x_offset, y_offset, x_offset, y_offset])
+            class_id = int(cls[index])
+            annotations.append({
+                'class_id': class_id,
+                'x1': x1,
+                'y1': y1,
+                'x2': x2,
+                'y2': y2,
+                'width': x2 - x1,
+                'height': y2 - y1,
+                'id': i,
+                'class_name': CLASSES.get(class_id, 'unknown'),
+                'confidence': round(float(conf[index]), 4)
+            })
+
+        logger.info(f"Predicted {len(annotations)} boxes for {filename} in {elapsed_ms:.0f} ms")
+        return jsonify({
+            'filename': filename,
+            'width': img_width,
+            'height': img_height,
+            'confidence': confidence,
+            'raw_confidence': confidence,
+            'inference_ms': round(elapsed_ms, 1),
+            'annotations': annotations
+        })
+    except ImportError as e:
+        return jsonify({'error': f'Inference runtime not installed ({e})'}), 503
+    except Exception as e:
+        logger.error(f"Error predicting {filename}: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/annotations/<filename>', methods=['POST'])
 def save_annotations(filename):
     """Save annotations for specific image"""
@@ -11,9 +11,10 @@ import {
   Annotation,
   Tool,
   BoundingBox,
-  AnnotationStats
+  AnnotationStats,
+  Predictions
 } from './types';
-import { AlertCircle, Loader2 } from 'lucide-react';
+import { AlertCircle, Loader2, Wand2 } from 'lucide-react';
 
 function App() {
   // State
@@ -31,6 +32,11 @@ function App() {
   const [isSaving, setIsSaving] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [showLabelManager, setShowLabelManager] = useState(false);
+  const [predictions, setPredictions] = useState<Predictions | null>(null);
+  const [confidenceThreshold, setConfidenceThreshold] = useState(0.25);
+  // Predictions deleted by hand on this image; the confidence slider never brings them back
+  const rejectedPredictionsRef = useRef<Set<number>>(new Set());
+  const [isPredicting, setIsPredicting] = useState(false);
 
   // Handle directory selection
   const handleDirectorySet = async (path: string, dirStats: DirectoryStats) => {
@@ -67,12 +73,21 @@ function App() {
   // Load annotations for current image
   const loadAnnotations = async (filename: string) => {
     try {
-      const data = await ApiService.fetchAnnotations(filename);
+      const [data, predictionData] = await Promise.all([
+        ApiService.fetchAnnotations(filename),
+        ApiService.fetchPredictions(filename).catch(() => null)
+      ]);
       setAnnotations(data.annotations);
       setSelectedAnnotation(null);
+      setPredictions(predictionData);
+      rejectedPredictionsRef.current = new Set();
+      if (predictionData) {
+        setConfidenceThreshold(predictionData.confidence);
+      }
     } catch (err) {
       console.error('Failed to load annotations:', err);
       setAnnotations([]);
+      setPredictions(null);
     }
   };
 
@@ -261,6 +276,62 @@ function App() {
     });
   }, [images, currentImageIndex]);
 
+  // Re-filter the cached model predictions - no inference, the sidecar holds every raw detection.
+  // Only unedited predictions come and go: drawn, moved, resized or reclassified boxes stay as
+  // they are. Nothing is saved until the user saves.
+  const changeConfidenceThreshold = useCallback((threshold: number) => {
+    if (!predictions || images.length === 0) return;
+
+    setAnnotations(prev => {
+      const matched = new Set<number>();
+      const edited = prev.filter(ann => {
+        const prediction = predictions.annotations.find(pred =>
+          !matched.has(pred.id) &&
+          pred.class_id === ann.class_id &&
+          Math.abs(pred.x1 - ann.x1) <= 1 && Math.abs(pred.y1 - ann.y1) <= 1 &&
+          Math.abs(pred.x2 - ann.x2) <= 1 && Math.abs(pred.y2 - ann.y2) <= 1
+        );
+        if (prediction) matched.add(prediction.id);
+        return !prediction;
+      });
+
+      // Predictions shown at the old threshold but gone from the boxes were deleted by hand
+      predictions.annotations.forEach(pred => {
+        if ((pred.confidence ?? 0) >= confidenceThreshold && !matched.has(pred.id)) {
+          rejectedPredictionsRef.current.add(pred.id);
+        }
+      });
+
+      let nextId = Math.max(0, ...edited.map(ann => ann.id)) + 1;
+      const shown = predictions.annotations
+        .filter(pred => (pred.confidence ?? 0) >= threshold && !rejectedPredictionsRef.current.has(pred.id))
+        .map(pred => ({ ...pred, id: nextId++ }));
+      return [...edited, ...shown];
+    });
+    setConfidenceThreshold(threshold);
+    setSelectedAnnotation(null);
+  }, [predictions, images, confidenceThreshold]);
+
+  // Run the model on the current image now; boxes replace the annotations until saved
+  const runModel = useCallback(async () => {
+    if (images.length === 0) return;
+
+    try {
+      setIsPredicting(true);
+      const result = await ApiService.predictImage(images[currentImageIndex].filename, {
+        confidence: predictions?.raw_confidence ?? 0.05
+      });
+      setPredictions(result);
+      rejectedPredictionsRef.current = new Set();
+      setAnnotations(result.annotations.filter(ann => (ann.confidence ?? 0) >= confidenceThreshold));
+      setSelectedAnnotation(null);
+    } catch (err) {
+      console.error('Failed to run model:', err);
+    } finally {
+      setIsPredicting(false);
+    }
+  }, [images, currentImageIndex, predictions, confidenceThreshold]);
+
   const clearAllAnnotations = useCallback(() => {
     setAnnotations([]);
     setSelectedAnnotation(null);
@@ -435,6 +506,32 @@ function App() {
               <div className="w-2 h-2 bg-green-500 rounded-full"></div>
               <span>{annotations.length} annotations</span>
             </div>
+            <button
+              onClick={runModel}
+              disabled={isPredicting}
+              className="flex items-center gap-1 px-2 py-1 rounded border border-gray-300 hover:bg-gray-100 disabled:opacity-50"
+              title="Run the model on this image (replaces the current boxes until you save)"
+            >
+              {isPredicting ? <Loader2 className="w-4 h-4 animate-spin" /> : <Wand2 className="w-4 h-4" />}
+              <span>Run model</span>
+            </button>
+            {predictions && (
+              <div className="flex items-center gap-2" title="Re-filters the unedited model predictions; your own boxes and edits stay. Save to keep the result.">
+                <span>Model confidence ≥ {confidenceThreshold.toFixed(2)}</span>
+                <input
+                  type="range"
+                  min={predictions.raw_confidence}
+                  max={1}
+                  step={0.01}
+                  value={confidenceThreshold}
+                  onChange={(e) => changeConfidenceThreshold(parseFloat(e.target.value))}
+                  className="w-32"
+                />
+                <span className="text-gray-400">
+                  {predictions.annotations.length} cached
+                </span>
+              </div>
+            )}
           </div>
 
           {isSaving && (
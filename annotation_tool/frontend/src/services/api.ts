@@ -1,4 +1,4 @@
-import { ImageInfo, Annotation, ClassInfo, AnnotationStats } from '../types';
+import { ImageInfo, Annotation, ClassInfo, AnnotationStats, Predictions } from '../types';
 import { DirectoryStats } from '../components/DirectorySelector';
 
 // Use environment variable for API URL in production, localhost for development
@@ -43,6 +43,36 @@ export class ApiService {
     return response.json();
   }
 
+  // Cached raw model predictions with confidences, or null if the image has none
+  static async fetchPredictions(filename: string): Promise<Predictions | null> {
+    const response = await fetch(`${API_BASE_URL}/predictions/${filename}`);
+    if (response.status === 404) {
+      return null;
+    }
+    if (!response.ok) {
+      throw new Error(`Failed to fetch predictions: ${response.statusText}`);
+    }
+    return response.json();
+  }
+
+  // Run the model on this image now (optionally only inside an ROI in image pixels)
+  static async predictImage(
+    filename: string,
+    options: { confidence?: number; roi?: { x1: number; y1: number; x2: number; y2: number } } = {}
+  ): Promise<Predictions> {
+    const response = await fetch(`${API_BASE_URL}/predict/${filename}`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(options),
+    });
+
+    if (!response.ok) {
+      const error = await response.json().catch(() => ({}));
+      throw new Error(error.error || `Failed to run model: ${response.statusText}`);
+    }
+    return response.json();
+  }
+
   static async saveAnnotations(filename: string, annotations: Annotation[]): Promise<void> {
     const response = await fetch(`${API_BASE_URL}/annotations/${filename}`, {
       method: 'POST',
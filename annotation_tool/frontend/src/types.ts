@@ -8,6 +8,16 @@ export interface Annotation {
   y2: number;
   width: number;
   height: number;
+  confidence?: number;
+}
+
+export interface Predictions {
+  filename: string;
+  width: number;
+  height: number;
+  confidence: number;
+  raw_confidence: number;
+  annotations: Annotation[];
 }
 
 export interface ImageInfo {
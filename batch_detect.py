@@ -2,93 +2,621 @@
 """
 Batch YOLO Detection
 Runs your trained model on all images and saves initial labels
+PDFs are rendered page by page in memory and streamed straight into the model
 """
 
 import os
 import cv2
+import numpy as np
+import json
+import time
+import hashlib
+import queue
+import threading
+import multiprocessing
+from collections import defaultdict
 from pathlib import Path
-from ultralytics import YOLO
 from tqdm import tqdm
+from image_io import (COLOR_MODES, check_color_mode, read_image, to_bilevel, to_model_input,
+                      pdf_page_count, iter_pdf_pages)
+from utilities.materialize import link_file
+from utilities.image_codecs import ImageCodec, CodecStats, format_codec_table
+from detection_progress import PROGRESS_FILENAME, DetectionProgress, file_sha256
+from yolo_labels import (RAW_CONFIDENCE, boxes_to_arrays, xyxy_to_yolo, write_yolo_labels,
+                         predictions_path, save_predictions)
+from inference_backends import BACKENDS, DEFAULT_IMGSZ, check_backend, load_model, resolve_model_path
+from prediction_cache import (DEFAULT_CACHE_DIR, DEFAULT_MAX_MB, PredictionCache,
+                              cached_predict, cached_predict_tiled)
+from inference_profile import tuned_settings
+from tiled_inference import (MERGE_METHODS, crop_to_content,
+                             format_tile_report, format_skip_report)
 
-def batch_detect(data_dir="data", output_dir="labeld_data", model_path="best.pt", confidence=0.25):
-    """Run model detection on all images"""
+# How input images are placed in output_dir next to their labels:
+#   auto     - copy original bytes in rgb mode, encode in gray/bilevel mode
+#   encode   - write the decoded image with the --codec encoder (PNG by default, the old behaviour)
+#   copy / hardlink / reflink - reuse the original file bytes, no re-encode
+#   manifest - write nothing, record the source path in image_manifest.jsonl
+IMAGE_OUTPUT_MODES = ("auto", "encode", "copy", "hardlink", "reflink", "manifest")
 
-    data_dir = Path(data_dir)
-    output_dir = Path(output_dir)
-    output_dir.mkdir(exist_ok=True)
+MANIFEST_FILENAME = "image_manifest.jsonl"
+STATS_FILENAME = "batch_stats.json"
+
+STAGES = ("decode", "render", "inference", "convert", "image_output", "labels")
+
+# Marks the end of the input stream on the render queue
+_END_OF_STREAM = object()
+
+def pdf_page_stem(pdf_path, page_num):
+    """Label/image stem for a PDF page, matching old_tools/pdf_to_images.py naming"""
+    return f"{Path(pdf_path).stem}_page_{page_num:03d}"
+
+def parse_shard(shard):
+    """Parse 'i/n' (0 <= i < n) into (i, n)"""
+    try:
+        index, count = (int(part) for part in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{shard}' (expected i/n, e.g. 0/4)")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{shard}' (need 0 <= i < n)")
+    return index, count
+
+def in_shard(path, shard_index, shard_count):
+    """Stable file-to-shard assignment by filename hash, independent of listing order"""
+    digest = hashlib.sha1(Path(path).name.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % shard_count == shard_index
+
+def shard_tag(shard):
+    """Filename tag for a shard, e.g. 'shard0of4'"""
+    return f"shard{shard[0]}of{shard[1]}"
+
+def configure_threads(threads, backend="torch"):
+    """Limit torch and OpenCV threads so several workers don't oversubscribe the CPU"""
+    if not threads:
+        return
+
+    # ONNX Runtime / OpenVINO get their thread count when the model is loaded
+    cv2.setNumThreads(1)
+    if backend != "torch":
+        return
+
+    import torch
+
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # Already set once parallel work has started
+
+def load_inputs(source_path, color_mode="rgb", dpi=300, stage_times=None):
+    """
+    Yield (stem, source_path, page_num, image) for one input file
+
+    page_num is None for image files; PDFs yield one item per rendered page.
+    Unreadable images yield nothing.
+    """
+    if stage_times is None:
+        stage_times = defaultdict(float)
+    source_path = Path(source_path)
+
+    if source_path.suffix.lower() != ".pdf":
+        start = time.perf_counter()
+        image = read_image(source_path, color_mode)
+        stage_times["decode"] += time.perf_counter() - start
+        if image is None:
+            print(f"Warning: Could not load {source_path}")
+            return
+        yield source_path.stem, source_path, None, image
+        return
+
+    pages = iter_pdf_pages(source_path, dpi, color_mode)
+    while True:
+        start = time.perf_counter()
+        page = next(pages, None)
+        stage_times["render"] += time.perf_counter() - start
+        if page is None:
+            break
+        page_num, image = page
+        yield pdf_page_stem(source_path, page_num), source_path, page_num, image
+
+def produce_inputs(input_files, work_queue, color_mode="rgb", dpi=300, stage_times=None):
+    """
+    Load images and render PDF pages into a bounded queue
+
+    Runs on a background thread so decoding/rendering overlaps with inference;
+    the queue bound keeps at most a few pages in memory at once.
+    """
+    try:
+        for source_path in input_files:
+            try:
+                for item in load_inputs(source_path, color_mode, dpi, stage_times):
+                    work_queue.put(item)
+            except Exception as e:
+                print(f"Error reading {source_path}: {e}")
+    finally:
+        work_queue.put(_END_OF_STREAM)
+
+def place_output_image(stem, source_path, page_num, image, output_dir, image_output, color_mode, manifest,
+                       codec="png", codec_stats=None):
+    """Put the input image next to its label according to image_output (re-encoded ones with codec)"""
+    if image_output == "manifest":
+        entry = {"stem": stem, "source": str(Path(source_path).resolve())}
+        if page_num is not None:
+            entry["page"] = page_num
+        manifest.write(json.dumps(entry) + "\n")
+        return
 
-    # Load model
-    print(f"Loading YOLO model from {model_path}...")
-    model = YOLO(model_path)
+    output_image_path = output_dir / f"{stem}.png"
 
-    # Get all images
-    image_files = sorted(list(data_dir.glob("*.png")))
-    print(f"Found {len(image_files)} images to process")
+    # Rendered PDF pages and converted color modes have no original bytes to reuse
+    reuse_bytes = image_output in ("copy", "hardlink", "reflink") or (image_output == "auto" and color_mode == "rgb")
+    if page_num is None and source_path.suffix.lower() == ".png" and reuse_bytes:
+        strategy = "copy" if image_output == "auto" else image_output
+        link_file(source_path, output_image_path, strategy)
+    else:
+        bilevel = color_mode == "bilevel"
+        ImageCodec(codec).write(output_image_path, to_bilevel(image) if bilevel else image, codec_stats, bilevel)
 
-    # Process each image
-    total_detections = 0
-    processed_images = 0
+def detect_image(model, item, output_dir, options, stage_times, manifest=None, region_stats=None, cache=None,
+                 codec_stats=None):
+    """Run the model on one loaded input, write its labels and return them"""
+    stem, source_path, page_num, image = item
+    img_height, img_width = image.shape[:2]
+
+    # Run detection (whole page, or overlapping tiles at full resolution) down to the
+    # raw confidence floor; the threshold is applied after the sidecar is written
+    start = time.perf_counter()
+    raw_confidence = min(options["raw_confidence"], options["confidence"])
+    x_offset, y_offset = 0, 0
+    if options["tile_size"]:
+        detections = cached_predict_tiled(model, image, raw_confidence, options["tile_size"],
+                                          options["tile_overlap"], options["tile_batch"], options["tile_merge"],
+                                          region_stats, options["skip_blank"], cache, options["model_hash"])
+    elif options["skip_blank"]:
+        # Only the inked region goes to the model; blank pages skip inference entirely
+        crop, origin = crop_to_content(image, region_stats)
+        detections = boxes_to_arrays(None)
+        if crop is not None:
+            x_offset, y_offset = origin
+            detections = cached_predict(model, to_model_input(crop), raw_confidence, cache, options["model_hash"],
+                                        imgsz=options["imgsz"])
+    else:
+        detections = cached_predict(model, to_model_input(image), raw_confidence, cache, options["model_hash"],
+                                    imgsz=options["imgsz"])
+    stage_times["inference"] += time.perf_counter() - start
+
+    # Place image next to its labels (PDF pages only when asked)
+    start = time.perf_counter()
+    if page_num is None or options["save_pages"] or options["image_output"] == "manifest":
+        place_output_image(stem, source_path, page_num, image, output_dir, options["image_output"],
+                           options["color_mode"], manifest, options["codec"], codec_stats)
+    stage_times["image_output"] += time.perf_counter() - start
+
+    # Convert detections to YOLO format (one host transfer per image)
+    start = time.perf_counter()
+    xyxy, conf, cls = detections
+    raw_labels = xyxy_to_yolo(xyxy, cls, img_width, img_height, (x_offset, y_offset))
+    labels = raw_labels[conf >= options["confidence"]]
+    stage_times["convert"] += time.perf_counter() - start
+
+    # Save labels to txt file, and every raw detection with its confidence to the sidecar
+    start = time.perf_counter()
+    label_file = output_dir / f"{stem}.txt"
+    write_yolo_labels(label_file, labels)
+    save_predictions(predictions_path(label_file), raw_labels, conf, img_width, img_height,
+                     options["confidence"], raw_confidence)
+    stage_times["labels"] += time.perf_counter() - start
+
+    return labels
+
+def process_item(model, item, output_dir, options, stage_times, stats, manifest=None, progress=None, cache=None):
+    """Detect one input, update run statistics and record the outcome in the progress manifest"""
+    stem, source_path, page_num, _ = item
+    input_hash = options["input_hashes"].get(str(source_path))
+    region_stats = stats.setdefault('regions', {})
+    codec_stats = CodecStats(stats.get('encoded'))
+    try:
+        labels = detect_image(model, item, output_dir, options, stage_times, manifest, region_stats, cache,
+                              codec_stats)
+    except Exception as e:
+        print(f"Error processing {stem} ({source_path}): {e}")
+        stats['failed'] += 1
+        if progress is not None:
+            progress.record(stem, source_path, page_num, input_hash, "failed", str(e))
+        return
+
+    if codec_stats.totals:
+        stats['encoded'] = codec_stats.totals
+    record_labels(stats, labels)
+    if progress is not None:
+        progress.record(stem, source_path, page_num, input_hash, "done")
+    if len(labels) > 0:
+        print(f"✓ {stem}: {len(labels)} detections")
+
+def open_progress(output_dir, options):
+    """Open the shared progress manifest for this run's model and settings"""
+    return DetectionProgress(Path(output_dir) / PROGRESS_FILENAME, options["model_hash"],
+                             options["confidence"], options["params"])
+
+def open_cache(options):
+    """Open the on-disk prediction cache, or None when caching is off"""
+    if not options["cache_dir"]:
+        return None
+    return PredictionCache(options["cache_dir"], options["cache_mb"])
+
+def close_cache(cache, stats):
+    """Record cache hits/misses in run statistics and close the cache"""
+    if cache is None:
+        return
+    stats['cache'] = {'hits': cache.hits, 'misses': cache.misses}
+    cache.close()
+
+def new_stats():
+    """Empty run statistics"""
+    return {
+        'images': 0,
+        'failed': 0,
+        'detections': 0,
+        'class_counts': {},
+        'stage_times': {},
+        'elapsed_seconds': 0.0,
+    }
+
+def record_labels(stats, labels):
+    """Add one processed image's labels to run statistics"""
+    stats['images'] += 1
+    stats['detections'] += len(labels)
+    class_ids, counts = np.unique(labels[:, 0].astype(int), return_counts=True)
+    for class_id, count in zip(class_ids, counts):
+        class_key = str(class_id)
+        stats['class_counts'][class_key] = stats['class_counts'].get(class_key, 0) + int(count)
+
+def merge_stats(all_stats):
+    """Sum statistics from several workers or shards"""
+    merged = new_stats()
+    for stats in all_stats:
+        merged['images'] += stats['images']
+        merged['failed'] += stats['failed']
+        merged['detections'] += stats['detections']
+        for class_key, count in stats['class_counts'].items():
+            merged['class_counts'][class_key] = merged['class_counts'].get(class_key, 0) + count
+        for stage, seconds in stats['stage_times'].items():
+            merged['stage_times'][stage] = merged['stage_times'].get(stage, 0.0) + seconds
+        for section in ('regions', 'cache'):
+            if section in stats:
+                totals = merged.setdefault(section, {})
+                for key, value in stats[section].items():
+                    totals[key] = totals.get(key, 0) + value
+        if 'encoded' in stats:
+            encoded = CodecStats(merged.get('encoded'))
+            encoded.merge(stats['encoded'])
+            merged['encoded'] = encoded.totals
+        # Workers and shards run concurrently, so wall time is the slowest one
+        merged['elapsed_seconds'] = max(merged['elapsed_seconds'], stats['elapsed_seconds'])
+    return merged
+
+def _concat_files(parts, destination):
+    """Concatenate part files into destination and remove the parts"""
+    with open(destination, 'w') as out:
+        for part in parts:
+            with open(part) as f:
+                out.write(f.read())
+            part.unlink()
+
+def _detect_worker(worker_id, task_queue, result_queue, model_path, output_dir, options, threads, manifest_path):
+    """Worker process: own model instance, pulls input files from the shared queue"""
+    stats = new_stats()
+    stage_times = defaultdict(float)
+    start_time = time.perf_counter()
+
+    if not options["server"]:
+        configure_threads(threads, options["backend"])
+    model = load_model(model_path, options["backend"], threads, options["server"])
+    manifest = open(manifest_path, 'w') if manifest_path else None
+    progress = open_progress(output_dir, options)
+    cache = open_cache(options)
+
+    while True:
+        source_path = task_queue.get()
+        if source_path is None:
+            break
 
-    for image_path in tqdm(image_files, desc="Processing images"):
         try:
-            # Load image
-            image = cv2.imread(str(image_path))
-            if image is None:
-                print(f"Warning: Could not load {image_path}")
+            for item in load_inputs(source_path, options["color_mode"], options["dpi"], stage_times):
+                if item[0] in options["skip_stems"]:
+                    continue
+                process_item(model, item, output_dir, options, stage_times, stats, manifest, progress, cache)
+                result_queue.put(("progress", 1))
+        except Exception as e:
+            print(f"Error reading {source_path}: {e}")
+            stats['failed'] += 1
+
+    if manifest is not None:
+        manifest.close()
+    progress.close()
+    close_cache(cache, stats)
+
+    stats['stage_times'] = dict(stage_times)
+    stats['elapsed_seconds'] = time.perf_counter() - start_time
+    result_queue.put(("done", stats))
+
+def run_workers(input_files, total_inputs, model_path, output_dir, options, workers, threads, manifest_path):
+    """Fan input files out to worker processes through a shared queue"""
+    # spawn avoids forking a process that already holds torch/OpenMP thread pools
+    ctx = multiprocessing.get_context("spawn")
+    task_queue = ctx.Queue()
+    result_queue = ctx.Queue()
+
+    for source_path in input_files:
+        task_queue.put(str(source_path))
+    for _ in range(workers):
+        task_queue.put(None)
+
+    manifest_parts = []
+    processes = []
+    for worker_id in range(workers):
+        part = None
+        if manifest_path:
+            part = manifest_path.with_name(f"{manifest_path.stem}.w{worker_id}{manifest_path.suffix}")
+            manifest_parts.append(part)
+        process = ctx.Process(target=_detect_worker,
+                              args=(worker_id, task_queue, result_queue, model_path, output_dir,
+                                    options, threads, part))
+        process.start()
+        processes.append(process)
+
+    worker_stats = []
+    with tqdm(total=total_inputs, desc=f"Processing images ({workers} workers)") as progress:
+        while len(worker_stats) < workers:
+            try:
+                kind, payload = result_queue.get(timeout=1)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    print(f"Warning: {workers - len(worker_stats)} worker(s) exited without reporting")
+                    break
                 continue
 
-            img_height, img_width = image.shape[:2]
+            if kind == "progress":
+                progress.update(payload)
+            else:
+                worker_stats.append(payload)
+
+    for process in processes:
+        process.join()
+
+    if manifest_path:
+        _concat_files([part for part in manifest_parts if part.exists()], manifest_path)
+
+    return merge_stats(worker_stats)
+
+def print_stage_times(stage_times, processed_images):
+    """Print time spent per pipeline stage"""
+    if not stage_times:
+        return
+
+    print(f"\n=== TIME BREAKDOWN ===")
+    print(f"{'Stage':<14}{'Total (s)':>12}{'Per image (ms)':>18}")
+    for stage in STAGES:
+        if stage in stage_times:
+            seconds = stage_times[stage]
+            per_image = seconds / max(processed_images, 1) * 1000
+            print(f"{stage:<14}{seconds:>12.2f}{per_image:>18.1f}")
+    print("(decode/render overlap with the other stages; with several workers, totals are summed across workers)")
+
+def write_stats(output_dir, stats, shard=None):
+    """Write run statistics to batch_stats.json (or a per-shard file)"""
+    stats = dict(stats)
+    stats['images_per_second'] = stats['images'] / stats['elapsed_seconds'] if stats['elapsed_seconds'] else 0.0
+    filename = STATS_FILENAME if shard is None else f"batch_stats.{shard_tag(shard)}.json"
+    stats_file = Path(output_dir) / filename
+    with open(stats_file, 'w') as f:
+        json.dump(stats, f, indent=2)
+    return stats_file
 
-            # Run detection
-            results = model(image, conf=confidence, verbose=False)
+def merge_shards(output_dir):
+    """Combine per-shard statistics and manifests written by --shard runs"""
+    output_dir = Path(output_dir)
+    shard_files = sorted(output_dir.glob("batch_stats.shard*.json"))
+    if not shard_files:
+        print(f"No shard statistics found in {output_dir}")
+        return None
 
-            # Copy image to output directory
-            output_image_path = output_dir / image_path.name
-            cv2.imwrite(str(output_image_path), image)
+    all_stats = []
+    for shard_file in shard_files:
+        with open(shard_file) as f:
+            all_stats.append(json.load(f))
+    merged = merge_stats(all_stats)
+    merged['shards'] = [shard_file.name for shard_file in shard_files]
 
-            # Process detections and save labels
-            labels = []
-            if results and len(results) > 0:
-                detections = results[0]
-                if detections.boxes is not None:
-                    boxes = detections.boxes
+    manifest_parts = sorted(output_dir.glob("image_manifest.shard*.jsonl"))
+    if manifest_parts:
+        _concat_files(manifest_parts, output_dir / MANIFEST_FILENAME)
 
-                    for i in range(len(boxes)):
-                        # Get box coordinates (xyxy format)
-                        x1, y1, x2, y2 = boxes.xyxy[i].cpu().numpy()
-                        confidence_score = boxes.conf[i].cpu().numpy()
-                        class_id = int(boxes.cls[i].cpu().numpy())
+    stats_file = write_stats(output_dir, merged)
+    print(f"Merged {len(shard_files)} shards: {merged['images']} images, {merged['detections']} detections")
+    print(f"Aggregate statistics written to: {stats_file}")
+    return merged
 
-                        # Convert to YOLO format (normalized center coordinates)
-                        x_center = ((x1 + x2) / 2) / img_width
-                        y_center = ((y1 + y2) / 2) / img_height
-                        width = (x2 - x1) / img_width
-                        height = (y2 - y1) / img_height
+def batch_detect(data_dir="data", output_dir="labeld_data", model_path="best.pt", confidence=0.25,
+                 color_mode="rgb", dpi=300, save_pages=False, queue_size=4, image_output="auto",
+                 workers=1, threads=None, shard=None, resume=True,
+                 tile_size=0, tile_overlap=0.2, tile_batch=8, tile_merge="nms", skip_blank=True,
+                 raw_confidence=RAW_CONFIDENCE, cache_dir=DEFAULT_CACHE_DIR, cache_mb=DEFAULT_MAX_MB,
+                 backend="torch", imgsz=DEFAULT_IMGSZ, server=None, codec="png"):
+    """
+    Run model detection on all images and PDF pages
 
-                        labels.append([class_id, x_center, y_center, width, height])
+    workers > 1 starts that many processes, each with its own model and
+    `threads` inference threads (default: CPU count / workers). shard=(i, n)
+    processes only the files hashed to shard i of n. With resume, inputs whose
+    labels in output_dir are current for this model, confidence and settings
+    are skipped; failed and stale ones are redone. tile_size > 0 switches to
+    tiled inference over overlapping tile_size x tile_size windows. skip_blank
+    sends only inked tiles (or the inked region of the page) to the model.
+    Every detection down to raw_confidence is kept, with its score, in a
+    .pred.npz sidecar next to each label file. Detections are looked up in the
+    prediction cache at cache_dir first (None disables it). backend picks
+    PyTorch, or an exported ONNX model run with ONNX Runtime or OpenVINO.
+    imgsz is the whole-page inference size (tiles are inferred at tile_size).
+    With server, every worker sends its images to that running inference_server.py
+    instead of loading the model itself. Images that are re-encoded rather than
+    copied are written with codec (see utilities/image_codecs.py).
+    """
 
-            # Save labels to txt file
-            label_file = output_dir / f"{image_path.stem}.txt"
-            with open(label_file, 'w') as f:
-                for label in labels:
-                    class_id, x_center, y_center, width, height = label
-                    f.write(f"{class_id} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n")
+    check_color_mode(color_mode)
+    check_backend(backend)
+    if image_output not in IMAGE_OUTPUT_MODES:
+        raise ValueError(f"Unknown image output mode '{image_output}'")
+    codec = ImageCodec(codec).spec
 
-            total_detections += len(labels)
-            processed_images += 1
+    data_dir = Path(data_dir)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(exist_ok=True)
 
-            if len(labels) > 0:
-                print(f"✓ {image_path.name}: {len(labels)} detections")
+    # Get all images and PDFs
+    input_files = sorted(list(data_dir.glob("*.png"))) + sorted(list(data_dir.glob("*.pdf")))
+    if shard is not None:
+        input_files = [path for path in input_files if in_shard(path, *shard)]
+        print(f"Shard {shard[0]}/{shard[1]}: {len(input_files)} files")
 
+    image_count = sum(1 for path in input_files if path.suffix.lower() != ".pdf")
+    page_stems = {}
+    for pdf_path in input_files[image_count:]:
+        try:
+            page_stems[pdf_path] = [pdf_page_stem(pdf_path, page_num)
+                                    for page_num in range(1, pdf_page_count(pdf_path) + 1)]
         except Exception as e:
-            print(f"Error processing {image_path}: {e}")
-            continue
+            print(f"Warning: Could not read {pdf_path}: {e}")
+    total_pages = sum(len(stems) for stems in page_stems.values())
+
+    print(f"Found {image_count} images and {len(input_files) - image_count} PDFs ({total_pages} pages)")
+
+    options = {
+        "confidence": confidence,
+        "raw_confidence": raw_confidence,
+        "cache_dir": str(cache_dir) if cache_dir else None,
+        "cache_mb": cache_mb,
+        "color_mode": color_mode,
+        "dpi": dpi,
+        "save_pages": save_pages,
+        "image_output": image_output,
+        "tile_size": tile_size,
+        "tile_overlap": tile_overlap,
+        "tile_batch": tile_batch,
+        "tile_merge": tile_merge,
+        "skip_blank": skip_blank,
+        "backend": backend,
+        "imgsz": imgsz,
+        "server": server,
+        "codec": codec,
+        # Labels and cached detections are keyed on the weights that actually run
+        "model_hash": (load_model(model_path, server=server).model_hash if server
+                       else file_sha256(resolve_model_path(model_path, backend))),
+        # Settings besides model/confidence that change the written outputs
+        "params": {"color_mode": color_mode, "dpi": dpi, "imgsz": imgsz, "tile_size": tile_size,
+                   "tile_overlap": tile_overlap, "tile_merge": tile_merge, "skip_blank": skip_blank,
+                   "raw_confidence": raw_confidence},
+    }
+    # Outputs written before codecs were configurable stay current
+    if codec != "png":
+        options["params"]["codec"] = codec
+
+    # Work out what is already done from the progress manifest
+    progress = open_progress(output_dir, options)
+    pending_files, skip_stems, input_hashes, reasons = progress.plan(input_files, page_stems)
+    progress.close()
+
+    if resume:
+        input_files = pending_files
+        print("Progress: " + ", ".join(f"{count} {reason}" for reason, count in sorted(reasons.items())))
+    else:
+        skip_stems = set()
+    options["skip_stems"] = skip_stems
+    options["input_hashes"] = input_hashes
+
+    total_inputs = sum(len(page_stems.get(path, [path.stem])) for path in input_files) - len(skip_stems)
+    print(f"{total_inputs} images/pages to process")
+
+    manifest_path = None
+    if image_output == "manifest":
+        manifest_name = MANIFEST_FILENAME if shard is None else f"image_manifest.{shard_tag(shard)}.jsonl"
+        manifest_path = output_dir / manifest_name
+
+    workers = max(1, workers)
+    if threads is None and workers > 1:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+
+    if workers > 1:
+        print(f"Starting {workers} workers with {threads} {backend} threads each...")
+        stats = run_workers(input_files, total_inputs, model_path, output_dir, options,
+                            workers, threads, manifest_path)
+    else:
+        stats = new_stats()
+        start_time = time.perf_counter()
+
+        # Load model
+        if server:
+            print(f"Using the model served at {server}...")
+        else:
+            configure_threads(threads, backend)
+            print(f"Loading YOLO model from {resolve_model_path(model_path, backend)} ({backend})...")
+        model = load_model(model_path, backend, threads, server)
+        progress = open_progress(output_dir, options)
+        cache = open_cache(options)
+
+        # Renderer thread feeds the detector through a bounded queue
+        stage_times = defaultdict(float)
+        work_queue = queue.Queue(maxsize=max(1, queue_size))
+        producer = threading.Thread(target=produce_inputs,
+                                    args=(input_files, work_queue, color_mode, dpi, stage_times),
+                                    daemon=True)
+        producer.start()
+
+        manifest = open(manifest_path, 'w') if manifest_path else None
+
+        with tqdm(total=total_inputs, desc="Processing images") as progress_bar:
+            while True:
+                item = work_queue.get()
+                if item is _END_OF_STREAM:
+                    break
+                if item[0] in skip_stems:
+                    continue
+                progress_bar.update(1)
+                process_item(model, item, output_dir, options, stage_times, stats, manifest, progress, cache)
+
+        producer.join()
+        if manifest is not None:
+            manifest.close()
+        progress.close()
+        close_cache(cache, stats)
+
+        stats['stage_times'] = dict(stage_times)
+        stats['elapsed_seconds'] = time.perf_counter() - start_time
+
+    stats_file = write_stats(output_dir, stats, shard)
+    processed_images = stats['images']
+    total_detections = stats['detections']
 
     print(f"\n=== BATCH PROCESSING COMPLETE ===")
-    print(f"Processed: {processed_images}/{len(image_files)} images")
+    print(f"Processed: {processed_images}/{total_inputs} images")
     print(f"Total detections: {total_detections}")
-    print(f"Average detections per image: {total_detections/processed_images:.1f}")
+    print(f"Average detections per image: {total_detections/max(processed_images, 1):.1f}")
     print(f"Output saved to: {output_dir}")
+    if manifest_path:
+        print(f"Image sources recorded in: {manifest_path}")
+    print(f"Statistics written to: {stats_file}")
+    print_stage_times(stats['stage_times'], processed_images)
+    if stats.get('encoded'):
+        print(f"\n=== IMAGE ENCODING ===")
+        print(format_codec_table(CodecStats(stats['encoded']).rows()))
+    if tile_size:
+        print(format_tile_report(stats.get('regions')))
+    if skip_blank:
+        print(format_skip_report(stats.get('regions')))
+    if 'cache' in stats:
+        print(f"Prediction cache: {stats['cache']['hits']} hits, {stats['cache']['misses']} misses")
+    if shard is not None:
+        print(f"\nOnce every shard has finished, combine statistics with:")
+        print(f"python3 batch_detect.py --output_dir {output_dir} --merge_shards")
     print(f"\nNow you can run the editing tool to review and modify labels:")
     print(f"python3 simple_edit_tool.py")
 
@@ -97,19 +625,116 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description="Batch YOLO detection on all images")
     parser.add_argument("--confidence", "-c", type=float, default=0.25, help="Detection confidence threshold")
-    parser.add_argument("--data_dir", default="data", help="Input image directory")
+    parser.add_argument("--raw_confidence", type=float, default=RAW_CONFIDENCE,
+                        help="Lowest confidence kept in the .pred.npz prediction sidecars")
+    parser.add_argument("--data_dir", default="data", help="Input directory (PNG images and/or PDFs)")
     parser.add_argument("--output_dir", default="labeld_data", help="Output directory")
     parser.add_argument("--model", default="best.pt", help="Model file path")
+    parser.add_argument("--color_mode", choices=COLOR_MODES, default="rgb",
+                        help="Load and store images as rgb, gray or bilevel (1-bit PNG)")
+    parser.add_argument("--dpi", type=int, default=300, help="PDF rendering resolution")
+    parser.add_argument("--save_pages", action="store_true",
+                        help="Also write rendered PDF pages to the output directory")
+    parser.add_argument("--queue_size", type=int, default=4,
+                        help="Max rendered pages buffered between renderer and detector")
+    parser.add_argument("--image_output", choices=IMAGE_OUTPUT_MODES, default="auto",
+                        help="How images are placed next to labels (copy/link original bytes, "
+                             "re-encode, or only record sources in a manifest)")
+    parser.add_argument("--codec", default="png",
+                        help="Encoder for re-encoded images: png[:level], webp, qoi or jpeg[:quality] "
+                             "(the editing tools only list .png)")
+    parser.add_argument("--workers", "-w", type=int, default=None,
+                        help="Number of worker processes, each with its own model (default: profiled, else 1)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Inference threads per worker (default: profiled, else CPU count / workers)")
+    parser.add_argument("--imgsz", type=int, default=None,
+                        help=f"Whole-page inference image size (default: profiled, else {DEFAULT_IMGSZ})")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch",
+                        help="Inference runtime: PyTorch, or the exported .onnx model with ONNX Runtime/OpenVINO")
+    parser.add_argument("--server", default=None,
+                        help="Send images to a running inference_server.py (http://host:port or unix:///path) "
+                             "instead of loading the model in every worker")
+    parser.add_argument("--shard", default=None,
+                        help="Process only shard i of n (e.g. 0/4) to split a corpus across machines")
+    parser.add_argument("--tile_size", type=int, default=0,
+                        help="Run tiled inference with this tile size in pixels (0 = whole page)")
+    parser.add_argument("--tile_overlap", type=float, default=0.2, help="Fractional overlap between tiles")
+    parser.add_argument("--tile_batch", type=int, default=None, help="Tiles per model call (default: profiled, else 8)")
+    parser.add_argument("--tile_merge", choices=MERGE_METHODS, default="nms",
+                        help="How duplicate boxes across tile seams are merged")
+    parser.add_argument("--no_skip_blank", action="store_true",
+                        help="Run the model on blank tiles/regions too")
+    parser.add_argument("--cache_dir", default=str(DEFAULT_CACHE_DIR),
+                        help="Prediction cache directory (reruns with the same image, model and settings skip inference)")
+    parser.add_argument("--cache_mb", type=int, default=DEFAULT_MAX_MB,
+                        help="Prediction cache size cap in MB; least recently used entries are evicted")
+    parser.add_argument("--no_cache", action="store_true", help="Disable the prediction cache")
+    parser.add_argument("--no_profile", action="store_true",
+                        help="Ignore the settings inference_profile.py stored for this machine in config.json")
+    parser.add_argument("--force", action="store_true",
+                        help="Reprocess every input even if the progress manifest says it is done")
+    parser.add_argument("--merge_shards", action="store_true",
+                        help="Combine per-shard statistics in --output_dir and exit")
 
     args = parser.parse_args()
 
+    if args.merge_shards:
+        merge_shards(args.output_dir)
+        exit(0)
+
+    try:
+        codec = ImageCodec(args.codec)
+    except ValueError as e:
+        print(f"Error: {e}")
+        exit(1)
+    if codec.name != "png":
+        print(f"Warning: simple_edit_tool.py and the annotation tool only list .png images; "
+              f"{codec.extension} outputs are for training only")
+
+    shard = None
+    if args.shard:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            print(f"Error: {e}")
+            exit(1)
+
     # Check requirements
     if not os.path.exists(args.data_dir):
         print(f"Error: Directory '{args.data_dir}' not found!")
         exit(1)
 
-    if not os.path.exists(args.model):
-        print(f"Error: Model file '{args.model}' not found!")
-        exit(1)
+    if not args.server:
+        if not os.path.exists(args.model):
+            print(f"Error: Model file '{args.model}' not found!")
+            exit(1)
+
+        try:
+            resolve_model_path(args.model, args.backend)
+        except FileNotFoundError as e:
+            print(f"Error: {e}")
+            exit(1)
+
+    # Settings left unset come from this machine's inference profile, then the usual defaults
+    tuned = {} if args.no_profile else tuned_settings("batch", args.backend)
+    if tuned.get("tile_size", 0) != args.tile_size:
+        tuned.pop("tile_batch", None)
+    if args.tile_size:
+        tuned.pop("imgsz", None)
+    profiled = []
+    for name, default in (("workers", 1), ("threads", None), ("imgsz", DEFAULT_IMGSZ), ("tile_batch", 8)):
+        if getattr(args, name) is None:
+            setattr(args, name, tuned.get(name, default))
+            if name in tuned:
+                profiled.append(f"{name}={tuned[name]}")
+    if profiled:
+        print(f"Using profiled settings for this machine: {', '.join(profiled)}")
 
-    batch_detect(args.data_dir, args.output_dir, args.model, args.confidence)
\ No newline at end of file
+    batch_detect(args.data_dir, args.output_dir, args.model, args.confidence, args.color_mode,
+                 args.dpi, args.save_pages, args.queue_size, args.image_output,
+                 args.workers, args.threads, shard, resume=not args.force,
+                 tile_size=args.tile_size, tile_overlap=args.tile_overlap,
+                 tile_batch=args.tile_batch, tile_merge=args.tile_merge,
+                 skip_blank=not args.no_skip_blank, raw_confidence=args.raw_confidence,
+                 cache_dir=None if args.no_cache else args.cache_dir, cache_mb=args.cache_mb,
+                 backend=args.backend, imgsz=args.imgsz, server=args.server, codec=codec.spec)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Detection Progress Manifest
+SQLite record of which inputs batch_detect has finished, so reruns only redo missing or stale work
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+from collections import Counter
+from pathlib import Path
+
+PROGRESS_FILENAME = "detect_progress.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS progress (
+    stem TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    page INTEGER,
+    input_size INTEGER,
+    input_mtime_ns INTEGER,
+    input_hash TEXT,
+    model_hash TEXT,
+    confidence REAL,
+    params TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS progress_source ON progress (source);
+"""
+
+def file_sha256(path, chunk_size=1 << 20):
+    """SHA-256 of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class DetectionProgress:
+    """
+    Per-image status for one output directory
+
+    A row is current when its status is 'done' and the input hash, model hash,
+    confidence and other output-affecting params all match this run. Several
+    worker processes can record into the same file concurrently.
+    """
+
+    def __init__(self, db_path, model_hash, confidence, params=None):
+        self.db_path = Path(db_path)
+        self.model_hash = model_hash
+        self.confidence = float(confidence)
+        self.params = json.dumps(params or {}, sort_keys=True)
+
+        self.conn = sqlite3.connect(str(self.db_path), timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    def input_hash(self, path):
+        """
+        Content hash of an input file
+
+        Reuses the stored hash when size and mtime are unchanged, so a rerun
+        over 20k finished images doesn't reread every file.
+        """
+        stat = Path(path).stat()
+        row = self.conn.execute(
+            "SELECT input_size, input_mtime_ns, input_hash FROM progress WHERE source = ? LIMIT 1",
+            (str(path),)).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns and row[2]:
+            return row[2]
+        return file_sha256(path)
+
+    def stale_reason(self, stem, input_hash):
+        """Why a stem needs (re)processing, or None if its output is current"""
+        row = self.conn.execute(
+            "SELECT status, input_hash, model_hash, confidence, params FROM progress WHERE stem = ?",
+            (stem,)).fetchone()
+        if row is None:
+            return "new"
+        status, stored_input, stored_model, stored_confidence, stored_params = row
+        if status != "done":
+            return "failed"
+        if stored_input != input_hash:
+            return "input changed"
+        if stored_model != self.model_hash:
+            return "model changed"
+        if stored_confidence is None or abs(stored_confidence - self.confidence) > 1e-9:
+            return "confidence changed"
+        if stored_params != self.params:
+            return "params changed"
+        return None
+
+    def plan(self, input_files, page_stems):
+        """
+        Split inputs into pending work
+
+        page_stems maps each PDF path to the stems of its pages. Returns
+        (pending_files, skip_stems, input_hashes, reasons): files with any
+        stale output, page stems inside those files that are already current,
+        the input hash per file, and a Counter of why work is pending.
+        """
+        pending_files = []
+        skip_stems = set()
+        input_hashes = {}
+        reasons = Counter()
+
+        for source_path in input_files:
+            input_hash = self.input_hash(source_path)
+            input_hashes[str(source_path)] = input_hash
+            stems = page_stems.get(source_path, [Path(source_path).stem])
+
+            stale = []
+            for stem in stems:
+                reason = self.stale_reason(stem, input_hash)
+                if reason is None:
+                    skip_stems.add(stem)
+                else:
+                    stale.append(stem)
+                    reasons[reason] += 1
+
+            if stale:
+                pending_files.append(source_path)
+            else:
+                reasons["up to date"] += len(stems)
+
+        # Only pages inside files that will be reopened need skipping
+        pending_stems = set()
+        for source_path in pending_files:
+            pending_stems.update(page_stems.get(source_path, [Path(source_path).stem]))
+        skip_stems &= pending_stems
+
+        return pending_files, skip_stems, input_hashes, reasons
+
+    def record(self, stem, source_path, page, input_hash, status, error=None):
+        """Store the outcome for one image or PDF page"""
+        stat = Path(source_path).stat()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO progress (stem, source, page, input_size, input_mtime_ns, input_hash, "
+            "model_hash, confidence, params, status, error, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (stem, str(source_path), page, stat.st_size, stat.st_mtime_ns, input_hash,
+             self.model_hash, self.confidence, self.params, status, error, time.time()))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -12,18 +12,32 @@ from pathlib import Path
 import tkinter as tk
 from tkinter import ttk, messagebox
 from PIL import Image, ImageTk
-import torch
-from ultralytics import YOLO
+from inference_backends import load_model, resolve_model_path
+from image_io import check_color_mode, read_image, write_image, to_model_input
+from prediction_cache import PredictionCache, weights_digest, cached_predict, cached_predict_tiled
+from yolo_labels import (RAW_CONFIDENCE, xyxy_to_yolo, write_yolo_labels, labels_to_list,
+                         predictions_path, save_predictions, load_predictions, filter_predictions,
+                         refilter_labels)
 
 class EnhancedYOLOLabelTool:
-    def __init__(self, data_dir="data", output_dir="labeld_data", model_path="best.pt"):
+    def __init__(self, data_dir="data", output_dir="labeld_data", model_path="best.pt", color_mode="rgb",
+                 tile_size=640, tile_overlap=0.2, backend="torch", server=None):
         self.data_dir = Path(data_dir)
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
+        self.color_mode = check_color_mode(color_mode)
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
 
-        # Load your trained model
-        print(f"Loading YOLO model from {model_path}...")
-        self.model = YOLO(model_path)
+        # Load your trained model (or use the one held by a running inference server)
+        if server:
+            print(f"Using the model served at {server}...")
+        else:
+            model_path = resolve_model_path(model_path, backend)
+            print(f"Loading YOLO model from {model_path} ({backend})...")
+        self.model = load_model(model_path, backend, server=server)
+        self.weights_digest = weights_digest(self.model, model_path)
+        self.cache = PredictionCache()
 
         # YOLO classes from your model
         self.classes = {
@@ -35,6 +49,8 @@ class EnhancedYOLOLabelTool:
 
         self.current_image_idx = 0
         self.current_labels = []
+        self.predictions = None  # Raw detections for the current image, re-filtered by the Conf slider
+        self.rejected_predictions = set()  # Predictions deleted by hand, never brought back by the slider
         self.drawing = False
         self.start_x = self.start_y = 0
         self.current_class = 0
@@ -86,8 +102,11 @@ class EnhancedYOLOLabelTool:
         ttk.Button(model_frame, text="Run Model", command=self.run_model_detection).pack(side=tk.LEFT, padx=5)
         self.confidence_var = tk.DoubleVar(value=0.25)
         ttk.Label(model_frame, text="Conf:").pack(side=tk.LEFT, padx=(10,0))
-        conf_scale = ttk.Scale(model_frame, from_=0.1, to=0.9, variable=self.confidence_var, orient=tk.HORIZONTAL, length=100)
+        conf_scale = ttk.Scale(model_frame, from_=0.1, to=0.9, variable=self.confidence_var, orient=tk.HORIZONTAL, length=100,
+                               command=self.on_confidence_change)
         conf_scale.pack(side=tk.LEFT, padx=5)
+        self.tiled_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(model_frame, text="Tiled", variable=self.tiled_var).pack(side=tk.LEFT, padx=5)
 
         # Actions
         action_frame = ttk.Frame(control_frame)
@@ -149,11 +168,14 @@ class EnhancedYOLOLabelTool:
         self.image_label.config(text=f"{self.current_image_idx + 1}/{len(self.image_files)}: {image_path.name}")
 
         # Load image
-        self.original_image = cv2.imread(str(image_path))
+        self.original_image = read_image(image_path, self.color_mode)
         self.img_height, self.img_width = self.original_image.shape[:2]
 
-        # Convert for display
-        image_rgb = cv2.cvtColor(self.original_image, cv2.COLOR_BGR2RGB)
+        # Convert for display (single-channel images display as-is)
+        if self.original_image.ndim == 2:
+            image_rgb = self.original_image
+        else:
+            image_rgb = cv2.cvtColor(self.original_image, cv2.COLOR_BGR2RGB)
 
         # Use original size for better labeling precision
         self.display_width = self.img_width
@@ -171,8 +193,20 @@ class EnhancedYOLOLabelTool:
         self.load_existing_labels()
         self.draw_all_boxes()
 
+        # Cached predictions from batch_detect or an earlier save
+        self.predictions = None
+        self.rejected_predictions = set()
+        for directory in (self.output_dir, self.data_dir):
+            self.predictions = load_predictions(predictions_path(directory / f"{image_path.stem}.txt"))
+            if self.predictions is not None:
+                break
+
         # Update status
-        self.status_var.set(f"Image loaded. {len(self.current_labels)} existing labels. Press 'Run Model' to detect objects.")
+        if self.predictions is not None:
+            self.status_var.set(f"Image loaded. {len(self.current_labels)} existing labels, "
+                                f"{len(self.predictions['conf'])} cached predictions - move Conf to re-filter the unedited ones.")
+        else:
+            self.status_var.set(f"Image loaded. {len(self.current_labels)} existing labels. Press 'Run Model' to detect objects.")
 
     def run_model_detection(self):
         """Run your trained model to detect objects in the current image"""
@@ -183,31 +217,33 @@ class EnhancedYOLOLabelTool:
         self.root.update()
 
         try:
-            # Run inference
-            results = self.model(self.original_image, conf=self.confidence_var.get(), verbose=False)
-
             # Clear existing labels and add model predictions
             self.current_labels = []
 
-            # Process detections
-            if results and len(results) > 0:
-                detections = results[0]
-                if detections.boxes is not None:
-                    boxes = detections.boxes
-
-                    for i in range(len(boxes)):
-                        # Get box coordinates (xyxy format)
-                        x1, y1, x2, y2 = boxes.xyxy[i].cpu().numpy()
-                        confidence = boxes.conf[i].cpu().numpy()
-                        class_id = int(boxes.cls[i].cpu().numpy())
-
-                        # Convert to YOLO format (normalized center coordinates)
-                        x_center = ((x1 + x2) / 2) / self.img_width
-                        y_center = ((y1 + y2) / 2) / self.img_height
-                        width = (x2 - x1) / self.img_width
-                        height = (y2 - y1) / self.img_height
-
-                        self.current_labels.append([class_id, x_center, y_center, width, height])
+            # Detect down to the raw floor so the Conf slider can re-filter without rerunning
+            confidence = self.confidence_var.get()
+            raw_confidence = min(RAW_CONFIDENCE, confidence)
+            if self.tiled_var.get():
+                # Tiled inference keeps small shapes at full resolution on large drawings
+                xyxy, conf, cls = cached_predict_tiled(self.model, self.original_image, raw_confidence,
+                                                       self.tile_size, self.tile_overlap,
+                                                       cache=self.cache, weights_digest=self.weights_digest)
+            else:
+                # Run inference (pressing R again on the same image is a cache hit)
+                xyxy, conf, cls = cached_predict(self.model, to_model_input(self.original_image), raw_confidence,
+                                                 self.cache, self.weights_digest)
+
+            # Convert detections to YOLO format in one vectorized pass
+            self.predictions = {
+                "labels": xyxy_to_yolo(xyxy, cls, self.img_width, self.img_height),
+                "conf": conf,
+                "image_size": (self.img_width, self.img_height),
+                "confidence": confidence,
+                "raw_confidence": raw_confidence,
+            }
+            self.rejected_predictions = set()
+            labels, _ = filter_predictions(self.predictions, confidence)
+            self.current_labels = labels_to_list(labels)
 
             # Redraw all boxes
             self.draw_all_boxes()
@@ -219,6 +255,25 @@ class EnhancedYOLOLabelTool:
             self.status_var.set(f"Model error: {str(e)}")
             print(f"Detection error: {e}")
 
+    def on_confidence_change(self, value):
+        """
+        Re-filter cached predictions at the new threshold - no inference
+
+        Only unedited predictions come and go; drawn or edited boxes stay, and
+        predictions deleted by hand are not brought back. Nothing is saved.
+        """
+        if self.predictions is None:
+            return
+
+        confidence = float(value)
+        labels = refilter_labels(self.current_labels, self.predictions, confidence,
+                                 self.predictions["confidence"], self.rejected_predictions)
+        self.predictions["confidence"] = confidence
+        self.current_labels = labels_to_list(labels)
+        self.draw_all_boxes()
+        self.status_var.set(f"Conf {confidence:.2f}: {len(self.current_labels)} labels from "
+                            f"{len(self.predictions['conf'])} cached predictions and your edits. Save & Next to keep them.")
+
     def load_existing_labels(self):
         """Load existing YOLO format labels"""
         image_path = self.image_files[self.current_image_idx]
@@ -359,14 +414,15 @@ class EnhancedYOLOLabelTool:
 
         # Save image to output directory
         output_image_path = self.output_dir / image_path.name
-        cv2.imwrite(str(output_image_path), self.original_image)
+        write_image(output_image_path, self.original_image, self.color_mode)
 
         # Save labels
         label_file = self.output_dir / f"{image_path.stem}.txt"
-        with open(label_file, 'w') as f:
-            for label in self.current_labels:
-                class_id, x_center, y_center, width, height = label
-                f.write(f"{class_id} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n")
+        write_yolo_labels(label_file, self.current_labels)
+        if self.predictions is not None:
+            save_predictions(predictions_path(label_file), self.predictions["labels"], self.predictions["conf"],
+                             self.img_width, self.img_height, self.predictions["confidence"],
+                             self.predictions["raw_confidence"])
 
         self.status_var.set(f"Saved: {output_image_path.name} with {len(self.current_labels)} labels")
         print(f"Saved: {output_image_path.name} with {len(self.current_labels)} labels")
@@ -392,15 +448,29 @@ class EnhancedYOLOLabelTool:
 
 if __name__ == "__main__":
     import sys
+    import argparse
+    from image_io import COLOR_MODES
+    from inference_backends import BACKENDS
+
+    parser = argparse.ArgumentParser(description="AI-assisted YOLO labeling tool")
+    parser.add_argument("--color_mode", choices=COLOR_MODES, default="rgb",
+                        help="Load and save images as rgb, gray or bilevel (1-bit PNG)")
+    parser.add_argument("--tile_size", type=int, default=640, help="Tile size when 'Tiled' detection is enabled")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch",
+                        help="Inference runtime: PyTorch, or best.onnx with ONNX Runtime/OpenVINO")
+    parser.add_argument("--server", default=None,
+                        help="Use a running inference_server.py (http://host:port or unix:///path) instead of loading the model")
+    args = parser.parse_args()
 
     # Check if directories and model exist
     if not os.path.exists("data"):
         print("Error: 'data' directory not found!")
         sys.exit(1)
 
-    if not os.path.exists("best.pt"):
+    if not args.server and not os.path.exists("best.pt"):
         print("Error: 'best.pt' model file not found!")
         sys.exit(1)
 
-    tool = EnhancedYOLOLabelTool()
+    tool = EnhancedYOLOLabelTool(color_mode=args.color_mode, tile_size=args.tile_size, backend=args.backend,
+                                 server=args.server)
     tool.run()
\ No newline at end of file
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Image I/O helpers
+Single-channel loading, PDF rasterization and compact PNG storage for line drawings
+"""
+
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# rgb     - 3-channel BGR, the original behaviour
+# gray    - 8-bit single channel
+# bilevel - single channel thresholded to black/white, stored as packed 1-bit PNG
+COLOR_MODES = ("rgb", "gray", "bilevel")
+
+BILEVEL_THRESHOLD = 128
+
+def check_color_mode(color_mode):
+    """Raise ValueError for unknown color modes"""
+    if color_mode not in COLOR_MODES:
+        raise ValueError(f"Unknown color mode '{color_mode}' (expected one of {', '.join(COLOR_MODES)})")
+    return color_mode
+
+def read_image(image_path, color_mode="rgb"):
+    """Load an image as BGR (rgb mode) or as a single 2D channel (gray/bilevel)"""
+    check_color_mode(color_mode)
+    if color_mode == "rgb":
+        return cv2.imread(str(image_path))
+
+    image = cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE)
+    if image is not None and color_mode == "bilevel":
+        image = to_bilevel(image)
+    return image
+
+def decode_image(data, color_mode="rgb"):
+    """Decode encoded image bytes the same way read_image loads a file"""
+    check_color_mode(color_mode)
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if color_mode == "rgb":
+        return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+    image = cv2.imdecode(buffer, cv2.IMREAD_GRAYSCALE)
+    if image is not None and color_mode == "bilevel":
+        image = to_bilevel(image)
+    return image
+
+def to_bilevel(image, threshold=BILEVEL_THRESHOLD):
+    """Threshold a grayscale image to pure black (0) and white (255)"""
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    _, binary = cv2.threshold(image, threshold - 1, 255, cv2.THRESH_BINARY)
+    return binary
+
+def render_pdf_page(page, dpi=300, color_mode="rgb"):
+    """
+    Rasterize a PyMuPDF page straight into a numpy array
+
+    Gray and bilevel modes render with a gray colorspace so the pixmap is
+    one byte per pixel instead of three.
+
+    Returns:
+        BGR array (rgb mode) or 2D uint8 array (gray/bilevel)
+    """
+    import fitz  # PyMuPDF
+
+    check_color_mode(color_mode)
+    zoom = dpi / 72
+    colorspace = fitz.csRGB if color_mode == "rgb" else fitz.csGRAY
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=colorspace, alpha=False)
+
+    # Rows can be padded, so slice by stride before reshaping
+    samples = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)
+    image = samples[:, :pix.width * pix.n].reshape(pix.height, pix.width, pix.n)
+
+    if color_mode == "rgb":
+        return cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+
+    image = np.ascontiguousarray(image[:, :, 0])
+    if color_mode == "bilevel":
+        image = to_bilevel(image)
+    return image
+
+def png_params(image, color_mode="rgb"):
+    """cv2.imwrite parameters for storing an image in the given color mode"""
+    if color_mode == "bilevel" and image.ndim == 2:
+        return [cv2.IMWRITE_PNG_BILEVEL, 1]
+    return []
+
+def write_image(image_path, image, color_mode="rgb"):
+    """Write an image, packing bilevel PNGs to 1 bit per pixel"""
+    check_color_mode(color_mode)
+    # A new file, never written through a hardlink or symlink to a source image
+    Path(image_path).unlink(missing_ok=True)
+    if color_mode == "bilevel" and str(image_path).lower().endswith(".png"):
+        binary = to_bilevel(image)
+        return cv2.imwrite(str(image_path), binary, png_params(binary, color_mode))
+    return cv2.imwrite(str(image_path), image)
+
+def to_model_input(image):
+    """Expand single-channel images to the 3-channel BGR layout YOLO expects"""
+    if image.ndim == 2:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    if image.shape[2] == 1:
+        return cv2.cvtColor(image[:, :, 0], cv2.COLOR_GRAY2BGR)
+    return image
+
+def pdf_page_count(pdf_path):
+    """Number of pages in a PDF"""
+    import fitz  # PyMuPDF
+
+    with fitz.open(str(pdf_path)) as doc:
+        return doc.page_count
+
+def iter_pdf_pages(pdf_path, dpi=300, color_mode="rgb"):
+    """Yield (page_number, image) for every page of a PDF, 1-indexed, rendered in memory"""
+    import fitz  # PyMuPDF
+
+    with fitz.open(str(pdf_path)) as doc:
+        for page_index in range(doc.page_count):
+            yield page_index + 1, render_pdf_page(doc[page_index], dpi, color_mode)
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Inference Backends
+Runs the detector with PyTorch (ultralytics), ONNX Runtime or OpenVINO behind one model(...) call
+"""
+
+import ast
+import os
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# torch       - ultralytics.YOLO on the .pt weights (the original path)
+# onnxruntime - exported .onnx model, CPU execution provider
+# openvino    - exported .onnx (or OpenVINO .xml) model compiled for CPU
+BACKENDS = ("torch", "onnxruntime", "openvino")
+
+# ultralytics predict defaults
+DEFAULT_IMGSZ = 640
+DEFAULT_IOU = 0.7
+MAX_DETECTIONS = 300
+STRIDE = 32
+
+# Boxes of different classes are shifted this far apart so one NMS pass stays class-aware
+_CLASS_OFFSET = 7680
+
+def check_backend(backend):
+    """Raise ValueError for unknown backends"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}' (expected one of {', '.join(BACKENDS)})")
+    return backend
+
+def resolve_model_path(model_path, backend="torch"):
+    """
+    Weights file a backend will load
+
+    For onnxruntime/openvino a .pt path maps to the exported model next to it
+    (best.pt -> best.onnx, or best_openvino_model/best.xml for openvino).
+    """
+    check_backend(backend)
+    path = Path(model_path)
+    if backend == "torch" or path.suffix in (".onnx", ".xml"):
+        return path
+
+    if backend == "openvino":
+        xml_path = path.parent / f"{path.stem}_openvino_model" / f"{path.stem}.xml"
+        if xml_path.exists():
+            return xml_path
+
+    onnx_path = path.with_suffix(".onnx")
+    if not onnx_path.exists():
+        raise FileNotFoundError(f"{onnx_path} not found - export it first: "
+                                f"python inference_backends.py --export {path}")
+    return onnx_path
+
+def load_model(model_path, backend="torch", threads=None, server=None):
+    """
+    Load a detector for the given backend
+
+    Every backend is called like ultralytics.YOLO - model(image_or_list, conf=, imgsz=, iou=) -
+    and returns results whose .boxes expose xyxy/conf/cls with .cpu().numpy().
+    With server (http://host:port or unix:///path), nothing is loaded locally: the
+    model of that running inference_server.py is used instead.
+    """
+    if server:
+        from inference_server import RemoteModel
+
+        return RemoteModel(server)
+
+    path = resolve_model_path(model_path, backend)
+    if backend == "torch":
+        from ultralytics import YOLO
+
+        return YOLO(str(path))
+    if backend == "onnxruntime":
+        return OnnxRuntimeModel(path, threads)
+    return OpenVinoModel(path, threads)
+
+def export_onnx(model_path, imgsz=DEFAULT_IMGSZ, dynamic=True):
+    """Export .pt weights to ONNX (dynamic batch/size input by default); returns the .onnx path"""
+    from ultralytics import YOLO
+
+    return Path(YOLO(str(model_path)).export(format="onnx", imgsz=imgsz, dynamic=dynamic, simplify=True))
+
+class HostArray(np.ndarray):
+    """ndarray with the torch tensor methods the detection code calls (.cpu(), .numpy())"""
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.view(np.ndarray)
+
+class NumpyBoxes:
+    """Detections of one image, shaped like ultralytics Boxes"""
+
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy = np.asarray(xyxy, np.float32).reshape(-1, 4).view(HostArray)
+        self.conf = np.asarray(conf, np.float32).reshape(-1).view(HostArray)
+        self.cls = np.asarray(cls, np.float32).reshape(-1).view(HostArray)
+
+    def __len__(self):
+        return len(self.conf)
+
+class NumpyResults:
+    """Result of one image, shaped like ultralytics Results"""
+
+    def __init__(self, boxes, orig_shape, names):
+        self.boxes = boxes
+        self.orig_shape = orig_shape
+        self.names = names
+
+def letterbox(image, new_shape, color=114):
+    """
+    Resize keeping aspect ratio and pad to new_shape (height, width)
+
+    Returns:
+        (padded image, gain, (pad_x, pad_y))
+    """
+    height, width = image.shape[:2]
+    gain = min(new_shape[0] / height, new_shape[1] / width)
+    resized_w, resized_h = int(round(width * gain)), int(round(height * gain))
+    pad_x = (new_shape[1] - resized_w) / 2
+    pad_y = (new_shape[0] - resized_h) / 2
+
+    if (resized_w, resized_h) != (width, height):
+        image = cv2.resize(image, (resized_w, resized_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(color, color, color))
+    return image, gain, (left, top)
+
+def preprocess(image, shape):
+    """
+    Letterbox one BGR or gray image into the exported graph's input layout
+
+    Returns:
+        (RGB CHW float32 tensor in 0-1, gain, pad, original (height, width))
+    """
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    padded, gain, pad = letterbox(image, shape)
+    tensor = padded[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+    return tensor, gain, pad, image.shape[:2]
+
+def nms(boxes, scores, iou_threshold):
+    """Greedy non-maximum suppression over (N, 4) xyxy boxes; returns kept indices, best first"""
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+
+    keep = []
+    while order.size > 0:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        ix1 = np.maximum(x1[best], x1[rest])
+        iy1 = np.maximum(y1[best], y1[rest])
+        ix2 = np.minimum(x2[best], x2[rest])
+        iy2 = np.minimum(y2[best], y2[rest])
+        intersection = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+        iou = intersection / (areas[best] + areas[rest] - intersection + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=int)
+
+def postprocess(prediction, conf, iou, gain, pad, orig_shape, max_det=MAX_DETECTIONS):
+    """
+    Decode one image of raw YOLOv8-style output (4 + num_classes, N) into page detections
+
+    Returns:
+        (xyxy, conf, cls) numpy arrays in original image pixels
+    """
+    prediction = prediction.T
+    scores = prediction[:, 4:]
+    cls = scores.argmax(1)
+    confidence = scores[np.arange(len(scores)), cls]
+
+    mask = confidence >= conf
+    boxes, confidence, cls = prediction[mask, :4], confidence[mask], cls[mask]
+    if len(boxes) == 0:
+        return np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.float32)
+
+    # xywh -> xyxy
+    xyxy = np.empty_like(boxes)
+    xyxy[:, :2] = boxes[:, :2] - boxes[:, 2:] / 2
+    xyxy[:, 2:] = boxes[:, :2] + boxes[:, 2:] / 2
+
+    keep = nms(xyxy + cls[:, None] * _CLASS_OFFSET, confidence, iou)[:max_det]
+    xyxy, confidence, cls = xyxy[keep], confidence[keep], cls[keep]
+
+    # Undo the letterbox
+    xyxy[:, [0, 2]] = (xyxy[:, [0, 2]] - pad[0]) / gain
+    xyxy[:, [1, 3]] = (xyxy[:, [1, 3]] - pad[1]) / gain
+    xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, orig_shape[1])
+    xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, orig_shape[0])
+    return xyxy.astype(np.float32), confidence.astype(np.float32), cls.astype(np.float32)
+
+class _ExportedModel:
+    """Shared letterbox -> run -> NMS pipeline for exported models"""
+
+    fixed_shape = None    # (height, width) when the exported input is static
+    dynamic_batch = False
+
+    def __init__(self, model_path):
+        self.model_path = Path(model_path)
+        self.names = {}
+
+    def _infer(self, batch):
+        raise NotImplementedError
+
+    def _input_shape(self, imgsz):
+        if self.fixed_shape:
+            return self.fixed_shape
+        size = int(np.ceil(imgsz / STRIDE) * STRIDE)
+        return (size, size)
+
+    def __call__(self, source, conf=0.25, imgsz=DEFAULT_IMGSZ, iou=DEFAULT_IOU, verbose=False, **kwargs):
+        images = source if isinstance(source, list) else [source]
+        images = [cv2.imread(str(image)) if isinstance(image, (str, Path)) else image for image in images]
+        shape = self._input_shape(imgsz)
+
+        prepared = [preprocess(image, shape) for image in images]
+
+        if self.dynamic_batch:
+            outputs = self._infer(np.stack([p[0] for p in prepared]))
+        else:
+            outputs = np.concatenate([self._infer(p[0][None]) for p in prepared])
+
+        results = []
+        for output, (_, gain, pad, orig_shape) in zip(outputs, prepared):
+            xyxy, confidence, cls = postprocess(output, conf, iou, gain, pad, orig_shape)
+            results.append(NumpyResults(NumpyBoxes(xyxy, confidence, cls), orig_shape, self.names))
+        return results
+
+def _parse_names(value):
+    """Class names from ultralytics export metadata ("{0: 'straight', ...}")"""
+    try:
+        return {int(k): v for k, v in ast.literal_eval(value).items()}
+    except (ValueError, SyntaxError, AttributeError):
+        return {}
+
+class OnnxRuntimeModel(_ExportedModel):
+    """ONNX Runtime CPU session with explicit thread pools and full graph optimization"""
+
+    def __init__(self, model_path, threads=None):
+        import onnxruntime as ort
+
+        super().__init__(model_path)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = threads or os.cpu_count() or 1
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, height, width = model_input.shape
+        self.dynamic_batch = not isinstance(batch, int)
+        if isinstance(height, int) and isinstance(width, int):
+            self.fixed_shape = (height, width)
+        self.names = _parse_names(self.session.get_modelmeta().custom_metadata_map.get("names", ""))
+
+    def _infer(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+class OpenVinoModel(_ExportedModel):
+    """OpenVINO model compiled for CPU with a latency hint and a fixed thread count"""
+
+    def __init__(self, model_path, threads=None):
+        import openvino as ov
+
+        super().__init__(model_path)
+        core = ov.Core()
+        model = core.read_model(str(model_path))
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if threads:
+            config["INFERENCE_NUM_THREADS"] = int(threads)
+        self.compiled = core.compile_model(model, "CPU", config)
+
+        partial_shape = model.inputs[0].get_partial_shape()
+        self.dynamic_batch = partial_shape[0].is_dynamic
+        if partial_shape[2].is_static and partial_shape[3].is_static:
+            self.fixed_shape = (partial_shape[2].get_length(), partial_shape[3].get_length())
+        if model.has_rt_info(["framework", "names"]):
+            self.names = _parse_names(model.get_rt_info(["framework", "names"]).astype(str))
+
+    def _infer(self, batch):
+        return self.compiled(batch)[self.compiled.output(0)]
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export YOLO weights for the ONNX Runtime / OpenVINO backends")
+    parser.add_argument("--export", required=True, help="Path to the .pt weights (e.g. models/best.pt)")
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ, help="Export image size")
+    args = parser.parse_args()
+
+    onnx_path = export_onnx(args.export, args.imgsz)
+    print(f"✅ Exported {onnx_path} (use --backend onnxruntime or openvino)")
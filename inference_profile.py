@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Inference Autoprofiler
+Sweeps worker processes, inference threads, image size and batch size on a sample of the
+dataset and stores the fastest settings for this machine in config.json
+"""
+
+import os
+import json
+import time
+import queue
+import random
+import platform
+import tempfile
+import argparse
+import itertools
+import multiprocessing
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from image_io import read_image, to_model_input, iter_pdf_pages
+from inference_backends import BACKENDS, DEFAULT_IMGSZ, DEFAULT_IOU, check_backend, load_model, resolve_model_path
+from tiled_inference import tile_windows, ink_integral, window_ink, crop_to_content
+
+CONFIG_PATH = Path(__file__).resolve().parent / "config.json"
+
+# Profiles are stored per machine, so one config.json works on laptops and servers alike
+PROFILES_KEY = "inference_profiles"
+
+# Seconds one configuration may take (model load included) before its workers are abandoned
+WORKER_TIMEOUT = 600
+
+def host_name():
+    """Key of this machine's entry in config.json"""
+    return platform.node() or "default"
+
+def load_profile(config_path=CONFIG_PATH, host=None):
+    """This machine's profile from config.json, or {} if it was never profiled"""
+    try:
+        with open(config_path) as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return config.get(PROFILES_KEY, {}).get(host or host_name(), {})
+
+def save_profile(profile, config_path=CONFIG_PATH, host=None):
+    """Store a profile under this machine's entry, keeping the rest of config.json"""
+    config = {}
+    if Path(config_path).exists():
+        with open(config_path) as f:
+            config = json.load(f)
+    config.setdefault(PROFILES_KEY, {})[host or host_name()] = profile
+    with open(config_path, 'w') as f:
+        json.dump(config, f, indent=2)
+
+def tuned_settings(role, backend, config_path=CONFIG_PATH):
+    """
+    Tuned settings for one consumer of the profile
+
+    role is "batch" (throughput, read by batch_detect) or "interactive"
+    (single-request latency, read by the annotation backend). Settings measured
+    with a different backend are not applied.
+    """
+    profile = load_profile(config_path)
+    if profile.get("backend") != backend:
+        return {}
+    return dict(profile.get(role, {}))
+
+def sample_pages(data_dir, sample_size, seed=0, dpi=300):
+    """Decode up to sample_size pages (images and PDF pages) picked at random from data_dir"""
+    data_dir = Path(data_dir)
+    files = sorted(p for p in data_dir.iterdir() if p.suffix.lower() in (".png", ".jpg", ".jpeg", ".pdf"))
+    random.Random(seed).shuffle(files)
+
+    pages = []
+    for path in files:
+        if path.suffix.lower() == ".pdf":
+            for _, page in iter_pdf_pages(path, dpi):
+                pages.append(page)
+                if len(pages) >= sample_size:
+                    break
+        else:
+            image = read_image(path)
+            if image is not None:
+                pages.append(image)
+        if len(pages) >= sample_size:
+            break
+    return pages
+
+def model_inputs(pages, tile_size=0, overlap=0.2):
+    """
+    What batch_detect actually sends to the model for these pages
+
+    Inked tiles when tile_size is set, otherwise each page cropped to its inked region.
+    """
+    inputs = []
+    for page in pages:
+        if tile_size:
+            integral = ink_integral(page)
+            for x1, y1, x2, y2 in tile_windows(page.shape[1], page.shape[0], tile_size, overlap):
+                if window_ink(integral, (x1, y1, x2, y2)) > 0:
+                    inputs.append(to_model_input(page[y1:y2, x1:x2]))
+        else:
+            crop, _ = crop_to_content(page)
+            if crop is not None:
+                inputs.append(to_model_input(crop))
+    return inputs
+
+def candidate_configs(cpu_count, workers=None, threads=None, imgsz=(DEFAULT_IMGSZ,), batch=(1,)):
+    """
+    (workers, threads, imgsz, batch) combinations that don't oversubscribe the CPU
+
+    Defaults: powers of two for workers and threads, up to the core count.
+    """
+    powers = [2 ** i for i in range(cpu_count.bit_length()) if 2 ** i <= cpu_count]
+    workers = workers or powers
+    threads = threads or powers
+    return [(w, t, size, b) for w, t, size, b in itertools.product(workers, threads, imgsz, batch)
+            if w * t <= cpu_count]
+
+def _profile_worker(model_path, backend, threads, input_paths, imgsz, batch, rounds, barrier, results,
+                    timeout=WORKER_TIMEOUT):
+    """
+    Child process: warm up, wait for the other workers, then time every model call
+
+    Puts (start, end, latencies) on `results`, or an error message if anything fails;
+    a failure breaks the barrier so the other workers stop waiting too.
+    """
+    try:
+        from batch_detect import configure_threads
+
+        configure_threads(threads, backend)
+        model = load_model(model_path, backend, threads)
+        inputs = [np.load(path) for path in input_paths]
+        batches = [inputs[i:i + batch] for i in range(0, len(inputs), batch)]
+        model(batches[0], conf=0.25, imgsz=imgsz, iou=DEFAULT_IOU, verbose=False)
+
+        barrier.wait(timeout=timeout)
+        start = time.time()
+        latencies = []
+        for _ in range(rounds):
+            for images in batches:
+                call_start = time.perf_counter()
+                model(images, conf=0.25, imgsz=imgsz, iou=DEFAULT_IOU, verbose=False)
+                # Every image in a batch waits for the whole call
+                latencies += [time.perf_counter() - call_start] * len(images)
+        results.put((start, time.time(), latencies))
+    except Exception as e:
+        barrier.abort()
+        results.put(f"{type(e).__name__}: {e}")
+
+def _collect_runs(processes, results, timeout):
+    """Worker results, or an error message once a worker fails, dies or the timeout passes"""
+    deadline = time.time() + timeout
+    runs = []
+    while len(runs) < len(processes):
+        try:
+            run = results.get(timeout=min(1.0, max(deadline - time.time(), 0.01)))
+        except queue.Empty:
+            if time.time() > deadline:
+                return runs, f"timed out after {timeout}s"
+            # A worker killed outright (OOM, segfault) never reports; the rest may be stuck at the barrier
+            codes = [process.exitcode for process in processes if process.exitcode]
+            if codes:
+                return runs, f"worker exited with code {codes[0]} without a result"
+            if not any(process.is_alive() for process in processes):
+                return runs, "workers exited without a result"
+            continue
+        if isinstance(run, str):
+            return runs, run
+        runs.append(run)
+    return runs, None
+
+def profile_config(model_path, backend, input_paths, workers, threads, imgsz, batch, rounds=1,
+                   timeout=WORKER_TIMEOUT):
+    """
+    Run one configuration: `workers` processes with `threads` threads each,
+    all working through the sample at once
+
+    Returns:
+        dict with images/second across workers and per-image p50/p95 latency in ms,
+        or None (with the reason printed) if a worker failed, died or timed out
+    """
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=_profile_worker,
+                             args=(str(model_path), backend, threads, input_paths, imgsz, batch,
+                                   rounds, barrier, results, timeout))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    runs, error = _collect_runs(processes, results, timeout)
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+    if error is None and any(process.exitcode for process in processes):
+        error = f"worker exited with code {next(p.exitcode for p in processes if p.exitcode)}"
+    if error is not None:
+        print(f"⚠️  {workers} workers x {threads} threads, imgsz {imgsz}, batch {batch} failed: {error}")
+        return None
+
+    latencies = np.concatenate([run[2] for run in runs]) * 1000
+    wall = max(run[1] for run in runs) - min(run[0] for run in runs)
+    return {
+        "workers": workers,
+        "threads": threads,
+        "imgsz": imgsz,
+        "batch": batch,
+        "images_per_second": round(len(latencies) / wall, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+    }
+
+def pick_best(results, max_p95_ms=None):
+    """
+    Throughput winner for batch runs and latency winner for interactive requests
+
+    Interactive settings come from single-worker, batch-1 runs (one annotator
+    request at a time); max_p95_ms rules out batch configurations that are too slow per image.
+    """
+    eligible = [r for r in results if max_p95_ms is None or r["p95_ms"] <= max_p95_ms] or results
+    batch = max(eligible, key=lambda r: r["images_per_second"])
+    single = [r for r in results if r["workers"] == 1 and r["batch"] == 1] or results
+    interactive = min(single, key=lambda r: r["p50_ms"])
+    return batch, interactive
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the fastest CPU inference settings for this machine")
+    parser.add_argument("--data_dir", default="data", help="Images and/or PDFs to sample pages from")
+    parser.add_argument("--model", default="models/best.pt", help="Model file path")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch")
+    parser.add_argument("--sample", type=int, default=16, help="Pages to profile on")
+    parser.add_argument("--rounds", type=int, default=1, help="Passes over the sample per configuration")
+    parser.add_argument("--workers", type=int, nargs="+", default=None,
+                        help="Worker process counts to try (default: powers of two up to the core count)")
+    parser.add_argument("--threads", type=int, nargs="+", default=None,
+                        help="Threads per worker to try (default: powers of two up to the core count)")
+    parser.add_argument("--imgsz", type=int, nargs="+", default=[DEFAULT_IMGSZ],
+                        help="Whole-page image sizes to try (changes detections - compare labels before adopting)")
+    parser.add_argument("--tile_size", type=int, default=0,
+                        help="Profile tiled inference with this tile size; --batch is then the tile batch")
+    parser.add_argument("--batch", type=int, nargs="+", default=None,
+                        help="Tile batch sizes to try with --tile_size (default: 1 4 8 16)")
+    parser.add_argument("--max_p95_ms", type=float, default=None,
+                        help="Ignore batch configurations whose p95 per-image latency exceeds this")
+    parser.add_argument("--timeout", type=float, default=WORKER_TIMEOUT,
+                        help="Seconds one configuration may take before it is skipped")
+    parser.add_argument("--config", default=str(CONFIG_PATH), help="Config file the results are written to")
+    parser.add_argument("--dry_run", action="store_true", help="Print the results without writing config.json")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    check_backend(args.backend)
+    if not os.path.exists(args.data_dir):
+        print(f"❌ Directory '{args.data_dir}' not found")
+        exit(1)
+    try:
+        model_path = resolve_model_path(args.model, args.backend)
+    except FileNotFoundError as e:
+        print(f"❌ {e}")
+        exit(1)
+
+    # batch_detect calls the model once per page; only tiles are batched
+    batch_sizes = args.batch or ([1, 4, 8, 16] if args.tile_size else [1])
+    if not args.tile_size and batch_sizes != [1]:
+        print("⚠️  --batch only applies to tiled inference (--tile_size); profiling batch 1")
+        batch_sizes = [1]
+    sizes = [args.tile_size] if args.tile_size else args.imgsz
+
+    cpu_count = os.cpu_count() or 1
+    configs = candidate_configs(cpu_count, args.workers, args.threads, sizes, batch_sizes)
+
+    pages = sample_pages(args.data_dir, args.sample, args.seed)
+    inputs = model_inputs(pages, args.tile_size)
+    if not inputs:
+        print(f"❌ No inked pages found in {args.data_dir}")
+        exit(1)
+    print(f"📄 Profiling on {len(pages)} pages ({len(inputs)} model inputs), {cpu_count} CPUs, "
+          f"{args.backend} backend, {len(configs)} configurations")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_paths = []
+        for i, image in enumerate(inputs):
+            input_paths.append(str(Path(tmp_dir) / f"{i}.npy"))
+            np.save(input_paths[-1], image)
+
+        print(f"\n{'workers':>8}{'threads':>8}{'imgsz':>7}{'batch':>7}{'img/s':>9}{'p50 ms':>9}{'p95 ms':>9}")
+        for workers, threads, imgsz, batch in configs:
+            result = profile_config(model_path, args.backend, input_paths, workers, threads, imgsz, batch,
+                                    args.rounds, args.timeout)
+            if result is None:
+                continue
+            results.append(result)
+            print(f"{workers:>8}{threads:>8}{imgsz:>7}{batch:>7}{result['images_per_second']:>9.2f}"
+                  f"{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}")
+
+    if not results:
+        print("❌ Every configuration failed; nothing to save")
+        exit(1)
+    best_batch, best_interactive = pick_best(results, args.max_p95_ms)
+    batch_settings = {"workers": best_batch["workers"], "threads": best_batch["threads"]}
+    interactive_settings = {"threads": best_interactive["threads"]}
+    if args.tile_size:
+        batch_settings.update(tile_size=args.tile_size, tile_batch=best_batch["batch"])
+    else:
+        batch_settings["imgsz"] = best_batch["imgsz"]
+        interactive_settings["imgsz"] = best_interactive["imgsz"]
+
+    profile = {
+        "profiled_at": datetime.now().isoformat(timespec="seconds"),
+        "cpu_count": cpu_count,
+        "backend": args.backend,
+        "model": str(model_path),
+        "batch": batch_settings,
+        "interactive": interactive_settings,
+        "results": results,
+    }
+
+    print(f"\n🏁 Batch: {best_batch['workers']} workers x {best_batch['threads']} threads, "
+          f"{best_batch['images_per_second']:.2f} img/s")
+    print(f"🏁 Interactive: {best_interactive['threads']} threads, p50 {best_interactive['p50_ms']:.1f} ms, "
+          f"p95 {best_interactive['p95_ms']:.1f} ms")
+
+    if args.dry_run:
+        return
+    save_profile(profile, args.config)
+    print(f"✅ Saved profile for {host_name()} to {args.config} (used by batch_detect.py and the annotation backend)")
+
+if __name__ == "__main__":
+    main()
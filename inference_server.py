@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Inference Server
+Local sidecar that holds the model once and micro-batches requests from every tool on the machine
+
+Start it, then point the tools at it with --server (or INFERENCE_SERVER for the web backend):
+    python inference_server.py --model models/best.pt --port 8765
+    python batch_detect.py --model models/best.pt --server http://127.0.0.1:8765
+"""
+
+import io
+import os
+import json
+import time
+import socket
+import threading
+import http.client
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, urlencode, parse_qs, unquote
+
+import numpy as np
+
+from inference_backends import DEFAULT_IMGSZ, DEFAULT_IOU, NumpyBoxes, NumpyResults
+from micro_batching import DEFAULT_MAX_BATCH, DEFAULT_MAX_WAIT_MS, MicroBatcher, QueueFullError
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_QUEUE = 256
+
+# How long a client keeps retrying while the server reports a full queue or drops its connection
+BACKPRESSURE_TIMEOUT = 120
+
+# Pending connections the listening socket holds (socketserver's default of 5 resets bursts of clients)
+LISTEN_BACKLOG = 128
+
+# Connection errors after which a request is simply sent again (stale keep-alive, reset under load);
+# every endpoint is read-only, so resending is safe
+_RETRYABLE = (ConnectionResetError, ConnectionAbortedError, BrokenPipeError, http.client.BadStatusLine)
+
+def encode_images(images):
+    """Images as an uncompressed .npz body (lossless, no PNG encode/decode on either side)"""
+    buffer = io.BytesIO()
+    np.savez(buffer, *[np.ascontiguousarray(image) for image in images])
+    return buffer.getvalue()
+
+def decode_images(body):
+    with np.load(io.BytesIO(body)) as data:
+        return [data[f"arr_{i}"] for i in range(len(data.files))]
+
+class _Handler(BaseHTTPRequestHandler):
+    """POST /predict, GET /metrics, GET /health"""
+
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/metrics":
+            metrics = self.server.batcher.metrics()
+            metrics["requests"] = self.server.requests
+            metrics["uptime_seconds"] = round(time.time() - self.server.started, 1)
+            self._send_json(200, metrics)
+        elif path == "/health":
+            self._send_json(200, self.server.info)
+        else:
+            self._send_json(404, {"error": f"Unknown path {path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if url.path != "/predict":
+            self._send_json(404, {"error": f"Unknown path {url.path}"})
+            return
+
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        try:
+            images = decode_images(body)
+            conf = float(query.get("conf", 0.25))
+            imgsz = int(query.get("imgsz", DEFAULT_IMGSZ))
+            iou = float(query.get("iou", DEFAULT_IOU))
+        except (ValueError, OSError) as e:
+            self._send_json(400, {"error": f"Bad request: {e}"})
+            return
+
+        self.server.requests += 1
+        try:
+            results = self.server.batcher(images, conf=conf, imgsz=imgsz, iou=iou)
+        except QueueFullError as e:
+            self._send_json(503, {"error": str(e)}, {"Retry-After": "1"})
+            return
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+
+        self._send_json(200, {"results": [{"xyxy": result.boxes.xyxy.tolist(),
+                                           "conf": result.boxes.conf.tolist(),
+                                           "cls": result.boxes.cls.tolist()} for result in results]})
+
+    def address_string(self):
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        pass  # One line per request would drown the batching in logging
+
+class _ThreadingTCPHTTPServer(ThreadingHTTPServer):
+    request_queue_size = LISTEN_BACKLOG
+
+class _ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = "localhost", 0
+
+def serve(model_path, backend="torch", threads=None, host="127.0.0.1", port=DEFAULT_PORT, socket_path=None,
+          max_batch=DEFAULT_MAX_BATCH, max_wait_ms=DEFAULT_MAX_WAIT_MS, max_queue=DEFAULT_MAX_QUEUE):
+    """Load the model, warm it up and serve until interrupted"""
+    from inference_backends import load_model, resolve_model_path
+    from prediction_cache import model_hash
+
+    resolved = resolve_model_path(model_path, backend)
+    print(f"🤖 Loading {resolved} ({backend})...")
+    model = load_model(model_path, backend, threads)
+    model(np.full((DEFAULT_IMGSZ, DEFAULT_IMGSZ, 3), 255, np.uint8), conf=0.25, imgsz=DEFAULT_IMGSZ, verbose=False)
+    batcher = MicroBatcher(model, max_batch, max_wait_ms, max_queue)
+
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = _ThreadingUnixHTTPServer(socket_path, _Handler)
+        address = f"unix://{socket_path}"
+    else:
+        server = _ThreadingTCPHTTPServer((host, port), _Handler)
+        address = f"http://{host}:{server.server_address[1]}"
+
+    server.batcher = batcher
+    server.requests = 0
+    server.started = time.time()
+    server.info = {
+        "status": "ok",
+        "model": str(resolved),
+        "model_hash": model_hash(resolved),
+        "backend": backend,
+        "names": {str(k): v for k, v in (getattr(model, "names", None) or {}).items()},
+        "max_batch": max_batch,
+        "max_wait_ms": max_wait_ms,
+        "max_queue": max_queue,
+    }
+
+    print(f"✅ Serving on {address} (batches of up to {max_batch} within {max_wait_ms:g} ms, "
+          f"queue limit {max_queue or 'none'})")
+    print(f"   Metrics: {address}/metrics")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n{batcher.report()}")
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+class RemoteModel:
+    """
+    Client for a running inference server, called like ultralytics.YOLO
+
+    server is http://host:port or unix:///path/to/socket. Results come back as
+    NumpyResults. When the server's queue is full, or a connection is reset, the
+    call reconnects and retries (up to BACKPRESSURE_TIMEOUT seconds) instead of failing.
+    """
+
+    def __init__(self, server, timeout=300):
+        self.server = server
+        self.timeout = timeout
+        self._local = threading.local()
+        info = self._request("GET", "/health")
+        self.model_hash = info["model_hash"]
+        self.names = {int(k): v for k, v in info["names"].items()}
+
+    def _connection(self):
+        if getattr(self._local, "connection", None) is None:
+            url = urlsplit(self.server)
+            if url.scheme == "unix":
+                self._local.connection = _UnixHTTPConnection(unquote(url.path), self.timeout)
+            else:
+                self._local.connection = http.client.HTTPConnection(url.hostname, url.port or DEFAULT_PORT,
+                                                                    timeout=self.timeout)
+        return self._local.connection
+
+    def _request(self, method, path, body=None):
+        deadline = time.monotonic() + BACKPRESSURE_TIMEOUT
+        delay = 0.05
+        while True:
+            connection = self._connection()
+            try:
+                connection.request(method, path, body=body)
+                response = connection.getresponse()
+                payload = json.loads(response.read() or b"{}")
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                self._local.connection = None
+                if isinstance(e, _RETRYABLE) and time.monotonic() < deadline:
+                    time.sleep(delay)
+                    delay = min(delay * 2, 1.0)
+                    continue
+                raise ConnectionError(f"Inference server {self.server} unavailable: {e}") from e
+
+            if response.status == 503 and time.monotonic() < deadline:
+                time.sleep(delay)
+                delay = min(delay * 2, 1.0)
+                continue
+            if response.status != 200:
+                raise RuntimeError(f"Inference server error {response.status}: {payload.get('error')}")
+            return payload
+
+    def __call__(self, source, conf=0.25, imgsz=DEFAULT_IMGSZ, iou=DEFAULT_IOU, verbose=False, **kwargs):
+        import cv2
+
+        images = source if isinstance(source, list) else [source]
+        images = [cv2.imread(str(image)) if isinstance(image, (str, os.PathLike)) else image for image in images]
+        query = urlencode({"conf": conf, "imgsz": imgsz, "iou": iou})
+        payload = self._request("POST", f"/predict?{query}", encode_images(images))
+        return [NumpyResults(NumpyBoxes(result["xyxy"], result["conf"], result["cls"]), image.shape[:2], self.names)
+                for image, result in zip(images, payload["results"])]
+
+    def metrics(self):
+        return self._request("GET", "/metrics")
+
+if __name__ == "__main__":
+    import argparse
+    from inference_backends import BACKENDS
+
+    parser = argparse.ArgumentParser(description="Serve one shared YOLO model to local tools")
+    parser.add_argument("--model", default="models/best.pt", help="Model file path")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch")
+    parser.add_argument("--threads", type=int, default=None, help="Inference threads (default: runtime default)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--socket", default=None, help="Listen on this Unix socket instead of TCP")
+    parser.add_argument("--max_batch", type=int, default=DEFAULT_MAX_BATCH, help="Images per model call")
+    parser.add_argument("--max_wait_ms", type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help="How long the oldest queued image waits for others to batch with")
+    parser.add_argument("--max_queue", type=int, default=DEFAULT_MAX_QUEUE,
+                        help="Queued images before new requests get 503 (0 = unbounded)")
+    args = parser.parse_args()
+
+    serve(args.model, args.backend, args.threads, args.host, args.port, args.socket,
+          args.max_batch, args.max_wait_ms, args.max_queue)
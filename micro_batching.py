@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Micro-Batching
+Shares one warm model between concurrent requests by collecting them into small batches
+"""
+
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from yolo_labels import boxes_to_arrays
+from inference_backends import DEFAULT_IMGSZ, DEFAULT_IOU, NumpyBoxes, NumpyResults
+
+DEFAULT_MAX_BATCH = 8
+DEFAULT_MAX_WAIT_MS = 10
+
+# Per-image latencies kept for the metrics percentiles
+LATENCY_WINDOW = 2000
+
+# Longest a call waits for its results before giving up (seconds)
+DEFAULT_RESULT_TIMEOUT = 300
+
+class QueueFullError(RuntimeError):
+    """Raised instead of queueing when max_queue images are already waiting"""
+
+class MicroBatcher:
+    """
+    Callable stand-in for a model that batches images across threads
+
+    Each call's images are queued; one inference thread takes the oldest image,
+    waits up to max_wait_ms for more with the same imgsz/iou (at most max_batch),
+    and runs them as one model call at the lowest requested confidence. Each
+    caller gets back only its own detections at its own confidence, as
+    NumpyResults, so cached_predict and predict_tiled work unchanged.
+
+    With max_queue > 0, a call that would leave more than max_queue images
+    waiting raises QueueFullError, so callers can back off instead of piling up.
+    A call that gets no results within result_timeout seconds raises TimeoutError.
+    """
+
+    def __init__(self, model, max_batch=DEFAULT_MAX_BATCH, max_wait_ms=DEFAULT_MAX_WAIT_MS, max_queue=0,
+                 result_timeout=DEFAULT_RESULT_TIMEOUT):
+        self.model = model
+        self.result_timeout = result_timeout
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.requests = queue.Queue()
+        self.images = 0
+        self.batches = 0
+        self.rejected = 0
+        self.pending = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.inference_times = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self._deferred = []
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def __call__(self, source, conf=0.25, imgsz=DEFAULT_IMGSZ, iou=DEFAULT_IOU, verbose=False, **kwargs):
+        images = source if isinstance(source, list) else [source]
+        with self._lock:
+            if self.max_queue and self.pending + len(images) > self.max_queue:
+                self.rejected += len(images)
+                raise QueueFullError(f"{self.pending} images queued (limit {self.max_queue})")
+            self.pending += len(images)
+
+        futures = []
+        for image in images:
+            future = Future()
+            self.requests.put((image, conf, imgsz, iou, future, time.perf_counter()))
+            futures.append(future)
+        deadline = time.monotonic() + self.result_timeout
+        return [future.result(timeout=max(deadline - time.monotonic(), 0)) for future in futures]
+
+    def _next_request(self, timeout=None):
+        if self._deferred:
+            return self._deferred.pop(0)
+        return self.requests.get(timeout=timeout)
+
+    def _collect(self):
+        """Oldest pending request plus compatible ones that arrive within max_wait"""
+        batch = [self._next_request()]
+        key = batch[0][2:4]
+        deadline = time.perf_counter() + self.max_wait
+        skipped = []
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 and not self._deferred:
+                break
+            try:
+                request = self._next_request(timeout=max(remaining, 0))
+            except queue.Empty:
+                break
+            if request[2:4] == key:
+                batch.append(request)
+            else:
+                skipped.append(request)
+        # Different imgsz/iou goes in a later batch, still ahead of newer requests
+        self._deferred = skipped + self._deferred
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            start = time.perf_counter()
+            try:
+                results = self._predict(batch)
+            except Exception as e:
+                # Every caller gets the error; the thread lives on for the next batch
+                with self._lock:
+                    self.pending -= len(batch)
+                for request in batch:
+                    request[4].set_exception(e)
+                continue
+            finished = time.perf_counter()
+
+            with self._lock:
+                self.pending -= len(batch)
+                self.images += len(batch)
+                self.batches += 1
+                self.inference_times.append(finished - start)
+                self.latencies.extend(finished - request[5] for request in batch)
+            for request, result in zip(batch, results):
+                request[4].set_result(result)
+
+    def _predict(self, batch):
+        """One model call for a batch; NumpyResults per request, at its own confidence"""
+        images = [request[0] for request in batch]
+        imgsz, iou = batch[0][2:4]
+        results = list(self.model(images, conf=min(request[1] for request in batch),
+                                  imgsz=imgsz, iou=iou, verbose=False) or [])
+        if len(results) != len(batch):
+            raise RuntimeError(f"Model returned {len(results)} results for {len(batch)} images")
+
+        outputs = []
+        for request, result in zip(batch, results):
+            image, conf = request[:2]
+            xyxy, scores, cls = boxes_to_arrays(result.boxes)
+            keep = scores >= conf
+            outputs.append(NumpyResults(NumpyBoxes(xyxy[keep], scores[keep], cls[keep]),
+                                        np.shape(image)[:2], getattr(result, "names", {})))
+        return outputs
+
+    def metrics(self):
+        """Queue depth, batching and latency figures (latencies in ms, queueing included)"""
+        with self._lock:
+            latencies = np.array(self.latencies) * 1000
+            inference = np.array(self.inference_times) * 1000
+            metrics = {
+                "queue_depth": self.pending,
+                "max_queue": self.max_queue,
+                "images": self.images,
+                "batches": self.batches,
+                "rejected": self.rejected,
+                "mean_batch": round(self.images / self.batches, 2) if self.batches else 0,
+            }
+        for name, values in (("latency_ms", latencies), ("inference_ms", inference)):
+            metrics[name] = {f"p{q}": round(float(np.percentile(values, q)), 1) if len(values) else None
+                             for q in (50, 95, 99)}
+        return metrics
+
+    def report(self):
+        """One-line batching summary"""
+        mean = self.images / self.batches if self.batches else 0
+        return f"Micro-batching: {self.images} images in {self.batches} model calls ({mean:.1f} per call)"
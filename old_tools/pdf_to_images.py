@@ -12,7 +12,7 @@ import fitz  # PyMuPDF
 from tqdm import tqdm
 import argparse
 
-def convert_pdf_to_images(pdf_path, output_dir, dpi=300):
+def convert_pdf_to_images(pdf_path, output_dir, dpi=300, grayscale=False):
     """
     Convert a single PDF to images, one image per page.
 
@@ -20,6 +20,7 @@ def convert_pdf_to_images(pdf_path, output_dir, dpi=300):
         pdf_path: Path to the PDF file
         output_dir: Directory to save images
         dpi: Resolution for image conversion
+        grayscale: Render with a gray colorspace (single-channel PNG)
 
     Returns:
         List of created image paths
@@ -40,7 +41,8 @@ def convert_pdf_to_images(pdf_path, output_dir, dpi=300):
 
             # Create transformation matrix for higher resolution
             mat = fitz.Matrix(dpi/72, dpi/72)
-            pix = page.get_pixmap(matrix=mat)
+            colorspace = fitz.csGRAY if grayscale else fitz.csRGB
+            pix = page.get_pixmap(matrix=mat, colorspace=colorspace)
 
             # Save image
             image_filename = f"{pdf_name}_page_{page_num + 1:03d}.png"
@@ -63,6 +65,8 @@ def main():
                         help='Output directory for images (default: pdf_images)')
     parser.add_argument('--dpi', type=int, default=300,
                         help='Image resolution in DPI (default: 300)')
+    parser.add_argument('--grayscale', action='store_true',
+                        help='Render pages as single-channel grayscale PNGs')
 
     args = parser.parse_args()
 
@@ -95,7 +99,7 @@ def main():
         print(f"\nProcessing {pdf_path.name} ({i+1}/{total_pdfs})")
 
         # Convert PDF to images
-        images = convert_pdf_to_images(pdf_path, output_dir, args.dpi)
+        images = convert_pdf_to_images(pdf_path, output_dir, args.dpi, args.grayscale)
         total_images += len(images)
 
         if images:
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Prediction Cache
+Content-addressed on-disk cache of model detections, so rerunning the same weights on the same image is free
+"""
+
+import os
+import io
+import json
+import time
+import sqlite3
+import hashlib
+from pathlib import Path
+
+import numpy as np
+
+from detection_progress import file_sha256
+from yolo_labels import result_to_arrays
+from tiled_inference import predict_tiled
+from inference_backends import DEFAULT_IMGSZ, DEFAULT_IOU
+
+DEFAULT_CACHE_DIR = Path(os.environ.get("YOLO_PREDICTION_CACHE", Path.home() / ".cache" / "train_yolo" / "predictions"))
+DEFAULT_MAX_MB = int(os.environ.get("YOLO_PREDICTION_CACHE_MB", 2048))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+"""
+
+# predict_tiled stats that measure model work, not added to stats for pages served from the cache
+_INFERENCE_STATS = ("pages", "tiles", "seconds")
+
+_model_hashes = {}
+
+def model_hash(model_path):
+    """SHA-256 of a weights file, computed once per process"""
+    path = str(Path(model_path).resolve())
+    if path not in _model_hashes:
+        _model_hashes[path] = file_sha256(path)
+    return _model_hashes[path]
+
+def weights_digest(model, model_path):
+    """Hash of the weights behind a loaded model - the server's weights for a RemoteModel"""
+    return getattr(model, "model_hash", None) or model_hash(model_path)
+
+def image_hash(image):
+    """
+    Content hash of a model input
+
+    Paths hash their file bytes; arrays hash their pixels plus shape and dtype,
+    so decoded images, rendered PDF pages and crops are keyed by what the model sees.
+    """
+    if isinstance(image, (str, Path)):
+        return file_sha256(image)
+    image = np.ascontiguousarray(image)
+    digest = hashlib.sha256(f"{image.shape}:{image.dtype}".encode())
+    digest.update(memoryview(image).cast("B"))
+    return digest.hexdigest()
+
+class PredictionCache:
+    """
+    Detections stored as .npz blobs under cache_dir, indexed in SQLite
+
+    Entries are evicted least-recently-used first once their total size passes
+    max_mb. Several processes can share one cache directory.
+    """
+
+    def __init__(self, cache_dir=None, max_mb=None):
+        self.cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR)
+        self.max_bytes = int((DEFAULT_MAX_MB if max_mb is None else max_mb) * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.cache_dir / "index.sqlite"), timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    @staticmethod
+    def key(image_digest, weights_digest, imgsz, conf, iou, variant=None):
+        """Cache key for one image, model and set of inference parameters"""
+        parts = [image_digest, weights_digest, str(imgsz), f"{float(conf):.6f}", f"{float(iou):.6f}"]
+        if variant:
+            parts.append(repr(variant))
+        return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.npz"
+
+    def get(self, key, with_info=False):
+        """
+        (xyxy, conf, cls) for a key, or None on a miss
+
+        with_info returns ((xyxy, conf, cls), info) instead, info being the dict
+        stored with put (empty for entries stored without one).
+        """
+        path = self._path(key)
+        try:
+            with np.load(str(path)) as data:
+                arrays = (data["xyxy"], data["conf"], data["cls"])
+                info = json.loads(str(data["info"])) if "info" in data.files else {}
+        except (OSError, KeyError, ValueError):
+            self.misses += 1
+            return None
+
+        self.conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        self.conn.commit()
+        self.hits += 1
+        return (arrays, info) if with_info else arrays
+
+    def put(self, key, xyxy, conf, cls, info=None):
+        """Store detections (plus an optional JSON-serializable info dict) for a key, then evict down to the size cap"""
+        buffer = io.BytesIO()
+        extra = {"info": np.array(json.dumps(info))} if info else {}
+        np.savez(buffer, xyxy=np.asarray(xyxy, np.float32).reshape(-1, 4),
+                 conf=np.asarray(conf, np.float32).reshape(-1), cls=np.asarray(cls).reshape(-1).astype(int), **extra)
+
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_bytes(buffer.getvalue())
+        os.replace(tmp_path, path)
+
+        self.conn.execute("INSERT OR REPLACE INTO entries (key, size, last_used) VALUES (?, ?, ?)",
+                          (key, buffer.tell(), time.time()))
+        self.conn.commit()
+        self.evict()
+
+    def fetch(self, key, compute):
+        """Cached (xyxy, conf, cls) for a key, calling compute() and storing its result on a miss"""
+        arrays = self.get(key)
+        if arrays is None:
+            arrays = compute()
+            self.put(key, *arrays)
+        return arrays
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits max_bytes"""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for key, size in self.conn.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall():
+            self._path(key).unlink(missing_ok=True)
+            self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self.conn.commit()
+
+    def report(self):
+        """One-line hit/miss summary"""
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups * 100 if lookups else 0
+        return f"Prediction cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate) in {self.cache_dir}"
+
+    def close(self):
+        self.conn.close()
+
+def cached_predict(model, image, conf, cache=None, weights_digest=None,
+                   imgsz=DEFAULT_IMGSZ, iou=DEFAULT_IOU):
+    """
+    Run the model on one image (path or array) through the cache
+
+    Without a cache (or weights hash) this is a plain model call.
+
+    Returns:
+        (xyxy, conf, cls) numpy arrays
+    """
+    def compute():
+        return result_to_arrays(model(image, conf=conf, imgsz=imgsz, iou=iou, verbose=False))
+
+    if cache is None or weights_digest is None:
+        return compute()
+    return cache.fetch(PredictionCache.key(image_hash(image), weights_digest, imgsz, conf, iou), compute)
+
+def cached_predict_tiled(model, image, confidence, tile_size, overlap=0.2, batch_size=8, merge="nms",
+                         stats=None, skip_blank=True, cache=None, weights_digest=None):
+    """
+    predict_tiled through the cache, keyed on the whole page plus the tiling settings
+
+    The page's stats are stored with its detections. On a hit they are added
+    to stats as well, except the inference counters (pages, tiles, seconds),
+    so throughput covers real model work; the page counts as cached_pages.
+    """
+    if cache is None or weights_digest is None:
+        return predict_tiled(model, image, confidence, tile_size, overlap, batch_size, merge,
+                             stats=stats, skip_blank=skip_blank)
+
+    key = PredictionCache.key(image_hash(image), weights_digest, tile_size, confidence, DEFAULT_IOU,
+                              ("tiled", overlap, merge, skip_blank))
+    cached = cache.get(key, with_info=True)
+    if cached is None:
+        page_stats = {}
+        arrays = predict_tiled(model, image, confidence, tile_size, overlap, batch_size, merge,
+                               stats=page_stats, skip_blank=skip_blank)
+        cache.put(key, *arrays, info=page_stats)
+    else:
+        arrays, page_stats = cached
+        page_stats = {name: value for name, value in page_stats.items() if name not in _INFERENCE_STATS}
+        page_stats["cached_pages"] = 1
+
+    if stats is not None:
+        for name, value in page_stats.items():
+            stats[name] = stats.get(name, 0) + value
+    return arrays
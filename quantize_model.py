@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+INT8 Model Quantization
+Exports best.pt to ONNX, quantizes it to static INT8 calibrated on labeled pages,
+and publishes it only if mAP stays within a threshold of the FP32 model
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import resource
+import argparse
+import multiprocessing
+from pathlib import Path
+
+import numpy as np
+
+from image_io import read_image
+from inference_backends import DEFAULT_IMGSZ, DEFAULT_IOU, OnnxRuntimeModel, export_onnx, preprocess
+from tiled_inference import box_overlap
+
+sys.path.append(str(Path(__file__).resolve().parent / "utilities"))
+import class_balance
+from dataset_split import stratified_group_split
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+CALIBRATION_METHODS = ("minmax", "entropy", "percentile")
+
+# mAP@0.5:0.95 thresholds, as in COCO / ultralytics val
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+def find_labeled_pages(label_dirs, image_dirs=()):
+    """
+    Pair YOLO label files with their images
+
+    Images are looked up next to the label (or in a sibling images/ folder for
+    labels/ directories), then in image_dirs. Labels without an image are skipped.
+    A page labeled in several directories is kept once, with its newest label file.
+    """
+    pages = {}
+    for label_dir in map(Path, label_dirs):
+        search_dirs = [label_dir]
+        if label_dir.name == "labels":
+            search_dirs.append(label_dir.parent / "images")
+        search_dirs += [Path(d) for d in image_dirs]
+
+        for label_path in sorted(label_dir.glob("*.txt")):
+            for directory in search_dirs:
+                image_path = next((directory / f"{label_path.stem}{ext}" for ext in IMAGE_EXTENSIONS
+                                   if (directory / f"{label_path.stem}{ext}").exists()), None)
+                if image_path is not None:
+                    current = pages.get(label_path.stem)
+                    if current is None or label_path.stat().st_mtime > current[1].stat().st_mtime:
+                        pages[label_path.stem] = (image_path, label_path)
+                    break
+    return [pages[stem] for stem in sorted(pages)]
+
+def split_pages(pages, eval_size, calib_size, seed=0):
+    """
+    (calibration pages, held-out pages) with no document on both sides
+
+    Pages of one drawing and augmented copies of one page stay together
+    (dataset_split.stratified_group_split), so the mAP gate is measured on
+    drawings the calibration never saw.
+    """
+    by_stem = {label_path.stem: (image_path, label_path) for image_path, label_path in pages}
+    index = class_balance.index_for([label_path for _, label_path in pages])
+    val_ratio = min(eval_size, len(pages) // 2) / len(pages)
+    splits, _ = stratified_group_split(index, val_ratio, seed)
+    calib_pages = [by_stem[stem] for stem in splits["train"]]
+    random.Random(seed).shuffle(calib_pages)
+    return calib_pages[:calib_size], [by_stem[stem] for stem in splits["val"]]
+
+def load_ground_truth(label_path, img_width, img_height):
+    """(xyxy, cls) pixel boxes from a YOLO label file"""
+    rows = np.loadtxt(label_path, ndmin=2).reshape(-1, 5)
+    xyxy = np.empty((len(rows), 4))
+    xyxy[:, 0] = (rows[:, 1] - rows[:, 3] / 2) * img_width
+    xyxy[:, 1] = (rows[:, 2] - rows[:, 4] / 2) * img_height
+    xyxy[:, 2] = (rows[:, 1] + rows[:, 3] / 2) * img_width
+    xyxy[:, 3] = (rows[:, 2] + rows[:, 4] / 2) * img_height
+    return xyxy, rows[:, 0].astype(int)
+
+def match_predictions(pred_xyxy, pred_conf, pred_cls, gt_xyxy, gt_cls):
+    """(num_preds, num_iou_thresholds) true-positive matrix, greedy by confidence per threshold"""
+    tp = np.zeros((len(pred_xyxy), len(IOU_THRESHOLDS)), dtype=bool)
+    if len(pred_xyxy) == 0 or len(gt_xyxy) == 0:
+        return tp
+
+    ious = np.stack([box_overlap(box, gt_xyxy, metric="iou") for box in pred_xyxy])
+    ious[pred_cls[:, None] != gt_cls[None, :]] = 0
+    order = pred_conf.argsort()[::-1]
+    for t, threshold in enumerate(IOU_THRESHOLDS):
+        taken = np.zeros(len(gt_xyxy), dtype=bool)
+        for i in order:
+            candidates = np.where(~taken & (ious[i] >= threshold))[0]
+            if len(candidates):
+                best = candidates[ious[i, candidates].argmax()]
+                taken[best] = True
+                tp[i, t] = True
+    return tp
+
+def average_precision(recall, precision):
+    """101-point interpolated AP (COCO)"""
+    recall = np.concatenate(([0.0], recall, [1.0]))
+    precision = np.concatenate(([1.0], precision, [0.0]))
+    precision = np.flip(np.maximum.accumulate(np.flip(precision)))
+    return float(np.interp(np.linspace(0, 1, 101), recall, precision).mean())
+
+def compute_map(detections, ground_truth):
+    """
+    mAP@0.5 and mAP@0.5:0.95 over a set of images
+
+    detections and ground_truth are per-image lists of (xyxy, conf, cls) and (xyxy, cls).
+    """
+    all_tp, all_conf, all_cls, gt_classes = [], [], [], []
+    for (pred_xyxy, pred_conf, pred_cls), (gt_xyxy, gt_cls) in zip(detections, ground_truth):
+        pred_cls = pred_cls.astype(int)
+        all_tp.append(match_predictions(pred_xyxy, pred_conf, pred_cls, gt_xyxy, gt_cls))
+        all_conf.append(pred_conf)
+        all_cls.append(pred_cls)
+        gt_classes.append(gt_cls)
+
+    tp = np.concatenate(all_tp) if all_tp else np.zeros((0, len(IOU_THRESHOLDS)), bool)
+    conf = np.concatenate(all_conf) if all_conf else np.zeros(0)
+    cls = np.concatenate(all_cls) if all_cls else np.zeros(0, int)
+    gt_cls = np.concatenate(gt_classes) if gt_classes else np.zeros(0, int)
+
+    ap = []
+    for class_id in np.unique(gt_cls):
+        mask = cls == class_id
+        order = conf[mask].argsort()[::-1]
+        class_tp = tp[mask][order]
+        n_gt = int((gt_cls == class_id).sum())
+        tp_cum = class_tp.cumsum(0)
+        fp_cum = (~class_tp).cumsum(0)
+        recall = tp_cum / n_gt
+        precision = tp_cum / np.maximum(tp_cum + fp_cum, 1)
+        ap.append([average_precision(recall[:, t], precision[:, t]) for t in range(len(IOU_THRESHOLDS))])
+
+    if not ap:
+        return 0.0, 0.0
+    ap = np.array(ap)
+    return float(ap[:, 0].mean()), float(ap.mean())
+
+class PageCalibrationReader:
+    """Feeds letterboxed pages to onnxruntime's static quantization calibrator"""
+
+    def __init__(self, image_paths, input_name, imgsz):
+        self.image_paths = list(image_paths)
+        self.input_name = input_name
+        self.shape = (imgsz, imgsz)
+        self.index = 0
+
+    def get_next(self):
+        while self.index < len(self.image_paths):
+            image = read_image(self.image_paths[self.index])
+            self.index += 1
+            if image is not None:
+                return {self.input_name: preprocess(image, self.shape)[0][None]}
+        return None
+
+    def rewind(self):
+        self.index = 0
+
+def quantize_int8(fp32_path, int8_path, calibration_images, imgsz, method="minmax"):
+    """Static QDQ INT8 quantization (per-channel weights, uint8 activations)"""
+    import onnxruntime as ort
+    from onnxruntime.quantization import (CalibrationMethod, QuantFormat, QuantType, quantize_static)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    prepared_path = int8_path.with_name(f"{fp32_path.stem}_prep.onnx")
+    # The export is static-shaped, so plain ONNX shape inference is enough
+    quant_pre_process(str(fp32_path), str(prepared_path), skip_symbolic_shape=True)
+
+    input_name = ort.InferenceSession(str(prepared_path), providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    calibration_method = {"minmax": CalibrationMethod.MinMax, "entropy": CalibrationMethod.Entropy,
+                          "percentile": CalibrationMethod.Percentile}[method]
+
+    quantize_static(str(prepared_path), str(int8_path),
+                    PageCalibrationReader(calibration_images, input_name, imgsz),
+                    quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                    calibrate_method=calibration_method)
+    prepared_path.unlink(missing_ok=True)
+    return int8_path
+
+def _evaluate_worker(model_path, image_paths, imgsz, threads, warmup):
+    """
+    Child process: load one model, run the eval set, report detections, latency and peak memory
+
+    Running each model in its own process keeps the peak RSS numbers separate.
+    """
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    model = OnnxRuntimeModel(model_path, threads)
+
+    images = [read_image(path) for path in image_paths]
+    for image in images[:warmup]:
+        model(image, conf=0.001, imgsz=imgsz, iou=DEFAULT_IOU)
+
+    detections, latencies = [], []
+    for image in images:
+        start = time.perf_counter()
+        result = model(image, conf=0.001, imgsz=imgsz, iou=DEFAULT_IOU)[0]
+        latencies.append(time.perf_counter() - start)
+        detections.append((result.boxes.xyxy.numpy(), result.boxes.conf.numpy(), result.boxes.cls.numpy()))
+
+    # ru_maxrss is KB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    return detections, latencies, peak_rss, rss_before * scale
+
+def evaluate(model_path, image_paths, imgsz, threads, warmup=3):
+    """Detections, latencies and memory for one model, measured in a fresh process"""
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        return pool.apply(_evaluate_worker, (str(model_path), [str(p) for p in image_paths], imgsz, threads, warmup))
+
+def summarize(name, model_path, detections, latencies, peak_rss, base_rss, ground_truth):
+    """Accuracy, latency and memory figures for one model"""
+    map50, map50_95 = compute_map(detections, ground_truth)
+    return {
+        "model": str(model_path),
+        "file_mb": round(Path(model_path).stat().st_size / 1e6, 2),
+        "map50": round(map50, 4),
+        "map50_95": round(map50_95, 4),
+        "latency_ms_mean": round(float(np.mean(latencies)) * 1000, 2),
+        "latency_ms_p95": round(float(np.percentile(latencies, 95)) * 1000, 2),
+        "peak_rss_mb": round(peak_rss / 1e6, 1),
+        "model_rss_mb": round((peak_rss - base_rss) / 1e6, 1),
+        "name": name,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the detector to INT8 with an mAP gate")
+    parser.add_argument("--model", default="models/best.pt", help="PyTorch weights to export")
+    parser.add_argument("--labels", nargs="+",
+                        default=[str(p) for p in sorted(Path("old_datasets").glob("*")) if p.is_dir()],
+                        help="Labeled page directories (default: every folder in old_datasets)")
+    parser.add_argument("--images", nargs="*", default=[], help="Extra directories to find page images in")
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ, help="Export/inference image size")
+    parser.add_argument("--calib_size", type=int, default=100, help="Pages used for calibration")
+    parser.add_argument("--eval_size", type=int, default=100, help="Held-out pages used for mAP")
+    parser.add_argument("--calib_method", choices=CALIBRATION_METHODS, default="minmax")
+    parser.add_argument("--max_map_drop", type=float, default=0.01,
+                        help="Largest allowed absolute mAP@0.5:0.95 drop vs FP32 before refusing to publish")
+    parser.add_argument("--threads", type=int, default=None, help="ONNX Runtime threads for the benchmark")
+    parser.add_argument("--output", default=None, help="Published INT8 model path (default: <model>_int8.onnx)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the calibration/eval split")
+    args = parser.parse_args()
+
+    model_path = Path(args.model)
+    if not model_path.exists():
+        print(f"❌ Model not found: {model_path}")
+        sys.exit(1)
+    output_path = Path(args.output) if args.output else model_path.with_name(f"{model_path.stem}_int8.onnx")
+
+    # Calibration and held-out evaluation pages from different drawings
+    pages = find_labeled_pages(args.labels, args.images)
+    if len(pages) < 2:
+        print(f"❌ Found {len(pages)} labeled pages with images in {', '.join(args.labels)} "
+              f"- point --images at the page images")
+        sys.exit(1)
+    calib_pages, eval_pages = split_pages(pages, args.eval_size, args.calib_size, args.seed)
+    if not calib_pages or not eval_pages:
+        print(f"❌ The {len(pages)} labeled pages come from too few drawings to hold some out")
+        sys.exit(1)
+    print(f"📄 {len(pages)} labeled pages: {len(calib_pages)} for calibration, {len(eval_pages)} held out")
+
+    # FP32 export, static shape so calibration and benchmarking see the same graph. A copy of
+    # the weights is exported inside work_dir, so the <model>.onnx the backends load is untouched
+    print(f"📦 Exporting {model_path} to ONNX (imgsz {args.imgsz})...")
+    work_dir = output_path.parent / f".{output_path.stem}_work"
+    work_dir.mkdir(parents=True, exist_ok=True)
+    weights_copy = work_dir / model_path.name
+    shutil.copy2(model_path, weights_copy)
+    exported = export_onnx(weights_copy, args.imgsz, dynamic=False)
+    fp32_path = work_dir / f"{model_path.stem}_fp32.onnx"
+    os.replace(exported, fp32_path)
+
+    print(f"🔢 Calibrating INT8 ({args.calib_method}) on {len(calib_pages)} pages...")
+    int8_path = quantize_int8(fp32_path, work_dir / output_path.name, [p[0] for p in calib_pages],
+                              args.imgsz, args.calib_method)
+
+    # Evaluate both models on the held-out pages
+    eval_images = [p[0] for p in eval_pages]
+    ground_truth = []
+    for image_path, label_path in eval_pages:
+        height, width = read_image(image_path).shape[:2]
+        ground_truth.append(load_ground_truth(label_path, width, height))
+
+    report = {}
+    for name, path in (("fp32", fp32_path), ("int8", int8_path)):
+        print(f"📏 Evaluating {name}...")
+        detections, latencies, peak_rss, base_rss = evaluate(path, eval_images, args.imgsz, args.threads)
+        report[name] = summarize(name, path, detections, latencies, peak_rss, base_rss, ground_truth)
+
+    fp32, int8 = report["fp32"], report["int8"]
+    map_drop = fp32["map50_95"] - int8["map50_95"]
+    report["map50_95_drop"] = round(map_drop, 4)
+    report["max_map_drop"] = args.max_map_drop
+    report["speedup"] = round(fp32["latency_ms_mean"] / max(int8["latency_ms_mean"], 1e-9), 2)
+    report["calibration"] = {"method": args.calib_method, "pages": len(calib_pages), "seed": args.seed}
+    report["eval_pages"] = len(eval_pages)
+
+    print(f"\n{'':8}{'mAP50':>8}{'mAP50-95':>10}{'ms/img':>9}{'p95 ms':>9}{'file MB':>9}{'model RSS MB':>14}")
+    for row in (fp32, int8):
+        print(f"{row['name']:8}{row['map50']:>8.4f}{row['map50_95']:>10.4f}{row['latency_ms_mean']:>9.1f}"
+              f"{row['latency_ms_p95']:>9.1f}{row['file_mb']:>9.1f}{row['model_rss_mb']:>14.1f}")
+    print(f"\n⚡ INT8 speedup: {report['speedup']:.2f}x, "
+          f"file {fp32['file_mb'] / max(int8['file_mb'], 1e-9):.1f}x smaller, "
+          f"mAP50-95 drop {map_drop:+.4f} (limit {args.max_map_drop})")
+
+    report["published"] = map_drop <= args.max_map_drop
+    report_path = output_path.with_suffix(".json")
+    if report["published"]:
+        shutil.move(str(int8_path), output_path)
+        report["int8"]["model"] = str(output_path)
+        print(f"✅ Published {output_path}")
+    else:
+        print(f"❌ Accuracy drop too large - {output_path} not published")
+
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"📝 Report written to {report_path}")
+    shutil.rmtree(work_dir, ignore_errors=True)
+    sys.exit(0 if report["published"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Label Conversion Microbenchmark
+Per-box detection-to-YOLO conversion vs the vectorized yolo_labels path on dense pages,
+and the label writer vs np.savetxt
+"""
+
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from yolo_labels import LABEL_FORMAT, boxes_to_arrays, xyxy_to_yolo, write_yolo_labels
+
+class SyntheticBoxes:
+    """Stand-in for ultralytics Boxes: xyxy, conf and cls torch tensors on a device"""
+
+    def __init__(self, torch, count, img_width, img_height, device="cpu", seed=0):
+        rng = np.random.default_rng(seed)
+        x1 = rng.uniform(0, img_width - 60, count)
+        y1 = rng.uniform(0, img_height - 60, count)
+        xyxy = np.stack([x1, y1, x1 + rng.uniform(5, 60, count), y1 + rng.uniform(5, 60, count)], 1)
+        self.xyxy = torch.tensor(xyxy, dtype=torch.float32, device=device)
+        self.conf = torch.tensor(rng.uniform(0.25, 1.0, count), dtype=torch.float32, device=device)
+        self.cls = torch.tensor(rng.integers(0, 4, count), dtype=torch.float32, device=device)
+
+    def __len__(self):
+        return len(self.xyxy)
+
+def device_sync(torch, device):
+    """Wait for queued work on an accelerator so it isn't billed to the next timing"""
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    elif device == "mps":
+        torch.mps.synchronize()
+
+def per_box(boxes, img_width, img_height, label_path):
+    """The previous conversion: three host transfers and one formatted write per box"""
+    labels = []
+    for i in range(len(boxes)):
+        x1, y1, x2, y2 = boxes.xyxy[i].cpu().numpy()
+        confidence_score = boxes.conf[i].cpu().numpy()
+        class_id = int(boxes.cls[i].cpu().numpy())
+        labels.append([class_id, ((x1 + x2) / 2) / img_width, ((y1 + y2) / 2) / img_height,
+                       (x2 - x1) / img_width, (y2 - y1) / img_height])
+
+    with open(label_path, 'w') as f:
+        for class_id, x_center, y_center, width, height in labels:
+            f.write(f"{class_id} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n")
+    return labels
+
+def vectorized(boxes, img_width, img_height, label_path):
+    """yolo_labels: one transfer per field and a single write"""
+    xyxy, _, cls = boxes_to_arrays(boxes)
+    labels = xyxy_to_yolo(xyxy, cls, img_width, img_height)
+    write_yolo_labels(label_path, labels)
+    return labels
+
+def savetxt(label_path, labels):
+    """The writer yolo_labels used before: np.savetxt, one formatted row at a time"""
+    np.savetxt(str(label_path), labels, fmt=LABEL_FORMAT)
+
+def time_it(function, args, warmup, repeats, sync=None):
+    """
+    Median and interquartile range of the wall time over repeats, in milliseconds
+
+    warmup calls run first and are not timed; sync (if given) runs before every timed call.
+    """
+    for _ in range(warmup):
+        function(*args)
+    times = []
+    for _ in range(repeats):
+        if sync:
+            sync()
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    q1, median, q3 = np.percentile(np.array(times) * 1000, [25, 50, 75])
+    return median, q3 - q1
+
+def print_row(count, old, new):
+    """One table row: median ± IQR for both paths and the ratio of the medians"""
+    print(f"   {count:>6}  {old[0]:>8.3f} ±{old[1]:<6.3f}  {new[0]:>8.3f} ±{new[1]:<6.3f}  "
+          f"{old[0] / new[0]:>6.1f}x")
+
+def benchmark_writer(counts, tmp_dir, warmup, repeats):
+    """np.savetxt vs write_yolo_labels on random label rows; both must write the same bytes"""
+    old_path = Path(tmp_dir) / "savetxt.txt"
+    new_path = Path(tmp_dir) / "write_yolo_labels.txt"
+    rng = np.random.default_rng(0)
+
+    print("   Label writer (np.savetxt vs write_yolo_labels)\n")
+    print(f"   {'rows':>6}  {'savetxt ms':>15}  {'writer ms':>15}  {'speedup':>7}")
+    for count in counts:
+        labels = np.column_stack([rng.integers(0, 4, count), rng.random((count, 4))])
+        old = time_it(savetxt, (old_path, labels), warmup, repeats)
+        new = time_it(write_yolo_labels, (new_path, labels), warmup, repeats)
+        if old_path.read_bytes() != new_path.read_bytes():
+            print(f"❌ Writer output differs from np.savetxt at {count} rows")
+            return False
+        print_row(count, old, new)
+    return True
+
+def benchmark_conversion(torch, counts, tmp_dir, args):
+    """Per-box vs vectorized conversion of torch Boxes; both must write the same labels"""
+    old_path = Path(tmp_dir) / "per_box.txt"
+    new_path = Path(tmp_dir) / "vectorized.txt"
+    sync = lambda: device_sync(torch, args.device)
+
+    print(f"   Conversion (torch {torch.__version__} on {args.device}, page {args.width}x{args.height})\n")
+    print(f"   {'boxes':>6}  {'per-box ms':>15}  {'vectorized ms':>15}  {'speedup':>7}")
+    for count in counts:
+        boxes = SyntheticBoxes(torch, count, args.width, args.height, args.device)
+        call_args = (boxes, args.width, args.height)
+        old = time_it(per_box, call_args + (old_path,), args.warmup, args.repeats, sync)
+        new = time_it(vectorized, call_args + (new_path,), args.warmup, args.repeats, sync)
+
+        # Both paths must write the same labels (the old path rounds in float32)
+        old_labels = np.loadtxt(old_path, ndmin=2)
+        new_labels = np.loadtxt(new_path, ndmin=2)
+        if old_labels.shape != new_labels.shape or not np.allclose(old_labels, new_labels, atol=1e-5):
+            print(f"❌ Output mismatch at {count} boxes")
+            return False
+        print_row(count, old, new)
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detection-to-YOLO label conversion")
+    parser.add_argument("--boxes", type=int, nargs="+", default=[50, 500, 2000],
+                        help="Detections per page to benchmark")
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed calls before each measurement")
+    parser.add_argument("--repeats", type=int, default=100,
+                        help="Timed calls per measurement (median ± IQR is reported)")
+    parser.add_argument("--device", default="cpu", help="Torch device holding the boxes (cpu, cuda, mps)")
+    parser.add_argument("--width", type=int, default=4960, help="Page width in pixels")
+    parser.add_argument("--height", type=int, default=3508, help="Page height in pixels")
+    args = parser.parse_args()
+
+    print("🧪 Label conversion benchmark\n")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if not benchmark_writer(args.boxes, tmp_dir, args.warmup, args.repeats):
+            sys.exit(1)
+        print()
+
+        try:
+            import torch
+        except ImportError:
+            print("⏭️  torch not installed - skipping the per-box vs vectorized conversion benchmark")
+            print("\n✅ Writer output matches np.savetxt")
+            return
+        if not benchmark_conversion(torch, args.boxes, tmp_dir, args):
+            sys.exit(1)
+
+    print("\n✅ Labels match for every page size")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Photometric Augmentation Benchmark
+Float32 arithmetic vs the uint8 lookup-table path in utilities/photometric.py:
+wall time and peak RSS per op on a full-size page
+"""
+
+import sys
+import time
+import resource
+import argparse
+import multiprocessing
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "utilities"))
+import photometric
+
+# The previous implementations: full-image float32 copy, arithmetic, clip, cast back
+def float_brightness(image, factor):
+    return np.clip(image.astype(np.float32) * factor, 0, 255).astype(np.uint8)
+
+def float_contrast(image, factor):
+    return np.clip((image.astype(np.float32) - 127.5) * factor + 127.5, 0, 255).astype(np.uint8)
+
+def float_noise(image, noise_factor, rng):
+    noise = rng.standard_normal(image.shape, dtype=np.float32) * noise_factor
+    return np.clip(image.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+
+CHAIN = [["brightness", 1.3], ["contrast", 1.3], ["brightness", 0.7]]
+
+def run_case(case, path, image):
+    """One op on image; the same seed for both paths so noise can be compared"""
+    rng = np.random.default_rng(0)
+    if case == "brightness":
+        return float_brightness(image, 1.3) if path == "float" else photometric.adjust_brightness(image, 1.3)
+    if case == "contrast":
+        return float_contrast(image, 1.3) if path == "float" else photometric.adjust_contrast(image, 1.3)
+    if case == "noise":
+        return float_noise(image, 20, rng) if path == "float" else photometric.add_noise(image, 20, rng)
+    if case == "chain":
+        if path == "float":
+            return float_brightness(float_contrast(float_brightness(image, 1.3), 1.3), 0.7)
+        return photometric.apply_lut(image, photometric.chain_lut(CHAIN))
+    raise ValueError(case)
+
+def synthetic_page(width, height, channels):
+    """White page with black line work, built without temporaries"""
+    page = np.full((height, width, channels) if channels > 1 else (height, width), 255, np.uint8)
+    for i in range(0, min(width, height), 97):
+        cv2.line(page, (i, 0), (width - 1, height - 1 - i), 0, 3)
+        cv2.rectangle(page, (i, i), (i + 80, i + 40), 0, 2)
+    return page
+
+def _case_worker(case, path, width, height, channels, repeats):
+    """
+    Child process: time one case and report how far it pushed peak RSS above the page itself
+
+    A fresh process per case keeps the peak RSS numbers separate.
+    """
+    cv2.setNumThreads(1)
+    image = synthetic_page(width, height, channels)
+    # ru_maxrss is KB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = run_case(case, path, image)
+        best = min(best, time.perf_counter() - start)
+        del output
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    return best * 1000, (peak_rss - rss_before) / 1e6
+
+def measure(case, path, width, height, channels, repeats):
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        return pool.apply(_case_worker, (case, path, width, height, channels, repeats))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark float32 vs LUT photometric augmentations")
+    parser.add_argument("--width", type=int, default=6000, help="Page width in pixels")
+    parser.add_argument("--height", type=int, default=4000, help="Page height in pixels")
+    parser.add_argument("--channels", type=int, choices=(1, 3), default=3, help="3 = BGR, 1 = --grayscale")
+    parser.add_argument("--repeats", type=int, default=5, help="Timing repeats (best is reported)")
+    parser.add_argument("--cases", nargs="+", default=["brightness", "contrast", "noise", "chain"],
+                        choices=["brightness", "contrast", "noise", "chain"])
+    args = parser.parse_args()
+
+    # Both paths must produce the same pixels before their speed means anything
+    check = synthetic_page(640, 480, args.channels)
+    for case in args.cases:
+        if not np.array_equal(run_case(case, "float", check), run_case(case, "lut", check)):
+            print(f"❌ Output mismatch for {case}")
+            sys.exit(1)
+
+    page_mb = args.width * args.height * args.channels / 1e6
+    print("🧪 Photometric augmentation benchmark")
+    print(f"   Page {args.width}x{args.height}x{args.channels} ({page_mb:.0f} MB), best of {args.repeats}")
+    print(f"   Peak RSS is the growth above the loaded page (the output image is included)\n")
+    print(f"   {'op':<11}{'float ms':>10}{'LUT ms':>9}{'speedup':>9}{'float MB':>10}{'LUT MB':>9}")
+
+    for case in args.cases:
+        float_ms, float_mb = measure(case, "float", args.width, args.height, args.channels, args.repeats)
+        lut_ms, lut_mb = measure(case, "lut", args.width, args.height, args.channels, args.repeats)
+        print(f"   {case:<11}{float_ms:>10.1f}{lut_ms:>9.1f}{float_ms / lut_ms:>8.1f}x{float_mb:>10.0f}{lut_mb:>9.0f}")
+
+    print("\n✅ Outputs match for every op")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Inference Backend Parity Test
+Checks ONNX Runtime / OpenVINO detections against the PyTorch model on the same images
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from image_io import read_image, to_model_input
+from yolo_labels import result_to_arrays
+from inference_backends import BACKENDS, DEFAULT_IMGSZ, DEFAULT_IOU, load_model
+from tiled_inference import box_overlap
+
+def match_detections(reference, candidate, min_iou=0.9):
+    """
+    Greedily pair boxes of the same class by IoU
+
+    Returns:
+        (matched pairs as (ref_index, cand_index), unmatched reference count, unmatched candidate count)
+    """
+    ref_xyxy, ref_conf, ref_cls = reference
+    cand_xyxy, _, cand_cls = candidate
+    used = np.zeros(len(cand_xyxy), dtype=bool)
+    pairs = []
+
+    for i in ref_conf.argsort()[::-1]:
+        if len(cand_xyxy) == 0:
+            break
+        iou = box_overlap(ref_xyxy[i], cand_xyxy, metric="iou")
+        iou[(cand_cls != ref_cls[i]) | used] = 0
+        best = int(iou.argmax())
+        if iou[best] >= min_iou:
+            used[best] = True
+            pairs.append((i, best))
+
+    return pairs, len(ref_xyxy) - len(pairs), len(cand_xyxy) - len(pairs)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare exported-model backends with PyTorch")
+    parser.add_argument("images", nargs="+", help="Image files or directories of PNG/JPG images")
+    parser.add_argument("--model", default="models/best.pt", help="PyTorch weights (best.onnx must sit next to it)")
+    parser.add_argument("--backend", choices=[b for b in BACKENDS if b != "torch"], default="onnxruntime")
+    parser.add_argument("--conf", type=float, default=0.25, help="Confidence threshold for both runs")
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ)
+    parser.add_argument("--min_match", type=float, default=0.98,
+                        help="Fraction of boxes that must match (same class, IoU >= 0.9)")
+    parser.add_argument("--max_conf_diff", type=float, default=0.02,
+                        help="Largest allowed confidence difference between matched boxes")
+    args = parser.parse_args()
+
+    image_paths = []
+    for entry in map(Path, args.images):
+        if entry.is_dir():
+            image_paths += sorted(p for p in entry.iterdir() if p.suffix.lower() in (".png", ".jpg", ".jpeg"))
+        else:
+            image_paths.append(entry)
+
+    print(f"🤖 Loading PyTorch and {args.backend} models...")
+    reference_model = load_model(args.model, "torch")
+    candidate_model = load_model(args.model, args.backend)
+
+    total_ref = total_matched = total_extra = 0
+    conf_diffs, coord_diffs = [], []
+    times = {"torch": 0.0, args.backend: 0.0}
+
+    for image_path in image_paths:
+        image = to_model_input(read_image(image_path))
+
+        start = time.perf_counter()
+        reference = result_to_arrays(reference_model(image, conf=args.conf, imgsz=args.imgsz,
+                                                     iou=DEFAULT_IOU, verbose=False))
+        times["torch"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        candidate = result_to_arrays(candidate_model(image, conf=args.conf, imgsz=args.imgsz,
+                                                     iou=DEFAULT_IOU, verbose=False))
+        times[args.backend] += time.perf_counter() - start
+
+        pairs, missing, extra = match_detections(reference, candidate)
+        total_ref += len(reference[0])
+        total_matched += len(pairs)
+        total_extra += extra
+        for i, j in pairs:
+            conf_diffs.append(abs(float(reference[1][i]) - float(candidate[1][j])))
+            coord_diffs.append(float(np.abs(reference[0][i] - candidate[0][j]).max()))
+
+        print(f"   {image_path.name}: {len(reference[0])} torch / {len(candidate[0])} {args.backend}, "
+              f"{len(pairs)} matched, {missing} missing, {extra} extra")
+
+    match_rate = total_matched / total_ref if total_ref else 1.0
+    max_conf_diff = max(conf_diffs, default=0.0)
+    max_coord_diff = max(coord_diffs, default=0.0)
+
+    print(f"\n📊 Parity over {len(image_paths)} images:")
+    print(f"   Matched boxes: {total_matched}/{total_ref} ({match_rate:.1%}), {total_extra} extra")
+    print(f"   Max confidence difference: {max_conf_diff:.4f}")
+    print(f"   Max coordinate difference: {max_coord_diff:.2f}px")
+    for backend, seconds in times.items():
+        print(f"   {backend}: {seconds / max(len(image_paths), 1) * 1000:.1f} ms/image")
+
+    if match_rate < args.min_match or max_conf_diff > args.max_conf_diff:
+        print("❌ Backends disagree beyond tolerance")
+        sys.exit(1)
+    print("✅ Backends agree")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Geometric Box Transform Property Test
+Draws each box on a blank mask, pushes mask and labels through every transform in
+utilities/geometric.py, and checks that the transformed box still frames the drawn one
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "utilities"))
+import geometric
+
+# Linear interpolation and thresholding may move a drawn edge by about a pixel
+EDGE_TOLERANCE = 1.5
+
+def random_labels(rng, width, height, count):
+    """Boxes on whole pixels (so the drawing is exact), some of them touching the border"""
+    x1 = rng.integers(0, width - 8, count)
+    y1 = rng.integers(0, height - 8, count)
+    x2 = np.minimum(x1 + rng.integers(8, max(9, width // 2), count), width)
+    y2 = np.minimum(y1 + rng.integers(8, max(9, height // 2), count), height)
+    xyxy = np.column_stack([x1, y1, x2, y2])
+    return np.column_stack([rng.integers(0, 4, count), geometric.xyxy_to_yolo(xyxy, width, height)])
+
+def draw(labels, width, height):
+    """Single-channel mask with each box filled"""
+    mask = np.zeros((height, width), np.uint8)
+    for x1, y1, x2, y2 in np.round(geometric.yolo_to_xyxy(labels[:, 1:], width, height)).astype(int):
+        mask[y1:y2, x1:x2] = 255
+    return mask
+
+def drawn_box(mask):
+    """Pixel x1, y1, x2, y2 framing the mask's set pixels, and how many are set"""
+    ys, xs = np.nonzero(mask >= 128)
+    if len(xs) == 0:
+        return None, 0
+    return np.array([xs.min(), ys.min(), xs.max() + 1, ys.max() + 1]), len(xs)
+
+def check_labels_valid(labels):
+    """Every kept box lies inside the image with a positive size"""
+    half = labels[:, 3:5] / 2
+    return (np.all(labels[:, 3:5] > 0) and np.all(labels[:, 1:3] - half >= -1e-9)
+            and np.all(labels[:, 1:3] + half <= 1 + 1e-9))
+
+def check_box(label_in, mask_out, labels_out, size_out, area_scale):
+    """
+    One box through one transform: if kept, the label frames the drawing; if dropped,
+    the drawing really is (nearly) degenerate
+    """
+    width, height = size_out
+    box, pixels = drawn_box(mask_out)
+    full_area = np.prod(label_in[3:5] * label_in[5:7]) * area_scale
+    if len(labels_out):
+        if box is None:
+            return "kept a box that left the image"
+        expected = geometric.yolo_to_xyxy(labels_out[0, 1:], width, height)[0]
+        if np.abs(expected - box).max() > EDGE_TOLERANCE:
+            return f"box {np.round(expected, 1).tolist()} vs drawn {box.tolist()}"
+        if labels_out[0, 0] != label_in[0]:
+            return "class changed"
+        slack = 2 * EDGE_TOLERANCE * (box[2:] - box[:2]).sum()
+        if pixels + slack < geometric.MIN_VISIBILITY * full_area * 0.8:
+            return f"kept a mostly hidden box ({pixels} of {full_area:.0f} px visible)"
+        return None
+
+    # Dropped: too thin or mostly outside, allowing for edge pixels
+    if box is None:
+        return None
+    thin = (box[2:] - box[:2]).min() <= geometric.MIN_BOX_PIXELS + 2 * EDGE_TOLERANCE
+    hidden = pixels <= geometric.MIN_VISIBILITY * full_area * 1.2 + 4 * EDGE_TOLERANCE * (box[2:] - box[:2]).sum()
+    return None if thin or hidden else f"dropped a visible box (drawn {box.tolist()}, {pixels} px)"
+
+def transforms(rng):
+    """(name, op, params, area scale) for one trial"""
+    factor = float(rng.uniform(0.5, 1.6))
+    return [
+        ("hflip", "hflip", [], 1.0),
+        ("vflip", "vflip", [], 1.0),
+        ("rot90", "rot90", [1], 1.0),
+        ("rot180", "rot90", [2], 1.0),
+        ("rot270", "rot90", [3], 1.0),
+        ("scale", "scale", [factor], factor ** 2),
+        ("translate", "translate", rng.uniform(-0.4, 0.4, 2).tolist(), 1.0),
+        ("crop", "crop", geometric.random_window(rng, min_side=0.4), 1.0),
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Property-test the geometric box transforms")
+    parser.add_argument("--trials", type=int, default=200, help="Random images per transform")
+    parser.add_argument("--boxes", type=int, default=6, help="Boxes per image")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    checked, failures = {}, []
+
+    for trial in range(args.trials):
+        width, height = int(rng.integers(60, 300)), int(rng.integers(60, 300))
+        labels = random_labels(rng, width, height, args.boxes)
+        size_in = np.array([width, height])
+
+        for name, op, params, area_scale in transforms(rng):
+            _, out_labels, _ = geometric.apply(op, params, labels, (width, height))
+            if not check_labels_valid(out_labels):
+                failures.append(f"{name} trial {trial}: label outside the image")
+
+            for i in range(len(labels)):
+                mask, label_out, size_out = geometric.apply(op, params, labels[i:i + 1],
+                                                            (width, height), draw(labels[i:i + 1], width, height), fill=0)
+                label_in = np.concatenate([labels[i], size_in])
+                error = check_box(label_in, mask, label_out, size_out, area_scale)
+                checked[name] = checked.get(name, 0) + 1
+                if error:
+                    failures.append(f"{name} trial {trial} box {i}: {error}")
+
+        # Inverses: four quarter turns and two flips give the labels back
+        boxes = labels[:, 1:]
+        turned = boxes
+        for _ in range(4):
+            turned = geometric.rotate90_boxes(turned, 1)
+        flipped = geometric.flip_boxes(geometric.flip_boxes(boxes, True), True)
+        if not (np.allclose(turned, boxes) and np.allclose(flipped, boxes)):
+            failures.append(f"inverse trial {trial}: rotations or flips do not round-trip")
+
+        # Mosaic: each box drawn alone in its tile, the others blank
+        tiles = [(width, height)] + [(int(rng.integers(60, 300)), int(rng.integers(60, 300))) for _ in range(3)]
+        tile_labels = [labels] + [random_labels(rng, w, h, args.boxes) for w, h in tiles[1:]]
+        center = rng.uniform(0.2, 0.8, 2).tolist()
+        merged = geometric.mosaic_labels(tile_labels, tiles, (width, height), center)
+        if not check_labels_valid(merged):
+            failures.append(f"mosaic trial {trial}: label outside the image")
+        layout = geometric.mosaic_layout(tiles, (width, height), center)
+        for t, (tile_size, boxes) in enumerate(zip(tiles, tile_labels)):
+            if layout[t] is None:
+                continue
+            resized = layout[t][1]
+            for i in range(len(boxes)):
+                masks = [(np.zeros(s[::-1], np.uint8), np.zeros((0, 5))) for s in tiles]
+                masks[t] = (draw(boxes[i:i + 1], *tile_size), boxes[i:i + 1])
+                canvas, label_out = geometric.mosaic(masks, center, (width, height), fill=0)
+                area_scale = resized[0] / tile_size[0] * resized[1] / tile_size[1]
+                error = check_box(np.concatenate([boxes[i], tile_size]), canvas, label_out,
+                                  (width, height), area_scale)
+                checked["mosaic"] = checked.get("mosaic", 0) + 1
+                if error:
+                    failures.append(f"mosaic trial {trial} tile {t} box {i}: {error}")
+
+    print("🧪 Geometric box transform properties")
+    for name, count in checked.items():
+        print(f"   {name:<10} {count:>6} boxes")
+
+    if failures:
+        print(f"\n❌ {len(failures)} failures:")
+        for failure in failures[:20]:
+            print(f"   {failure}")
+        sys.exit(1)
+    print("\n✅ Every transformed box frames its drawing")
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,15 @@ Test the improved YOLO model on new images
 """
 
 import cv2
+import sys
 import numpy as np
 from ultralytics import YOLO
 from pathlib import Path
 import os
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from prediction_cache import PredictionCache, model_hash, cached_predict
+
 def test_improved_model():
     """Test the improved model on the specified test images"""
 
@@ -20,6 +24,8 @@ def test_improved_model():
 
     print("🤖 Loading improved YOLO model...")
     model = YOLO(model_path)
+    cache = PredictionCache()
+    weights_digest = model_hash(model_path)
 
     # Test image paths
     test_images = [
@@ -54,8 +60,8 @@ def test_improved_model():
 
         print(f"\n📸 Image {i}/{len(test_images)}: {Path(image_path).name}")
 
-        # Run detection
-        results = model(image_path, conf=0.25)  # Lower confidence for more detections
+        # Run detection (cached - rerunning the script on the same images and weights is instant)
+        boxes, confidences, classes = cached_predict(model, image_path, 0.25, cache, weights_digest)
 
         # Load image for visualization
         image = cv2.imread(image_path)
@@ -67,11 +73,7 @@ def test_improved_model():
 
         # Process results
         detections = []
-        if len(results[0].boxes) > 0:
-            boxes = results[0].boxes.xyxy.cpu().numpy()
-            confidences = results[0].boxes.conf.cpu().numpy()
-            classes = results[0].boxes.cls.cpu().numpy().astype(int)
-
+        if len(boxes) > 0:
             for box, conf, cls in zip(boxes, confidences, classes):
                 x1, y1, x2, y2 = map(int, box)
                 class_name = class_names.get(cls, f"class_{cls}")
@@ -128,6 +130,8 @@ def test_improved_model():
     for class_name, count in class_counts.items():
         print(f"   {class_name}: {count}")
 
+    print(f"\n{cache.report()}")
+    cache.close()
     print(f"\n💾 Annotated images saved to: {output_dir}/")
     print("✅ Testing complete!")
 
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Training Dataset Smoke Test
+Builds a small labeled folder, runs utilities/create_training_dataset.py on it with
+every variant (including --rotations) and checks the files it writes
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "utilities"))
+from create_training_dataset import augment_dataset, ROTATIONS
+
+VARIANTS = ["", "_hflip", "_bright", "_dark"] + [f"_{variant}" for variant in ROTATIONS]
+
+def make_input(input_dir, count, rng):
+    """count white pages with a few dark boxes, labeled in YOLO format"""
+    for i in range(count):
+        width, height = int(rng.integers(200, 400)), int(rng.integers(200, 400))
+        image = np.full((height, width, 3), 255, np.uint8)
+        lines = []
+        for _ in range(int(rng.integers(1, 5))):
+            x1, y1 = int(rng.integers(0, width - 40)), int(rng.integers(0, height - 40))
+            x2, y2 = x1 + int(rng.integers(10, 40)), y1 + int(rng.integers(10, 40))
+            cv2.rectangle(image, (x1, y1), (x2, y2), (0, 0, 0), 2)
+            lines.append(f"{rng.integers(0, 4)} {(x1 + x2) / 2 / width:.6f} {(y1 + y2) / 2 / height:.6f} "
+                         f"{(x2 - x1) / width:.6f} {(y2 - y1) / height:.6f}\n")
+        cv2.imwrite(str(input_dir / f"page.{i}.png"), image)
+        (input_dir / f"page.{i}.txt").write_text("".join(lines))
+
+def check_output(input_dir, output_dir):
+    """Failures: missing or extra files, broken labels, labels linked to their source"""
+    failures = []
+    stems = sorted(path.stem for path in input_dir.glob("*.png"))
+    expected = {f"{stem}{variant}" for stem in stems for variant in VARIANTS}
+    images = {path.stem for path in (output_dir / "images").glob("*.png")}
+    labels = {path.stem for path in (output_dir / "labels").glob("*.txt")}
+    for name, found in (("images", images), ("labels", labels)):
+        if found != expected:
+            failures.append(f"{name}: missing {sorted(expected - found)}, extra {sorted(found - expected)}")
+
+    for stem in sorted(labels & expected):
+        rows = np.loadtxt(output_dir / "labels" / f"{stem}.txt", ndmin=2)
+        if len(rows) and not (np.all(rows[:, 3:5] > 0) and np.all(rows[:, 1:5] <= 1 + 1e-6)):
+            failures.append(f"{stem}: label outside the image")
+    for stem in stems:
+        source, copy = input_dir / f"{stem}.txt", output_dir / "labels" / f"{stem}.txt"
+        if copy.exists() and copy.samefile(source):
+            failures.append(f"{stem}: label is linked to its source, not copied")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Smoke-test create_training_dataset.py on synthetic pages")
+    parser.add_argument("--images", type=int, default=3, help="Synthetic pages to augment")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        input_dir, output_dir = Path(tmp) / "input", Path(tmp) / "output"
+        input_dir.mkdir()
+        make_input(input_dir, args.images, rng)
+
+        failures = []
+        # The second run finds the outputs of the first in place, one label hardlinked
+        # to its source as an older --link run left it, which it has to replace with a copy
+        for run in ("first run", "rerun"):
+            augment_dataset(input_dir, output_dir, rotations=True)
+            failures += [f"{run}: {failure}" for failure in check_output(input_dir, output_dir)]
+            linked = output_dir / "labels" / "page.0.txt"
+            linked.unlink()
+            os.link(input_dir / "page.0.txt", linked)
+
+    print("🧪 create_training_dataset.py --rotations")
+    if failures:
+        print(f"\n❌ {len(failures)} failures:")
+        for failure in failures[:20]:
+            print(f"   {failure}")
+        sys.exit(1)
+    print(f"\n✅ {args.images} pages x {len(VARIANTS)} variants written with valid, copied labels")
+
+if __name__ == "__main__":
+    main()
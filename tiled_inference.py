@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Tiled (sliced) YOLO Inference
+Cuts large drawings into overlapping tiles, runs them through the model in batches
+and merges the boxes back into page coordinates
+"""
+
+import time
+import cv2
+import numpy as np
+from image_io import to_model_input
+
+MERGE_METHODS = ("nms", "wbf")
+
+# Pixels darker than this count as ink
+INK_THRESHOLD = 200
+# Side length in pixels of the blocks the ink map is computed on
+INK_BLOCK = 8
+
+def tile_windows(width, height, tile_size=640, overlap=0.2):
+    """
+    Overlapping tile windows (x1, y1, x2, y2) covering a width x height page
+
+    The last row/column is aligned to the page edge instead of padded, so
+    every tile is full size unless the page itself is smaller than a tile.
+    """
+    if not 0 <= overlap < 1:
+        raise ValueError("overlap must be in [0, 1)")
+
+    stride = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, stride))
+        positions.append(length - tile_size)
+        return positions
+
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+            for y in starts(height) for x in starts(width)]
+
+def ink_integral(image, block=INK_BLOCK, ink_threshold=INK_THRESHOLD):
+    """
+    Integral image over a block-downsampled ink map
+
+    Each cell is 1 if its block x block area holds any ink. Area-averaging the
+    full-resolution mask (rather than the gray image) keeps 1px lines visible.
+    """
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    ink = (gray < ink_threshold).astype(np.uint8) * 255
+    height, width = gray.shape
+    small = cv2.resize(ink, (max(1, -(-width // block)), max(1, -(-height // block))),
+                       interpolation=cv2.INTER_AREA)
+    return cv2.integral((small > 0).astype(np.uint8))
+
+def window_ink(integral, window, block=INK_BLOCK):
+    """Number of inked blocks inside a pixel window (x1, y1, x2, y2)"""
+    x1, y1, x2, y2 = window
+    bx1, by1 = x1 // block, y1 // block
+    bx2 = min(-(-x2 // block), integral.shape[1] - 1)
+    by2 = min(-(-y2 // block), integral.shape[0] - 1)
+    return int(integral[by2, bx2] - integral[by1, bx2] - integral[by2, bx1] + integral[by1, bx1])
+
+def content_window(image, margin=32, block=INK_BLOCK, ink_threshold=INK_THRESHOLD, integral=None):
+    """Bounding window (x1, y1, x2, y2) of all ink plus a margin, or None for a blank page"""
+    if integral is None:
+        integral = ink_integral(image, block, ink_threshold)
+    # Recover the per-block map from the integral image
+    blocks = np.diff(np.diff(integral, axis=0), axis=1)
+    rows = np.flatnonzero(blocks.any(axis=1))
+    cols = np.flatnonzero(blocks.any(axis=0))
+    if rows.size == 0:
+        return None
+
+    height, width = image.shape[:2]
+    return (max(0, int(cols[0]) * block - margin), max(0, int(rows[0]) * block - margin),
+            min(width, (int(cols[-1]) + 1) * block + margin), min(height, (int(rows[-1]) + 1) * block + margin))
+
+def crop_to_content(image, stats=None, margin=32):
+    """
+    Crop a page to its inked region before full-page inference
+
+    Returns (crop, (x_offset, y_offset)), or (None, None) for a blank page.
+    """
+    height, width = image.shape[:2]
+    window = content_window(image, margin)
+    if window is None:
+        record_skip(stats, width * height, width * height, blank_page=True)
+        return None, None
+
+    x1, y1, x2, y2 = window
+    record_skip(stats, width * height, width * height - (x2 - x1) * (y2 - y1))
+    return image[y1:y2, x1:x2], (x1, y1)
+
+def record_skip(stats, total_area, skipped_area, blank_page=False):
+    """Accumulate skipped-area statistics"""
+    if stats is None:
+        return
+    stats["area_total"] = stats.get("area_total", 0) + int(total_area)
+    stats["area_skipped"] = stats.get("area_skipped", 0) + int(skipped_area)
+    stats["blank_pages"] = stats.get("blank_pages", 0) + int(blank_page)
+
+def format_skip_report(stats):
+    """Summary of how much page area the blank-region pre-pass skipped"""
+    if not stats or not stats.get("area_total"):
+        return "Blank-region skipping: nothing measured"
+    percent = stats["area_skipped"] / stats["area_total"] * 100
+    report = f"Blank-region skipping: {percent:.1f}% of page area skipped"
+    if stats.get("tiles_skipped"):
+        report += f", {stats['tiles_skipped']} blank tiles"
+    if stats.get("blank_pages"):
+        report += f", {stats['blank_pages']} blank pages"
+    return report
+
+def box_overlap(box, boxes, metric="ios"):
+    """
+    Overlap of one xyxy box with an (N, 4) array
+
+    metric 'iou' is intersection over union; 'ios' is intersection over the
+    smaller box, which also matches a box cut in half by a tile seam with
+    its full-size counterpart.
+    """
+    ix1 = np.maximum(box[0], boxes[:, 0])
+    iy1 = np.maximum(box[1], boxes[:, 1])
+    ix2 = np.minimum(box[2], boxes[:, 2])
+    iy2 = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    if metric == "iou":
+        denominator = area + areas - intersection
+    else:
+        denominator = np.minimum(area, areas)
+    return intersection / np.maximum(denominator, 1e-9)
+
+def class_aware_nms(xyxy, conf, cls, threshold=0.5, metric="ios"):
+    """Greedy NMS within each class; returns indices of kept boxes, highest confidence first"""
+    keep = []
+    for class_id in np.unique(cls):
+        indices = np.flatnonzero(cls == class_id)
+        order = indices[np.argsort(-conf[indices], kind="stable")]
+        while order.size:
+            best = order[0]
+            keep.append(best)
+            if order.size == 1:
+                break
+            overlap = box_overlap(xyxy[best], xyxy[order[1:]], metric)
+            order = order[1:][overlap <= threshold]
+    keep = np.asarray(keep, dtype=np.int64)
+    return keep[np.argsort(-conf[keep], kind="stable")] if keep.size else keep
+
+def weighted_box_fusion(xyxy, conf, cls, threshold=0.5, metric="ios"):
+    """
+    Fuse overlapping same-class boxes into their confidence-weighted average
+
+    Returns fused (xyxy, conf, cls); fused confidence is the cluster maximum,
+    since duplicates come from overlapping tiles rather than independent models.
+    """
+    fused_boxes, fused_conf, fused_cls = [], [], []
+    for class_id in np.unique(cls):
+        indices = np.flatnonzero(cls == class_id)
+        indices = indices[np.argsort(-conf[indices], kind="stable")]
+
+        clusters = []  # [weighted box sum, weight sum, max conf]
+        centers = np.empty((0, 4), dtype=np.float64)
+        for index in indices:
+            if len(clusters):
+                overlap = box_overlap(xyxy[index], centers, metric)
+                match = int(np.argmax(overlap))
+                if overlap[match] > threshold:
+                    cluster = clusters[match]
+                    cluster[0] += xyxy[index] * conf[index]
+                    cluster[1] += conf[index]
+                    centers[match] = cluster[0] / cluster[1]
+                    continue
+            clusters.append([xyxy[index] * conf[index], conf[index], conf[index]])
+            centers = np.vstack([centers, xyxy[index][None, :]])
+
+        for box_sum, weight, max_conf in clusters:
+            fused_boxes.append(box_sum / weight)
+            fused_conf.append(max_conf)
+            fused_cls.append(class_id)
+
+    if not fused_boxes:
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+    order = np.argsort(-np.asarray(fused_conf), kind="stable")
+    return (np.asarray(fused_boxes, dtype=np.float32)[order],
+            np.asarray(fused_conf, dtype=np.float32)[order],
+            np.asarray(fused_cls, dtype=np.int64)[order])
+
+def merge_detections(xyxy, conf, cls, method="nms", threshold=0.5, metric="ios"):
+    """Remove duplicate boxes across tile seams with class-aware NMS or WBF"""
+    if method not in MERGE_METHODS:
+        raise ValueError(f"Unknown merge method '{method}' (expected one of {', '.join(MERGE_METHODS)})")
+    if len(xyxy) == 0:
+        return xyxy, conf, cls
+    if method == "wbf":
+        return weighted_box_fusion(xyxy, conf, cls, threshold, metric)
+    keep = class_aware_nms(xyxy, conf, cls, threshold, metric)
+    return xyxy[keep], conf[keep], cls[keep]
+
+def predict_tiled(model, image, confidence=0.25, tile_size=640, overlap=0.2, batch_size=8,
+                  merge="nms", merge_threshold=0.5, stats=None, skip_blank=True):
+    """
+    Run the model over overlapping tiles of a page
+
+    Tiles are inferred at imgsz=tile_size, so small shapes keep their full
+    resolution instead of being downsampled with the whole page. With
+    skip_blank, tiles without any ink are never sent to the model.
+
+    Returns:
+        (xyxy, conf, cls) numpy arrays in page pixel coordinates
+    """
+    height, width = image.shape[:2]
+    all_windows = tile_windows(width, height, tile_size, overlap)
+    windows = all_windows
+    if skip_blank:
+        integral = ink_integral(image)
+        windows = [window for window in all_windows if window_ink(integral, window) > 0]
+        if stats is not None:
+            stats["tiles_skipped"] = stats.get("tiles_skipped", 0) + len(all_windows) - len(windows)
+            tile_area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in all_windows)
+            kept_area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in windows)
+            record_skip(stats, tile_area, tile_area - kept_area, blank_page=not windows)
+
+    all_xyxy, all_conf, all_cls = [], [], []
+    start = time.perf_counter()
+    for batch_start in range(0, len(windows), max(1, batch_size)):
+        batch = windows[batch_start:batch_start + max(1, batch_size)]
+        tiles = [to_model_input(image[y1:y2, x1:x2]) for x1, y1, x2, y2 in batch]
+        results = model(tiles, conf=confidence, imgsz=tile_size, verbose=False)
+
+        for (x1, y1, _, _), result in zip(batch, results):
+            boxes = result.boxes
+            if boxes is None or len(boxes) == 0:
+                continue
+            # One host transfer per tile
+            tile_xyxy = boxes.xyxy.cpu().numpy().astype(np.float32)
+            tile_xyxy[:, [0, 2]] += x1
+            tile_xyxy[:, [1, 3]] += y1
+            all_xyxy.append(tile_xyxy)
+            all_conf.append(boxes.conf.cpu().numpy().astype(np.float32))
+            all_cls.append(boxes.cls.cpu().numpy().astype(np.int64))
+
+    if all_xyxy:
+        xyxy, conf, cls = merge_detections(np.concatenate(all_xyxy), np.concatenate(all_conf),
+                                           np.concatenate(all_cls), merge, merge_threshold)
+    else:
+        xyxy = np.zeros((0, 4), dtype=np.float32)
+        conf = np.zeros(0, dtype=np.float32)
+        cls = np.zeros(0, dtype=np.int64)
+
+    if stats is not None:
+        stats["pages"] = stats.get("pages", 0) + 1
+        stats["tiles"] = stats.get("tiles", 0) + len(windows)
+        stats["seconds"] = stats.get("seconds", 0.0) + time.perf_counter() - start
+        stats["raw_boxes"] = stats.get("raw_boxes", 0) + sum(len(c) for c in all_conf)
+        stats["merged_boxes"] = stats.get("merged_boxes", 0) + len(conf)
+
+    return xyxy, conf, cls
+
+def format_tile_report(stats):
+    """One-paragraph throughput summary of predict_tiled stats (cached_pages: pages served from the prediction cache)"""
+    cached = f"; {stats['cached_pages']} pages from the prediction cache" if stats and stats.get("cached_pages") else ""
+    if not stats or not stats.get("pages"):
+        return f"Tiled inference: no pages processed{cached}"
+    seconds = max(stats["seconds"], 1e-9)
+    return (f"Tiled inference: {stats['pages']} pages, {stats['tiles']} tiles "
+            f"({stats['tiles'] / stats['pages']:.1f} per page) in {stats['seconds']:.1f}s - "
+            f"{stats['tiles'] / seconds:.1f} tiles/s, {stats['pages'] / seconds:.2f} pages/s; "
+            f"{stats['raw_boxes']} raw boxes merged to {stats['merged_boxes']}{cached}")
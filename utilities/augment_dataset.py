@@ -2,32 +2,187 @@
 """
 Data Augmentation Script for YOLO Dataset
 Applies various augmentations to labeled images while maintaining bounding box accuracy
+
+With --lazy only a recipe (recipe.json) describing each augmented variant is written;
+LazyAugmentedDataset applies it at read time and can materialize the files later:
+    python augment_dataset.py --lazy --output_dir augmented_dataset
+    python augment_dataset.py --materialize augmented_dataset/recipe.json --output_dir augmented_full
+
+--geometric adds rotations, scale, translate and crop to the augmentations picked from,
+and --mosaics N adds N 2x2 mosaics of random originals.
+
+--balance spreads the augmentations by class instead of giving every image the same
+number: images with under-represented classes get up to --num_augmentations, the rest
+fewer or none (see class_balance.py).
+
+Outputs are recorded in output_dir/output_manifest.sqlite (see output_store.py): identical
+files are hardlinked, and a rerun only writes images whose source pair or settings changed.
+--link picks how untransformed original images are placed (hardlink by default,
+symlink, reflink or copy; see materialize.py). Labels are always copied, since the
+labeling tools edit them in place.
+
+--codec picks how images are encoded (png, png:0-9, webp, qoi, jpeg:quality) and
+--photometric_codec overrides it for variants that only change pixel values, e.g.
+    python augment_dataset.py --codec png:1 --photometric_codec jpeg:90
+Each run prints a size/speed table for the codecs used and for all codecs on a sample.
 """
 
 import cv2
 import numpy as np
 import os
-import random
+import json
+import time
+import hashlib
+import argparse
+import multiprocessing
 from pathlib import Path
-import shutil
+from PIL import Image
+from tqdm import tqdm
+
+import geometric
+import photometric
+import class_balance
+from output_store import OutputStore
+from materialize import LINK_STRATEGIES, link_file
+from image_codecs import ImageCodec, CodecStats, compare_codecs, format_codec_table, image_extensions, decodable
+
+# Images per pool task: large enough to amortize task overhead, small enough to balance load
+DEFAULT_CHUNK_SIZE = 16
+
+# Named augmentations as op lists ([op, *params]), applied in order by apply_ops
+AUGMENTATIONS = {
+    "hflip": [["hflip"]],
+    "vflip": [["vflip"]],
+    "bright": [["brightness", 1.3]],
+    "contrast": [["contrast", 1.3]],
+    "noise": [["noise", 20]],
+    "dark": [["brightness", 0.7]],
+}
+
+# Opt-in geometric augmentations (--geometric); random parameters are drawn per image at plan time
+GEOMETRIC_AUGMENTATIONS = {
+    "rot90": lambda rng: [["rot90", 1]],
+    "rot180": lambda rng: [["rot90", 2]],
+    "rot270": lambda rng: [["rot90", 3]],
+    "scale": lambda rng: [["scale", round(float(rng.uniform(0.6, 1.4)), 3)]],
+    "translate": lambda rng: [["translate", *np.round(rng.uniform(-0.2, 0.2, 2), 3).tolist()]],
+    "crop": lambda rng: [["crop", *geometric.random_window(rng, min_side=0.6)]],
+}
+
+# Ops that change pixel values but never move them (see OutputCodecs)
+PHOTOMETRIC_OPS = set(photometric.LUT_OPS) | {"noise"}
+
+RECIPE_NAME = "recipe.json"
+RECIPE_VERSION = 1
+
+def image_seed(seed, stem):
+    """
+    Random seed for one image, derived from the run seed and the file stem
+
+    Every image gets its own generator, so the augmentations chosen (and the noise drawn)
+    are the same whatever the worker count or processing order.
+    """
+    return int.from_bytes(hashlib.sha256(f"{seed}:{stem}".encode()).digest()[:8], "big")
+
+def source_entry(image_path, label_path):
+    """Recipe fields shared by every entry built from one original image"""
+    # Header read only - the pixels are decoded when an entry is used
+    with Image.open(image_path) as image:
+        width, height = image.size
+    return {"image": str(image_path), "label": str(label_path), "width": width, "height": height}
+
+# Augmenter instance of each pool worker, built once by _init_worker
+_worker_augmenter = None
+
+def _init_worker(augmenter_args):
+    global _worker_augmenter
+    # One OpenCV thread per process - the pool already uses every core
+    cv2.setNumThreads(1)
+    _worker_augmenter = YOLOAugmenter(*augmenter_args)
+
+def _augment_chunk(task):
+    """
+    Pool task: augment one chunk of (image, label, augmentations) triples
+
+    Returns (pairs done, images written, encode totals of this chunk).
+    """
+    _worker_augmenter.codecs.stats = CodecStats()
+    written = sum(_worker_augmenter.augment_image(image_path, label_path, num_augmentations)
+                  for image_path, label_path, num_augmentations in task)
+    return len(task), written, _worker_augmenter.codecs.stats.totals
+
+_worker_store = None
+
+def _materialize_chunk(task):
+    """Pool task: write one chunk of recipe entries, returns (entries done, images written, encode totals)"""
+    global _worker_store
+    entries, output_dir, grayscale, dedup, codec_specs, link = task
+    cv2.setNumThreads(1)
+    if dedup and _worker_store is None:
+        _worker_store = OutputStore(output_dir)
+    store = _worker_store if dedup else None
+    codecs = OutputCodecs(*codec_specs)
+    written = sum(write_entry(entry, output_dir, grayscale, store=store, codecs=codecs, link=link)
+                  for entry in entries)
+    return len(entries), written, codecs.stats.totals
+
+class OutputCodecs:
+    """
+    Image codecs for written outputs: `codec` for everything, `photometric_codec`
+    (default: the same) for variants whose ops only change pixel values, so a lossy
+    codec can be limited to images whose boxes match the untouched original
+    """
+
+    def __init__(self, codec="png", photometric_codec=None):
+        self.codec = ImageCodec(codec)
+        self.photometric_codec = ImageCodec(photometric_codec) if photometric_codec else self.codec
+        self.stats = CodecStats()
+
+    @property
+    def specs(self):
+        return self.codec.spec, self.photometric_codec.spec
+
+    def for_entry(self, entry):
+        ops = entry["ops"]
+        if ops and "mosaic" not in entry and all(op[0] in PHOTOMETRIC_OPS for op in ops):
+            return self.photometric_codec
+        return self.codec
 
 class YOLOAugmenter:
-    def __init__(self, source_images_dir, source_labels_dir, output_dir):
+    def __init__(self, source_images_dir, source_labels_dir, output_dir, grayscale=False, seed=42,
+                 geometric_augmentations=False, dedup=True, codec="png", photometric_codec=None, link="hardlink"):
         self.source_images_dir = Path(source_images_dir)
         self.source_labels_dir = Path(source_labels_dir)
         self.output_dir = Path(output_dir)
 
+        # Line drawings carry no color information - augmenting a single
+        # channel cuts memory and PNG encode time by roughly 3x
+        self.grayscale = grayscale
+
+        # Base seed for reproducibility; each image derives its own generator from it
+        self.seed = seed
+
+        # Also pick from GEOMETRIC_AUGMENTATIONS (off by default so existing seeds give the same output)
+        self.geometric_augmentations = geometric_augmentations
+
         # Create output directories
         self.output_images_dir = self.output_dir / "images"
         self.output_labels_dir = self.output_dir / "labels"
         self.output_images_dir.mkdir(parents=True, exist_ok=True)
         self.output_labels_dir.mkdir(parents=True, exist_ok=True)
 
-        # Set random seed for reproducibility
-        random.seed(42)
-        np.random.seed(42)
+        # Content-addressed manifest: hardlinks identical outputs and skips current ones
+        self.dedup = dedup
+        self.store = OutputStore(self.output_dir) if dedup else None
 
-    def load_yolo_annotations(self, label_file):
+        # How images are encoded, and the time and bytes spent on it
+        self.codecs = OutputCodecs(codec, photometric_codec)
+
+        # How untransformed original images are placed (see materialize.py); labels are copied
+        self.link = link
+
+    @staticmethod
+    def load_yolo_annotations(label_file):
         """Load YOLO format annotations"""
         annotations = []
         class_labels = []
@@ -47,136 +202,235 @@ class YOLOAugmenter:
 
         return annotations, class_labels
 
-    def save_yolo_annotations(self, annotations, class_labels, output_file):
+    @staticmethod
+    def save_yolo_annotations(annotations, class_labels, output_file):
         """Save YOLO format annotations"""
         with open(output_file, 'w') as f:
             for bbox, class_id in zip(annotations, class_labels):
                 x_center, y_center, width, height = bbox
                 f.write(f"{class_id} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n")
 
-    def flip_horizontal(self, image, bboxes):
+    @staticmethod
+    def flip_horizontal(image, bboxes):
         """Horizontal flip with bbox adjustment"""
-        flipped_image = cv2.flip(image, 1)
-        flipped_bboxes = []
-
-        for bbox in bboxes:
-            x_center, y_center, width, height = bbox
-            # Flip x coordinate
-            new_x_center = 1.0 - x_center
-            flipped_bboxes.append([new_x_center, y_center, width, height])
-
-        return flipped_image, flipped_bboxes
+        return cv2.flip(image, 1), geometric.flip_boxes(bboxes, horizontal=True)
 
-    def flip_vertical(self, image, bboxes):
+    @staticmethod
+    def flip_vertical(image, bboxes):
         """Vertical flip with bbox adjustment"""
-        flipped_image = cv2.flip(image, 0)
-        flipped_bboxes = []
+        return cv2.flip(image, 0), geometric.flip_boxes(bboxes, horizontal=False)
 
-        for bbox in bboxes:
-            x_center, y_center, width, height = bbox
-            # Flip y coordinate
-            new_y_center = 1.0 - y_center
-            flipped_bboxes.append([x_center, new_y_center, width, height])
-
-        return flipped_image, flipped_bboxes
-
-    def adjust_brightness(self, image, factor=1.2):
+    @staticmethod
+    def adjust_brightness(image, factor=1.2):
         """Adjust image brightness"""
-        bright_image = image.astype(np.float32) * factor
-        bright_image = np.clip(bright_image, 0, 255).astype(np.uint8)
-        return bright_image
+        return photometric.adjust_brightness(image, factor)
 
-    def adjust_contrast(self, image, factor=1.2):
+    @staticmethod
+    def adjust_contrast(image, factor=1.2):
         """Adjust image contrast"""
-        contrast_image = image.astype(np.float32)
-        contrast_image = (contrast_image - 127.5) * factor + 127.5
-        contrast_image = np.clip(contrast_image, 0, 255).astype(np.uint8)
-        return contrast_image
+        return photometric.adjust_contrast(image, factor)
 
-    def add_noise(self, image, noise_factor=25):
+    @staticmethod
+    def add_noise(image, noise_factor=25, rng=None):
         """Add Gaussian noise to image"""
-        noise = np.random.normal(0, noise_factor, image.shape).astype(np.float32)
-        noisy_image = image.astype(np.float32) + noise
-        noisy_image = np.clip(noisy_image, 0, 255).astype(np.uint8)
-        return noisy_image
+        return photometric.add_noise(image, noise_factor, rng)
+
+    def plan_image(self, image_path, label_path, num_augmentations=4):
+        """
+        Recipe entries for one image: the original plus the augmentations picked for it
+
+        Each entry names its output, its source files, the ops to apply and the
+        seed for any randomness in them, so the variant can be rebuilt at read time.
+        """
+        rng = np.random.default_rng(image_seed(self.seed, image_path.stem))
+        augmentations = dict(AUGMENTATIONS)
+        if self.geometric_augmentations:
+            augmentations.update(GEOMETRIC_AUGMENTATIONS)
+        names = list(augmentations)
+        selected = rng.choice(len(names), min(num_augmentations, len(names)), replace=False)
+
+        original_name = image_path.stem
+        source = source_entry(image_path, label_path)
+        entries = [dict(source, name=original_name, ops=[])]
+        for i in sorted(selected):
+            name = f"{original_name}_aug_{names[i]}"
+            ops = augmentations[names[i]]
+            if callable(ops):
+                ops = ops(rng)
+            entries.append(dict(source, name=name, ops=ops, seed=image_seed(self.seed, name)))
+        return entries
+
+    def plan_mosaics(self, valid_pairs, count):
+        """Recipe entries for `count` 2x2 mosaics of random originals, each the size of its first tile"""
+        sources = {}
+        entries = []
+        for i in range(count):
+            name = f"mosaic_{i:05d}"
+            rng = np.random.default_rng(image_seed(self.seed, name))
+            picks = rng.choice(len(valid_pairs), 4, replace=len(valid_pairs) < 4)
+            for pick in picks:
+                if pick not in sources:
+                    sources[pick] = source_entry(*valid_pairs[pick])
+            tiles = [sources[pick] for pick in picks]
+            entries.append({"name": name, "mosaic": tiles, "center": np.round(rng.uniform(0.3, 0.7, 2), 3).tolist(),
+                            "width": tiles[0]["width"], "height": tiles[0]["height"], "ops": []})
+        return entries
 
     def augment_image(self, image_path, label_path, num_augmentations=4):
-        """Apply augmentations to a single image and its annotations"""
+        """
+        Apply augmentations to a single image and its annotations
+
+        Returns:
+            Number of images written (original included, current outputs skipped)
+        """
+        entries = self.plan_image(image_path, label_path, num_augmentations)
+        if self.store is not None:
+            entries = [entry for entry in entries
+                       if not entry_current(entry, self.output_dir, self.grayscale, self.store, self.codecs)]
+            if not entries:
+                return 0
+
         # Load image
-        image = cv2.imread(str(image_path))
+        read_flag = cv2.IMREAD_GRAYSCALE if self.grayscale else cv2.IMREAD_COLOR
+        image = cv2.imread(str(image_path), read_flag)
         if image is None:
             print(f"Warning: Could not load image {image_path}")
-            return
-
-        # Load annotations
-        annotations, class_labels = self.load_yolo_annotations(label_path)
+            return 0
 
-        # Copy original files first
-        original_name = image_path.stem
-        shutil.copy2(image_path, self.output_images_dir / f"{original_name}.png")
-        shutil.copy2(label_path, self.output_labels_dir / f"{original_name}.txt")
-
-        augmentations = [
-            ("hflip", lambda img, bbox: self.flip_horizontal(img, bbox)),
-            ("vflip", lambda img, bbox: self.flip_vertical(img, bbox)),
-            ("bright", lambda img, bbox: (self.adjust_brightness(img, 1.3), bbox)),
-            ("contrast", lambda img, bbox: (self.adjust_contrast(img, 1.3), bbox)),
-            ("noise", lambda img, bbox: (self.add_noise(img, 20), bbox)),
-            ("dark", lambda img, bbox: (self.adjust_brightness(img, 0.7), bbox)),
-        ]
-
-        # Apply selected augmentations
-        selected_augs = random.sample(augmentations, min(num_augmentations, len(augmentations)))
-
-        for aug_name, aug_func in selected_augs:
+        written = 0
+        for entry in entries:
             try:
-                aug_image, aug_bboxes = aug_func(image, annotations)
-
-                # Save augmented image
-                aug_image_name = f"{original_name}_aug_{aug_name}.png"
-                cv2.imwrite(str(self.output_images_dir / aug_image_name), aug_image)
-
-                # Save augmented annotations
-                aug_label_name = f"{original_name}_aug_{aug_name}.txt"
-                self.save_yolo_annotations(aug_bboxes, class_labels,
-                                         self.output_labels_dir / aug_label_name)
-
+                written += write_entry(entry, self.output_dir, self.grayscale, image, self.store, self.codecs,
+                                       self.link)
             except Exception as e:
-                print(f"Warning: Failed to apply {aug_name} to {image_path}: {e}")
-                continue
+                print(f"Warning: Failed to write {entry['name']} for {image_path}: {e}")
 
-    def augment_dataset(self, num_augmentations=4):
-        """Augment the entire dataset"""
-        # Find all images with corresponding labels
+        return written
+
+    def find_pairs(self):
+        """Source images that have a label file, sorted"""
         image_files = []
         for ext in ['*.png', '*.jpg', '*.jpeg']:
             image_files.extend(list(self.source_images_dir.glob(ext)))
 
-        # Filter to only images that have corresponding label files
         valid_pairs = []
-        for image_file in image_files:
+        for image_file in sorted(image_files):
             label_file = self.source_labels_dir / f"{image_file.stem}.txt"
             if label_file.exists():
                 valid_pairs.append((image_file, label_file))
+        return valid_pairs
+
+    def balanced_passes(self, max_passes=4, target=None, budget=None, class_index=None):
+        """
+        {stem: augmentations} that move the class distribution toward target
+        (class_balance.parse_target shares, default uniform)
+
+        Class counts come from the class_index JSON for unchanged label files and
+        from the label files otherwise (see class_balance.index_for).
+        """
+        valid_pairs = self.find_pairs()
+        index = class_balance.index_for([label_path for _, label_path in valid_pairs], class_index)
+        counts = np.array([index[label_path.stem] for _, label_path in valid_pairs])
+        num_classes = counts.shape[1]
+        if target is None:
+            target = class_balance.parse_target(None, num_classes)
+
+        # No image can take more augmentations than there are to pick from
+        available = len(AUGMENTATIONS) + (len(GEOMETRIC_AUGMENTATIONS) if self.geometric_augmentations else 0)
+        passes = class_balance.schedule_passes(counts, target, min(max_passes, available), budget)
+
+        totals = counts.sum(axis=0)
+        print(f"⚖️  Class-balanced schedule: {passes.sum()} augmentations on {(passes > 0).sum()} "
+              f"of {len(valid_pairs)} images (uniform: {min(max_passes, available) * len(valid_pairs)})")
+        print(f"  Originals:\n{class_balance.format_distribution(totals, target)}")
+        print(f"  After augmenting:\n{class_balance.format_distribution(totals + passes @ counts, target)}")
+        return {image_path.stem: int(n) for (image_path, _), n in zip(valid_pairs, passes)}
+
+    def write_recipe(self, num_augmentations=4, mosaics=0, passes=None):
+        """
+        Write output_dir/recipe.json instead of the augmented images; returns its path
+
+        passes ({stem: augmentations}, see balanced_passes) overrides num_augmentations per image.
+        """
+        valid_pairs = self.find_pairs()
+        passes = passes or {}
+        entries = [entry for image_path, label_path in valid_pairs
+                   for entry in self.plan_image(image_path, label_path,
+                                                passes.get(image_path.stem, num_augmentations))]
+        if mosaics and valid_pairs:
+            entries += self.plan_mosaics(valid_pairs, mosaics)
+
+        recipe_path = self.output_dir / RECIPE_NAME
+        save_recipe(recipe_path, entries, self.grayscale)
+        print(f"Planned {len(entries)} images from {len(valid_pairs)} originals in {recipe_path}")
+        return recipe_path
+
+    def augment_dataset(self, num_augmentations=4, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, mosaics=0,
+                        passes=None, codec_sample=1):
+        """
+        Augment the entire dataset
+
+        Images are split into chunks of chunk_size and augmented by a pool of
+        `workers` processes (default: all cores; 1 runs in this process). Output
+        is identical for any worker count. `mosaics` extra 2x2 mosaics are
+        written after the per-image augmentations. passes ({stem: augmentations},
+        see balanced_passes) overrides num_augmentations per image. The closing
+        size/speed table also compares every codec on `codec_sample` originals.
+        """
+        valid_pairs = self.find_pairs()
+        passes = passes or {}
+        tasks = [(image_path, label_path, passes.get(image_path.stem, num_augmentations))
+                 for image_path, label_path in valid_pairs]
 
         print(f"Found {len(valid_pairs)} image-label pairs to augment")
         print(f"Generating up to {num_augmentations} augmentations per image")
-        print(f"Estimated dataset size: {len(valid_pairs) * (1 + num_augmentations)} images")
-
-        # Process each image
-        count = 0
-        for image_path, label_path in valid_pairs:
-            self.augment_image(image_path, label_path, num_augmentations)
-            count += 1
-            if count % 50 == 0:
-                print(f"Processed {count}/{len(valid_pairs)} images...")
+        print(f"Estimated dataset size: {sum(1 + n for _, _, n in tasks)} images")
+
+        if self.store is not None:
+            # Incremental run: only pairs with a new, changed or missing output are augmented
+            tasks = [task for task in tasks
+                     if not all(entry_current(entry, self.output_dir, self.grayscale, self.store, self.codecs)
+                                for entry in self.plan_image(*task))]
+            if len(tasks) < len(valid_pairs):
+                print(f"Skipping {len(valid_pairs) - len(tasks)} pairs whose outputs are up to date")
+
+        workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+        chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), max(1, chunk_size))]
+
+        written = 0
+        with tqdm(total=len(tasks), desc=f"Augmenting ({workers} workers)", unit="img") as progress:
+            if workers == 1:
+                for image_path, label_path, n in tasks:
+                    written += self.augment_image(image_path, label_path, n)
+                    progress.update(1)
+            else:
+                # spawn: no forked copies of OpenCV thread pools
+                ctx = multiprocessing.get_context("spawn")
+                augmenter_args = (self.source_images_dir, self.source_labels_dir, self.output_dir,
+                                  self.grayscale, self.seed, self.geometric_augmentations, self.dedup,
+                                  *self.codecs.specs, self.link)
+                with ctx.Pool(workers, initializer=_init_worker, initargs=(augmenter_args,)) as pool:
+                    for done, chunk_written, codec_totals in pool.imap_unordered(_augment_chunk, chunks):
+                        written += chunk_written
+                        self.codecs.stats.merge(codec_totals)
+                        progress.update(done)
+
+        if mosaics and valid_pairs:
+            written += write_entries(self.plan_mosaics(valid_pairs, mosaics), self.output_dir, self.grayscale,
+                                     workers, chunk_size, "Mosaics", self.dedup, self.codecs, self.link)
+
+        print(f"Wrote {written} images")
+        if self.store is not None:
+            print(store_summary(self.store))
+        print_codec_report(self.codecs, [read_source(image_path, self.grayscale)
+                                         for image_path, _ in valid_pairs[:codec_sample]])
 
         # Generate statistics
         self.generate_stats()
 
     def generate_stats(self):
         """Generate statistics about the augmented dataset"""
-        image_count = len(list(self.output_images_dir.glob("*.png")))
+        image_count = sum(len(list(self.output_images_dir.glob(f"*{ext}"))) for ext in image_extensions())
         label_count = len(list(self.output_labels_dir.glob("*.txt")))
 
         # Count annotations by class
@@ -201,12 +455,362 @@ class YOLOAugmenter:
             percentage = (count / total_annotations * 100) if total_annotations > 0 else 0
             print(f"    {class_names[class_id]}: {count} ({percentage:.1f}%)")
 
+def read_source(image_path, grayscale=False):
+    """Decode a source image (single channel in grayscale mode); None if unreadable"""
+    return cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR)
+
+def read_labels(label_path):
+    """(N, 5) float64 array of class, x_center, y_center, width, height from a YOLO label file"""
+    annotations, class_labels = YOLOAugmenter.load_yolo_annotations(Path(label_path))
+    if not class_labels:
+        return np.zeros((0, 5))
+    return np.column_stack([class_labels, annotations]).astype(np.float64)
+
+def write_labels(labels, label_path):
+    # A new file, never written through a link to another label
+    Path(label_path).unlink(missing_ok=True)
+    YOLOAugmenter.save_yolo_annotations(labels[:, 1:], labels[:, 0].astype(int), label_path)
+
+def apply_ops(image, labels, ops, seed=None, size=None):
+    """
+    Apply a recipe entry's ops in order, returns (image, labels, size)
+
+    With image None only the (N, 5) labels are moved; size, the (width, height)
+    of the image, is tracked through rotations and crops instead.
+
+    Consecutive brightness/contrast ops are fused into one lookup table and
+    applied in a single pass. Flips, quarter turns and crops only move pixels,
+    so a pending table is carried across them.
+    """
+    if image is not None:
+        size = image.shape[1::-1]
+    rng = np.random.default_rng(seed)
+    lut = None
+    for op, *params in ops:
+        if op in photometric.LUT_OPS:
+            table = photometric.LUT_OPS[op](*params)
+            lut = table if lut is None else photometric.compose(lut, table)
+            continue
+
+        if lut is not None and image is not None and op not in ("hflip", "vflip", "rot90", "crop"):
+            image = photometric.apply_lut(image, lut)
+            lut = None
+
+        if op in geometric.GEOMETRIC_OPS:
+            image, labels, size = geometric.apply(op, params, labels, size, image)
+        elif op == "noise":
+            if image is not None:
+                image = YOLOAugmenter.add_noise(image, *params, rng=rng)
+        else:
+            raise ValueError(f"Unknown augmentation op '{op}'")
+
+    if lut is not None and image is not None:
+        image = photometric.apply_lut(image, lut)
+    return image, labels, size
+
+def read_entry(entry, grayscale=False, image=None):
+    """
+    Decode a recipe entry's source (or its four mosaic tiles) with labels, before its ops
+
+    Returns (image, labels), image None if a source could not be read.
+    """
+    if "mosaic" not in entry:
+        if image is None:
+            image = read_source(entry["image"], grayscale)
+        return image, read_labels(entry["label"])
+
+    tiles = []
+    for tile in entry["mosaic"]:
+        tile_image = read_source(tile["image"], grayscale)
+        if tile_image is None:
+            return None, None
+        tiles.append((tile_image, read_labels(tile["label"])))
+    return geometric.mosaic(tiles, entry["center"], (entry["width"], entry["height"]))
+
+def entry_labels(entry):
+    """An entry's final labels and (width, height), without decoding any image"""
+    size = (entry["width"], entry["height"])
+    if "mosaic" in entry:
+        labels = geometric.mosaic_labels([read_labels(tile["label"]) for tile in entry["mosaic"]],
+                                         [(tile["width"], tile["height"]) for tile in entry["mosaic"]],
+                                         size, entry["center"])
+    else:
+        labels = read_labels(entry["label"])
+    _, labels, size = apply_ops(None, labels, entry["ops"], entry.get("seed"), size)
+    return labels, size
+
+def copies_source(entry, grayscale):
+    """Untransformed originals keep their source bytes (and .png name) unless re-encoded as grayscale"""
+    return not entry["ops"] and "mosaic" not in entry and not grayscale
+
+def entry_outputs(entry, output_dir, grayscale=False, codecs=None):
+    """(image path, label path) an entry is written to"""
+    extension = ".png" if codecs is None or copies_source(entry, grayscale) else codecs.for_entry(entry).extension
+    return (Path(output_dir) / "images" / f"{entry['name']}{extension}",
+            Path(output_dir) / "labels" / f"{entry['name']}.txt")
+
+def entry_key(entry, grayscale, store, codecs=None):
+    """Store key for an entry: its ops, seed, name and codec plus the content hashes of its sources"""
+    codec = None if codecs is None or copies_source(entry, grayscale) else codecs.for_entry(entry).spec
+    return store.key(_relocate(entry, store.source_hash), grayscale, codec)
+
+def entry_current(entry, output_dir, grayscale, store, codecs=None):
+    """True if both of an entry's outputs were written from the same sources and settings"""
+    key = entry_key(entry, grayscale, store, codecs)
+    return all(store.current(path, key) for path in entry_outputs(entry, output_dir, grayscale, codecs))
+
+def label_text(labels):
+    """(N, 5) labels as YOLO label file text, as written by save_yolo_annotations"""
+    return "".join(f"{int(row[0])} {row[1]:.6f} {row[2]:.6f} {row[3]:.6f} {row[4]:.6f}\n" for row in labels)
+
+def write_entry(entry, output_dir, grayscale=False, image=None, store=None, codecs=None, link="hardlink"):
+    """
+    Write one recipe entry to output_dir/images and output_dir/labels
+
+    image is the already decoded source, if the caller has it. Untransformed
+    original images are placed as-is with the link strategy (re-encoded as single
+    channel in grayscale mode) and their labels copied; everything else is encoded
+    with codecs (an OutputCodecs, default PNG).
+    With an OutputStore, outputs identical to one already written are hardlinked
+    to it. Returns the number of images written.
+    """
+    codecs = codecs or OutputCodecs()
+    image_path, label_path = entry_outputs(entry, output_dir, grayscale, codecs)
+    original = not entry["ops"] and "mosaic" not in entry
+    key = entry_key(entry, grayscale, store, codecs) if store is not None else None
+
+    if copies_source(entry, grayscale):
+        _put_file(entry["image"], image_path, store, key, link)
+        _put_file(entry["label"], label_path, store, key, "copy")
+        _remove_other_formats(image_path, store)
+        return 1
+
+    image, labels = read_entry(entry, grayscale, image)
+    if image is None:
+        print(f"Warning: Could not load image for {entry['name']}")
+        return 0
+
+    codec = codecs.for_entry(entry)
+    if original:
+        _put_image(image, image_path, store, key, codec, codecs.stats)
+        _put_file(entry["label"], label_path, store, key, "copy")
+        _remove_other_formats(image_path, store)
+        return 1
+
+    aug_image, aug_labels, _ = apply_ops(image, labels, entry["ops"], entry.get("seed"))
+    _put_image(aug_image, image_path, store, key, codec, codecs.stats)
+    if store is None:
+        write_labels(aug_labels, label_path)
+    else:
+        store.put_bytes(label_path, label_text(aug_labels).encode(), key)
+    _remove_other_formats(image_path, store)
+    return 1
+
+def _put_file(src, dst, store, key, link):
+    if store is None:
+        link_file(src, dst, link)
+    else:
+        store.put_file(src, dst, key, link)
+
+def _put_image(image, dst, store, key, codec, stats):
+    if store is None:
+        codec.write(dst, image, stats)
+        return
+    start = time.perf_counter()
+    data = codec.encode(image)
+    stats.add(codec.spec, len(data), time.perf_counter() - start)
+    store.put_bytes(dst, data, key)
+
+def _remove_other_formats(image_path, store):
+    """Delete the same image written earlier with another codec, so it is not trained on twice"""
+    for extension in image_extensions():
+        other = image_path.with_suffix(extension)
+        if other != image_path and other.exists():
+            if store is None:
+                other.unlink()
+            else:
+                store.remove(other)
+
+def print_codec_report(codecs, sample_images):
+    """Size/speed of the codecs this run used, and of every codec on a few sample images"""
+    if codecs.stats.totals:
+        print(f"\n🖼️  Encoded images:\n{format_codec_table(codecs.stats.rows())}")
+    sample_images = [image for image in sample_images if image is not None]
+    if sample_images:
+        print(f"\n🖼️  Codec comparison on {len(sample_images)} sample image(s):")
+        print(format_codec_table(compare_codecs(sample_images), baseline="png"))
+
+def store_summary(store):
+    outputs, distinct, saved = store.summary()
+    return (f"Output manifest: {outputs} files, {distinct} distinct, "
+            f"{saved / 1e6:.1f} MB not stored twice thanks to hardlinks")
+
+def write_entries(entries, output_dir, grayscale=False, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                  desc="Materializing", dedup=True, codecs=None, link="hardlink"):
+    """
+    Write recipe entries with a pool of `workers` processes; returns images written
+
+    With dedup, entries whose outputs are current in the output manifest are
+    skipped and identical outputs are hardlinked (see output_store.py). Encode
+    time and size are added to codecs.stats.
+    """
+    codecs = codecs or OutputCodecs()
+    output_dir = Path(output_dir)
+    (output_dir / "images").mkdir(parents=True, exist_ok=True)
+    (output_dir / "labels").mkdir(parents=True, exist_ok=True)
+
+    store = OutputStore(output_dir) if dedup else None
+    if store is not None:
+        pending = [entry for entry in entries if not entry_current(entry, output_dir, grayscale, store, codecs)]
+        if len(pending) < len(entries):
+            print(f"Skipping {len(entries) - len(pending)} images that are up to date")
+        entries = pending
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(entries)))
+    chunks = [(entries[i:i + chunk_size], output_dir, grayscale, dedup, codecs.specs, link)
+              for i in range(0, len(entries), max(1, chunk_size))]
+
+    written = 0
+    with tqdm(total=len(entries), desc=f"{desc} ({workers} workers)", unit="img") as progress:
+        if workers == 1:
+            for entry in entries:
+                written += write_entry(entry, output_dir, grayscale, store=store, codecs=codecs, link=link)
+                progress.update(1)
+        else:
+            ctx = multiprocessing.get_context("spawn")
+            with ctx.Pool(workers) as pool:
+                for done, chunk_written, codec_totals in pool.imap_unordered(_materialize_chunk, chunks):
+                    written += chunk_written
+                    codecs.stats.merge(codec_totals)
+                    progress.update(done)
+    return written
+
+def _relocate(entry, move):
+    """Entry with move() applied to its source paths, mosaic tiles included"""
+    if "mosaic" in entry:
+        return dict(entry, mosaic=[_relocate(tile, move) for tile in entry["mosaic"]])
+    return dict(entry, image=move(entry["image"]), label=move(entry["label"]))
+
+def save_recipe(recipe_path, entries, grayscale=False):
+    """Write a recipe; source paths are stored relative to it so the folders can move together"""
+    recipe_path = Path(recipe_path)
+    recipe_path.parent.mkdir(parents=True, exist_ok=True)
+    base = recipe_path.parent.resolve()
+    stored = [_relocate(entry, lambda path: os.path.relpath(Path(path).resolve(), base)) for entry in entries]
+    with open(recipe_path, 'w') as f:
+        json.dump({"version": RECIPE_VERSION, "grayscale": grayscale, "entries": stored}, f)
+
+def load_recipe(recipe_path):
+    """Read a recipe, returns (grayscale, entries) with source paths resolved"""
+    recipe_path = Path(recipe_path)
+    with open(recipe_path) as f:
+        recipe = json.load(f)
+    if recipe.get("version") != RECIPE_VERSION:
+        raise ValueError(f"{recipe_path}: unsupported recipe version {recipe.get('version')}")
+    base = recipe_path.parent
+    entries = [_relocate(entry, lambda path: str(base / path)) for entry in recipe["entries"]]
+    return recipe["grayscale"], entries
+
+class LazyAugmentedDataset:
+    """
+    Augmented dataset built at read time from a recipe
+
+    dataset[i] decodes entry i's original image and applies its ops, returning
+    (image, labels) with labels as an (N, 5) array of class and normalized
+    x_center, y_center, width, height. Only the recipe is stored on disk;
+    materialize() writes the files when they are actually needed.
+    See lazy_training.py for training on it with ultralytics.
+    """
+
+    def __init__(self, recipe_path):
+        self.recipe_path = Path(recipe_path)
+        self.grayscale, self.entries = load_recipe(recipe_path)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, index):
+        entry = self.entries[index]
+        image, labels = read_entry(entry, self.grayscale)
+        if image is None:
+            raise FileNotFoundError(f"Could not load the source image(s) of {entry['name']}")
+        image, labels, _ = apply_ops(image, labels, entry["ops"], entry.get("seed"))
+        return image, labels.astype(np.float32)
+
+    def labels(self, index):
+        """Entry index's labels and image (width, height), without decoding the image"""
+        labels, size = entry_labels(self.entries[index])
+        return labels.astype(np.float32), size
+
+    def materialize(self, output_dir, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, dedup=True, codecs=None,
+                    link="hardlink"):
+        """Write every entry as files under output_dir/images and output_dir/labels; returns images written"""
+        return write_entries(self.entries, output_dir, self.grayscale, workers, chunk_size, dedup=dedup, codecs=codecs,
+                             link=link)
+
 def main():
-    # Configuration
-    source_images_dir = "data"
-    source_labels_dir = "labeld_data"
-    output_dir = "augmented_dataset"
-    num_augmentations = 4  # Generate up to 4 augmented versions per original image
+    parser = argparse.ArgumentParser(description="Augment a labeled YOLO dataset")
+    parser.add_argument("--images_dir", default="data", help="Source images")
+    parser.add_argument("--labels_dir", default="labeld_data", help="Source YOLO labels")
+    parser.add_argument("--output_dir", default="augmented_dataset", help="Output directory")
+    parser.add_argument("--num_augmentations", type=int, default=4,
+                        help="Augmented versions per original image (up to 6, 12 with --geometric)")
+    parser.add_argument("--grayscale", action="store_true",
+                        help="Augment and store single-channel images (black/white drawings)")
+    parser.add_argument("--workers", "-w", type=int, default=None,
+                        help="Worker processes (default: CPU count; output is the same for any count)")
+    parser.add_argument("--chunk_size", type=int, default=DEFAULT_CHUNK_SIZE, help="Images per worker task")
+    parser.add_argument("--seed", type=int, default=42, help="Base random seed")
+    parser.add_argument("--geometric", action="store_true",
+                        help="Also pick from rotations, scale, translate and crop (up to 12 augmentations)")
+    parser.add_argument("--mosaics", type=int, default=0, help="Extra 2x2 mosaics of random originals")
+    parser.add_argument("--balance", action="store_true",
+                        help="Spread augmentations by class: up to --num_augmentations on images with rare classes")
+    parser.add_argument("--target", default=None,
+                        help="Target class shares for --balance, e.g. 'straight=0.4,complex=0.3' (default: uniform)")
+    parser.add_argument("--budget", type=int, default=None, help="Most augmented images in total with --balance")
+    parser.add_argument("--class_index", default=None,
+                        help="Class-count index from class_balance.py (built from the labels if missing)")
+    parser.add_argument("--no_dedup", action="store_true",
+                        help="Write every output in full: no hardlinks, no skipping of up-to-date outputs")
+    parser.add_argument("--link", choices=LINK_STRATEGIES, default="hardlink",
+                        help="How untransformed original images are placed (falls back to copy across filesystems); "
+                             "labels are copied")
+    parser.add_argument("--codec", default="png",
+                        help="Image codec: png, png:0-9 (compression level), webp (lossless), qoi or jpeg:quality")
+    parser.add_argument("--photometric_codec", default=None,
+                        help="Codec for brightness/contrast/noise variants, e.g. jpeg:90 (default: --codec)")
+    parser.add_argument("--codec_sample", type=int, default=1,
+                        help="Originals every codec is compared on in the closing size/speed table (0 = none)")
+    parser.add_argument("--lazy", action="store_true",
+                        help=f"Only write {RECIPE_NAME}; augmentations are applied at read time")
+    parser.add_argument("--materialize", metavar="RECIPE", default=None,
+                        help="Write the images and labels described by an existing recipe to --output_dir")
+    args = parser.parse_args()
+
+    try:
+        codecs = OutputCodecs(args.codec, args.photometric_codec)
+    except ValueError as e:
+        print(f"❌ {e}")
+        exit(1)
+    for codec in {codecs.codec.spec, codecs.photometric_codec.spec}:
+        if not decodable(codec):
+            print(f"⚠️  This OpenCV build cannot read {codec} images back, and ultralytics does not train on them")
+
+    if args.materialize:
+        print(f"🚀 Materializing {args.materialize} into {args.output_dir}")
+        dataset = LazyAugmentedDataset(args.materialize)
+        written = dataset.materialize(args.output_dir, args.workers, args.chunk_size, not args.no_dedup, codecs,
+                                      args.link)
+        print(f"\n✅ Wrote {written} images to {args.output_dir}/")
+        print_codec_report(codecs, [read_source(entry["image"], dataset.grayscale)
+                                    for entry in dataset.entries[:args.codec_sample] if "image" in entry])
+        return
+
+    source_images_dir = args.images_dir
+    source_labels_dir = args.labels_dir
+    output_dir = args.output_dir
+    num_augmentations = args.num_augmentations
 
     print("🚀 Starting YOLO Dataset Augmentation")
     print(f"Source images: {source_images_dir}")
@@ -214,10 +818,23 @@ def main():
     print(f"Output directory: {output_dir}")
 
     # Create augmenter
-    augmenter = YOLOAugmenter(source_images_dir, source_labels_dir, output_dir)
+    augmenter = YOLOAugmenter(source_images_dir, source_labels_dir, output_dir, args.grayscale, args.seed,
+                              args.geometric, not (args.no_dedup or args.lazy), *codecs.specs, args.link)
+
+    passes = None
+    if args.balance:
+        target = class_balance.parse_target(args.target) if args.target else None
+        passes = augmenter.balanced_passes(num_augmentations, target, args.budget, args.class_index)
+
+    if args.lazy:
+        recipe_path = augmenter.write_recipe(num_augmentations, args.mosaics, passes)
+        print(f"\n✅ Recipe written to {recipe_path} - no images were written")
+        print(f"Train on it with lazy_training.py, or write the files with --materialize {recipe_path}")
+        return
 
     # Run augmentation
-    augmenter.augment_dataset(num_augmentations)
+    augmenter.augment_dataset(num_augmentations, args.workers, args.chunk_size, args.mosaics, passes,
+                              args.codec_sample)
 
     print(f"\n✅ Dataset augmentation complete!")
     print(f"Augmented dataset saved to: {output_dir}/")
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Class-Balanced Augmentation Scheduler
+Decides how many augmentation passes each image gets so the dataset grows toward a
+target class distribution instead of being multiplied uniformly
+
+    python class_balance.py --labels_dir labeld_data --output class_index.json
+    python augment_dataset.py --balance --class_index class_index.json
+"""
+
+import json
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+CLASS_NAMES = {0: 'straight', 1: 'L-shape', 2: 'U-shape', 3: 'complex'}
+
+# Stop once the class shares are within this L1 distance of the target
+DEFAULT_TOLERANCE = 0.02
+
+def label_class_counts(label_path, num_classes=len(CLASS_NAMES)):
+    """Annotations per class in one YOLO label file"""
+    counts = [0] * num_classes
+    with open(label_path) as f:
+        for line in f:
+            if line.strip():
+                class_id = int(line.split()[0])
+                if class_id >= len(counts):
+                    counts += [0] * (class_id + 1 - len(counts))
+                counts[class_id] += 1
+    return counts
+
+def build_class_index(label_paths):
+    """{stem: annotations per class} for a set of label files"""
+    index = {Path(path).stem: label_class_counts(path) for path in label_paths}
+    num_classes = max([len(CLASS_NAMES)] + [len(counts) for counts in index.values()])
+    return {stem: counts + [0] * (num_classes - len(counts)) for stem, counts in index.items()}
+
+def label_signature(label_path):
+    """[size, mtime_ns] of a label file, recorded in the index to notice later edits"""
+    stat = Path(label_path).stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+def save_class_index(index, path, files=None):
+    """Write the index; files is {stem: label_signature} of the label files it was read from"""
+    with open(path, 'w') as f:
+        json.dump({"classes": {str(k): v for k, v in CLASS_NAMES.items()}, "images": index,
+                   "files": files or {}}, f, indent=1)
+
+def load_class_index(path, with_files=False):
+    """{stem: counts}, or ({stem: counts}, {stem: label_signature}) with with_files"""
+    with open(path) as f:
+        data = json.load(f)
+    return (data["images"], data.get("files", {})) if with_files else data["images"]
+
+def index_for(label_paths, class_index=None):
+    """
+    {stem: annotations per class} for label_paths, all padded to the same length
+
+    Counts come from the class_index JSON for label files whose size and mtime
+    still match what it recorded, and are re-read from the files otherwise (new
+    or edited labels); the class_index file is written or updated with them.
+    """
+    index, files = {}, {}
+    if class_index and Path(class_index).exists():
+        index, files = load_class_index(class_index, with_files=True)
+    signatures = {Path(path).stem: label_signature(path) for path in label_paths}
+    stale = [path for path in label_paths
+             if Path(path).stem not in index or files.get(Path(path).stem) != signatures[Path(path).stem]]
+    if stale:
+        index.update(build_class_index(stale))
+        files.update({Path(path).stem: signatures[Path(path).stem] for path in stale})
+        if class_index:
+            save_class_index(index, class_index, files)
+
+    stems = [Path(path).stem for path in label_paths]
+    num_classes = max([len(CLASS_NAMES)] + [len(index[stem]) for stem in stems])
+    return {stem: index[stem] + [0] * (num_classes - len(index[stem])) for stem in stems}
+
+def parse_target(spec, num_classes=len(CLASS_NAMES)):
+    """
+    Target class shares from "straight=0.4,complex=0.3,..." or "0.4,0.2,0.1,0.3"
+
+    Named classes that are left out share the remainder equally. None means uniform.
+    """
+    if not spec:
+        return np.full(num_classes, 1 / num_classes)
+
+    ids = {name.lower(): class_id for class_id, name in CLASS_NAMES.items()}
+    parts = [part.strip() for part in spec.split(",") if part.strip()]
+    if all("=" not in part for part in parts):
+        target = np.array([float(part) for part in parts])
+        if len(target) != num_classes:
+            raise ValueError(f"Expected {num_classes} shares, got {len(target)}")
+    else:
+        target = np.full(num_classes, np.nan)
+        for part in parts:
+            name, share = part.split("=")
+            name = name.strip().lower()
+            class_id = ids[name] if name in ids else int(name)
+            target[class_id] = float(share)
+        missing = np.isnan(target)
+        if missing.any():
+            target[missing] = max(0.0, 1 - target[~missing].sum()) / missing.sum()
+    if target.sum() <= 0:
+        raise ValueError("Target shares must not all be zero")
+    return target / target.sum()
+
+def class_shares(totals):
+    totals = np.asarray(totals, dtype=np.float64)
+    return totals / totals.sum() if totals.sum() else totals
+
+def schedule_passes(counts, target=None, max_passes=6, budget=None, tolerance=DEFAULT_TOLERANCE):
+    """
+    Augmentation passes per image that move the class distribution toward target
+
+    counts is an (images, classes) array of annotations per image; every pass on
+    image i adds counts[i] annotations. Passes are handed out greedily, each time to
+    the image (with passes left) that brings the class shares closest to target
+    (L1 distance). Stops when the shares are within tolerance, no pass helps any more,
+    or `budget` passes have been given out.
+
+    Returns:
+        int array of passes per image (0 for images that would not help)
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    target = np.full(counts.shape[1], 1 / counts.shape[1]) if target is None else np.asarray(target)
+    budget = int(budget) if budget is not None else max_passes * len(counts)
+
+    # Images with the same class counts are interchangeable, so the greedy search
+    # runs over distinct count patterns and spreads each pattern's passes afterwards
+    patterns, inverse = np.unique(counts, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    members = [np.flatnonzero(inverse == p) for p in range(len(patterns))]
+    capacity = np.array([len(m) for m in members]) * max_passes
+    # Patterns without annotations never change the distribution
+    capacity[patterns.sum(axis=1) == 0] = 0
+
+    pattern_passes = np.zeros(len(patterns), dtype=int)
+    totals = counts.sum(axis=0)
+    distance = np.abs(class_shares(totals) - target).sum()
+    while pattern_passes.sum() < budget and distance > tolerance:
+        candidates = pattern_passes < capacity
+        if not candidates.any():
+            break
+        after = totals + patterns
+        distances = np.abs(after / after.sum(axis=1, keepdims=True) - target).sum(axis=1)
+        distances[~candidates] = np.inf
+        best = int(np.argmin(distances))
+        if distances[best] >= distance - 1e-9:
+            break
+        pattern_passes[best] += 1
+        totals = after[best]
+        distance = distances[best]
+
+    passes = np.zeros(len(counts), dtype=int)
+    for images, total in zip(members, pattern_passes):
+        passes[images] = total // len(images)
+        passes[images[:total % len(images)]] += 1
+    return passes
+
+def format_distribution(totals, target=None):
+    """One line per class: count, share and (optionally) target share"""
+    shares = class_shares(totals)
+    lines = []
+    for class_id, (count, share) in enumerate(zip(totals, shares)):
+        line = f"    {CLASS_NAMES.get(class_id, class_id)}: {int(count)} ({share * 100:.1f}%)"
+        if target is not None:
+            line += f"  target {target[class_id] * 100:.1f}%"
+        lines.append(line)
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a class-count index and preview a balanced schedule")
+    parser.add_argument("--labels_dir", default="labeld_data", help="YOLO label files")
+    parser.add_argument("--output", default="class_index.json", help="Where the index is written")
+    parser.add_argument("--target", default=None,
+                        help="Target shares, e.g. 'straight=0.4,complex=0.3' or '0.25,0.25,0.25,0.25' (default: uniform)")
+    parser.add_argument("--max_passes", type=int, default=6, help="Most augmented copies of one image")
+    parser.add_argument("--budget", type=int, default=None, help="Most augmented images in total")
+    args = parser.parse_args()
+
+    label_paths = sorted(Path(args.labels_dir).glob("*.txt"))
+    if not label_paths:
+        print(f"❌ No label files in {args.labels_dir}")
+        exit(1)
+    index = build_class_index(label_paths)
+    save_class_index(index, args.output, {path.stem: label_signature(path) for path in label_paths})
+    print(f"✅ Indexed {len(index)} label files into {args.output}")
+
+    counts = np.array(list(index.values()))
+    target = parse_target(args.target, counts.shape[1])
+    passes = schedule_passes(counts, target, args.max_passes, args.budget)
+    totals = counts.sum(axis=0)
+
+    print(f"\n📊 Current distribution:\n{format_distribution(totals, target)}")
+    print(f"\n📊 After {passes.sum()} balanced augmentations on {(passes > 0).sum()} images:")
+    print(format_distribution(totals + passes @ counts, target))
+    print(f"\n   (uniform x{args.max_passes} would add {args.max_passes * len(counts)} images)")
+
+if __name__ == "__main__":
+    main()
@@ -5,10 +5,12 @@ Finds the most recent version of each labeled image across all directories
 """
 
 import os
-import shutil
+import argparse
 from pathlib import Path
 from collections import defaultdict
 
+from materialize import LINK_STRATEGIES, materialize_files, format_link_counts
+
 # Directories to search for labeled data
 SEARCH_DIRS = [
     "labeled_new_dataset",
@@ -19,8 +21,13 @@ SEARCH_DIRS = [
 
 OUTPUT_DIR = "final_labeled_dataset"
 
-def collect_latest_labels():
-    """Collect the latest version of each labeled image"""
+def collect_latest_labels(strategy="hardlink"):
+    """
+    Collect the latest version of each labeled image
+
+    Images are placed with strategy (see materialize.py); labels are always
+    copied, since the labeling tools edit them in place.
+    """
 
     # Track latest version of each image
     latest_files = {}  # image_name -> (image_path, label_path, mtime)
@@ -56,16 +63,16 @@ def collect_latest_labels():
     output_path = Path(OUTPUT_DIR)
     output_path.mkdir(exist_ok=True)
 
-    # Copy latest versions
-    print(f"📋 Copying latest versions to {OUTPUT_DIR}...\n")
+    # Place latest versions
+    print(f"📋 Placing latest versions in {OUTPUT_DIR} ({strategy})...\n")
+
+    images = [(img_path, output_path / Path(img_path).name) for img_path, _, _ in latest_files.values()]
+    labels = [(label_path, output_path / Path(label_path).name) for _, label_path, _ in latest_files.values()]
+    link_counts = materialize_files(images, strategy) + materialize_files(labels, "copy")
 
     stats = defaultdict(int)
 
     for img_name, (img_path, label_path, mtime) in latest_files.items():
-        # Copy image and label
-        shutil.copy2(img_path, output_path / Path(img_path).name)
-        shutil.copy2(label_path, output_path / Path(label_path).name)
-
         # Count labels per image
         with open(label_path) as f:
             num_labels = len([l for l in f.readlines() if l.strip()])
@@ -85,12 +92,18 @@ def collect_latest_labels():
     print(f"Images with annotations:    {stats['images_with_labels']}")
     print(f"Total annotations:          {stats['total_annotations']}")
     print(f"Average per image:          {stats['total_annotations']/stats['total_images']:.1f}")
+    print(f"Files placed:               {format_link_counts(link_counts)}")
     print(f"Output directory:           {OUTPUT_DIR}/")
     print(f"{'='*60}\n")
 
     return output_path
 
 if __name__ == "__main__":
-    collect_latest_labels()
+    parser = argparse.ArgumentParser(description="Collect the latest version of each labeled image")
+    parser.add_argument("--link", choices=LINK_STRATEGIES, default="hardlink",
+                        help="How images are placed (falls back to copy across filesystems); labels are copied")
+    args = parser.parse_args()
+
+    collect_latest_labels(args.link)
     print("✅ Ready for augmentation!")
     print(f"   Next: python augment_dataset.py --input_dir {OUTPUT_DIR}")
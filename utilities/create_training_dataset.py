@@ -8,24 +8,16 @@ import cv2
 import numpy as np
 import os
 from pathlib import Path
-import shutil
 import argparse
 
+import geometric
+from photometric import adjust_brightness
+from image_codecs import ImageCodec, CodecStats, format_codec_table
+from materialize import LINK_STRATEGIES, materialize_files, format_link_counts
+
 def flip_horizontal(image, bboxes):
     """Flip image horizontally and adjust bboxes"""
-    flipped_image = cv2.flip(image, 1)
-    flipped_bboxes = []
-    for bbox in bboxes:
-        x_center, y_center, width, height = bbox
-        new_x_center = 1.0 - x_center
-        flipped_bboxes.append([new_x_center, y_center, width, height])
-    return flipped_image, flipped_bboxes
-
-def adjust_brightness(image, factor=1.2):
-    """Adjust image brightness"""
-    bright_image = image.astype(np.float32) * factor
-    bright_image = np.clip(bright_image, 0, 255).astype(np.uint8)
-    return bright_image
+    return cv2.flip(image, 1), geometric.flip_boxes(bboxes, horizontal=True)
 
 def load_yolo_annotations(label_file):
     """Load YOLO format annotations"""
@@ -47,23 +39,61 @@ def load_yolo_annotations(label_file):
 
 def save_yolo_annotations(annotations, class_labels, output_file):
     """Save YOLO format annotations"""
+    # A new file, never written through a link to another label
+    Path(output_file).unlink(missing_ok=True)
     with open(output_file, 'w') as f:
         for bbox, class_id in zip(annotations, class_labels):
             x_center, y_center, width, height = bbox
             f.write(f"{class_id} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n")
 
-def augment_dataset(input_dir, output_dir):
-    """Create augmented training dataset"""
+# Variants written next to each original, as augment_dataset.py recipe ops
+VARIANTS = {
+    "hflip": [["hflip"]],
+    "bright": [["brightness", 1.3]],
+    "dark": [["brightness", 0.7]],
+}
+
+# Extra variants with --rotations: clockwise quarter turns
+ROTATIONS = {
+    "rot90": 1,
+    "rot180": 2,
+    "rot270": 3,
+}
+
+def write_recipe(valid_pairs, output_dir, grayscale=False, rotations=False):
+    """Describe the dataset as an augment_dataset.py recipe instead of writing the images"""
+    from augment_dataset import RECIPE_NAME, save_recipe, source_entry
+
+    entries = []
+    for image_path, label_path in valid_pairs:
+        source = source_entry(image_path, label_path)
+        entries.append(dict(source, name=image_path.stem, ops=[]))
+        for variant, ops in VARIANTS.items():
+            entries.append(dict(source, name=f"{image_path.stem}_{variant}", ops=ops))
+        if rotations:
+            for variant, turns in ROTATIONS.items():
+                entries.append(dict(source, name=f"{image_path.stem}_{variant}", ops=[["rot90", turns]]))
+
+    recipe_path = Path(output_dir) / RECIPE_NAME
+    save_recipe(recipe_path, entries, grayscale)
+    print(f"✅ Recipe for {len(entries)} training images written to {recipe_path} - no images were written")
+    print(f"   Train on it with lazy_training.py, or write the files with "
+          f"augment_dataset.py --materialize {recipe_path}")
+
+def augment_dataset(input_dir, output_dir, grayscale=False, lazy=False, rotations=False, codec="png",
+                    photometric_codec=None, link="hardlink"):
+    """
+    Create augmented training dataset (or only its recipe, with lazy=True)
+
+    Written images are encoded with codec (see image_codecs.py); the brightness
+    variants use photometric_codec if given. Original images are placed with
+    the link strategy (see materialize.py) instead of being copied; labels are
+    always copied, since the labeling tools edit them in place.
+    """
 
     input_path = Path(input_dir)
     output_path = Path(output_dir)
 
-    # Create output directories
-    images_dir = output_path / "images"
-    labels_dir = output_path / "labels"
-    images_dir.mkdir(parents=True, exist_ok=True)
-    labels_dir.mkdir(parents=True, exist_ok=True)
-
     print(f"🚀 Creating Augmented Training Dataset")
     print(f"📂 Input:  {input_dir}")
     print(f"📂 Output: {output_dir}\n")
@@ -79,17 +109,35 @@ def augment_dataset(input_dir, output_dir):
 
     print(f"Found {len(valid_pairs)} image-label pairs\n")
 
+    if lazy:
+        write_recipe(sorted(valid_pairs), output_dir, grayscale, rotations)
+        return
+
+    # Create output directories
+    images_dir = output_path / "images"
+    labels_dir = output_path / "labels"
+    images_dir.mkdir(parents=True, exist_ok=True)
+    labels_dir.mkdir(parents=True, exist_ok=True)
+
+    codec = ImageCodec(codec)
+    photometric_codec = ImageCodec(photometric_codec) if photometric_codec else codec
+    codec_stats = CodecStats()
+    originals = []
+    labels = []
+
     stats = {
         'original': 0,
         'hflip': 0,
         'bright': 0,
         'dark': 0,
+        'rotations': 0,
         'total_annotations': 0
     }
 
     for idx, (image_path, label_path) in enumerate(valid_pairs, 1):
         # Load image and annotations
-        image = cv2.imread(str(image_path))
+        read_flag = cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR
+        image = cv2.imread(str(image_path), read_flag)
         if image is None:
             print(f"⚠️  Skipping {image_path.name} (failed to load)")
             continue
@@ -100,33 +148,51 @@ def augment_dataset(input_dir, output_dir):
         # Count annotations
         stats['total_annotations'] += len(annotations)
 
-        # 1. Copy original
-        shutil.copy2(image_path, images_dir / f"{original_name}.png")
-        shutil.copy2(label_path, labels_dir / f"{original_name}.txt")
+        # 1. Link original (re-encoded as single channel in grayscale mode); placed in one batch below
+        if grayscale:
+            codec.write(images_dir / f"{original_name}{codec.extension}", image, codec_stats)
+        else:
+            originals.append((image_path, images_dir / f"{original_name}.png"))
+        labels.append((label_path, labels_dir / f"{original_name}.txt"))
         stats['original'] += 1
 
         # 2. Horizontal flip
         flip_img, flip_bbox = flip_horizontal(image, annotations)
-        cv2.imwrite(str(images_dir / f"{original_name}_hflip.png"), flip_img)
+        codec.write(images_dir / f"{original_name}_hflip{codec.extension}", flip_img, codec_stats)
         save_yolo_annotations(flip_bbox, class_labels, labels_dir / f"{original_name}_hflip.txt")
         stats['hflip'] += 1
 
         # 3. Brightness increase
         bright_img = adjust_brightness(image, 1.3)
-        cv2.imwrite(str(images_dir / f"{original_name}_bright.png"), bright_img)
+        photometric_codec.write(images_dir / f"{original_name}_bright{photometric_codec.extension}", bright_img,
+                                codec_stats)
         save_yolo_annotations(annotations, class_labels, labels_dir / f"{original_name}_bright.txt")
         stats['bright'] += 1
 
         # 4. Brightness decrease
         dark_img = adjust_brightness(image, 0.7)
-        cv2.imwrite(str(images_dir / f"{original_name}_dark.png"), dark_img)
+        photometric_codec.write(images_dir / f"{original_name}_dark{photometric_codec.extension}", dark_img,
+                                codec_stats)
         save_yolo_annotations(annotations, class_labels, labels_dir / f"{original_name}_dark.txt")
         stats['dark'] += 1
 
+        # 5. Quarter turns (optional)
+        if rotations:
+            rows = np.column_stack([class_labels, annotations]) if class_labels else np.zeros((0, 5))
+            for variant, turns in ROTATIONS.items():
+                rot_img, rot_labels = geometric.rotate90(image, rows, turns)
+                codec.write(images_dir / f"{original_name}_{variant}{codec.extension}", rot_img, codec_stats)
+                save_yolo_annotations(rot_labels[:, 1:], rot_labels[:, 0].astype(int),
+                                      labels_dir / f"{original_name}_{variant}.txt")
+                stats['rotations'] += 1
+
         if idx % 50 == 0:
             print(f"  Processed {idx}/{len(valid_pairs)} images...")
 
-    total_images = stats['original'] + stats['hflip'] + stats['bright'] + stats['dark']
+    link_counts = materialize_files(originals, link)
+    materialize_files(labels, "copy")
+
+    total_images = stats['original'] + stats['hflip'] + stats['bright'] + stats['dark'] + stats['rotations']
 
     print(f"\n{'='*60}")
     print(f"📊 AUGMENTATION SUMMARY")
@@ -134,10 +200,14 @@ def augment_dataset(input_dir, output_dir):
     print(f"Original images:        {stats['original']}")
     print(f"Horizontal flips:       {stats['hflip']}")
     print(f"Brightness augments:    {stats['bright'] + stats['dark']}")
+    if rotations:
+        print(f"Rotations:              {stats['rotations']}")
     print(f"Total training images:  {total_images}")
     print(f"Total annotations:      {stats['total_annotations']}")
+    print(f"Originals placed:       {format_link_counts(link_counts) or 'none'}")
     print(f"Output directory:       {output_dir}/")
     print(f"{'='*60}\n")
+    print(f"🖼️  Encoded images:\n{format_codec_table(codec_stats.rows())}\n")
 
     print("✅ Augmented dataset created successfully!")
     print(f"\n📁 Training structure:")
@@ -150,6 +220,20 @@ if __name__ == "__main__":
                        help="Directory with latest labeled images")
     parser.add_argument("--output_dir", default="training_dataset_final",
                        help="Output directory for augmented dataset")
+    parser.add_argument("--grayscale", action="store_true",
+                       help="Augment and store single-channel images (black/white drawings)")
+    parser.add_argument("--lazy", action="store_true",
+                       help="Only write recipe.json; the variants are built at read time (see lazy_training.py)")
+
+    parser.add_argument("--rotations", action="store_true",
+                       help="Also write 90/180/270 degree rotations of each image")
+    parser.add_argument("--codec", default="png",
+                       help="Image codec: png, png:0-9 (compression level), webp (lossless), qoi or jpeg:quality")
+    parser.add_argument("--photometric_codec", default=None,
+                       help="Codec for the brightness variants, e.g. jpeg:90 (default: --codec)")
+    parser.add_argument("--link", choices=LINK_STRATEGIES, default="hardlink",
+                       help="How original images are placed (falls back to copy across filesystems); labels are copied")
 
     args = parser.parse_args()
-    augment_dataset(args.input_dir, args.output_dir)
+    augment_dataset(args.input_dir, args.output_dir, args.grayscale, args.lazy, args.rotations,
+                    args.codec, args.photometric_codec, args.link)
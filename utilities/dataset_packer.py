@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Streaming Dataset Packer
+Streams train/val splits straight into an uncompressed zip or fixed-size tar shards,
+with no intermediate copy of the dataset, and resumes where an interrupted run stopped
+"""
+
+import io
+import os
+import json
+import time
+import shutil
+import tarfile
+import zipfile
+import hashlib
+from pathlib import Path
+
+from tqdm import tqdm
+
+from class_balance import CLASS_NAMES
+
+ARCHIVE_FORMATS = ("zip", "tar")
+
+# Top-level folder inside the archive; the Colab scripts extract to /content/<root>
+DATASET_ROOT = "yolo_training_dataset"
+
+STATE_SUFFIX = ".pack.json"
+
+# Progress is saved after this much data, so an interrupted run redoes at most this much
+DEFAULT_CHECKPOINT_MB = 256
+
+_COPY_BUFFER = 1 << 20
+_MB = 1 << 20
+
+def find_classes_file(*dirs):
+    """First classes.txt (as the annotation tool writes it) in dirs, or None"""
+    for directory in dirs:
+        path = Path(directory) / "classes.txt"
+        if path.exists():
+            return path
+    return None
+
+def load_class_names(classes_file=None):
+    """Class names from classes.txt, one per line in class id order; the default four without one"""
+    if classes_file is None:
+        return [CLASS_NAMES[class_id] for class_id in sorted(CLASS_NAMES)]
+    with open(classes_file, encoding="utf-8") as f:
+        names = [line.strip() for line in f if line.strip()]
+    if not names:
+        raise ValueError(f"{classes_file} lists no classes")
+    return names
+
+def dataset_yaml(class_names, splits=("train", "val")):
+    """dataset.yaml text for a YOLO tree with images/<split> and labels/<split> folders"""
+    lines = ["# YOLO Shape Detection Dataset",
+             f"# Classes: {', '.join(class_names)}",
+             "",
+             "# Dataset paths (relative to this file)",
+             "path: .  # dataset root dir"]
+    lines += [f"{split}: images/{split}  # {split} images (relative to 'path')" for split in splits]
+    names = ", ".join(json.dumps(name, ensure_ascii=False) for name in class_names)
+    lines += ["",
+              "# Classes",
+              f"nc: {len(class_names)}  # number of classes",
+              f"names: [{names}]  # class names",
+              ""]
+    return "\n".join(lines)
+
+def plan_members(splits, class_names, root=DATASET_ROOT):
+    """
+    Archive members for {split: [(image_path, label_path), ...]}
+
+    Returns (arcname, source) pairs in packing order; source is a file path, or
+    bytes for the generated dataset.yaml.
+    """
+    members = [(f"{root}/dataset.yaml", dataset_yaml(class_names, tuple(splits)).encode("utf-8"))]
+    for split, pairs in splits.items():
+        for image_path, label_path in pairs:
+            image_path, label_path = Path(image_path), Path(label_path)
+            members.append((f"{root}/images/{split}/{image_path.name}", image_path))
+            members.append((f"{root}/labels/{split}/{image_path.stem}.txt", label_path))
+    return members
+
+def _member_size(source):
+    return len(source) if isinstance(source, bytes) else os.stat(source).st_size
+
+def _fingerprint(members, archive_format, shard_mb):
+    """Changes whenever a rerun would produce different archives"""
+    digest = hashlib.sha256(json.dumps([archive_format, shard_mb]).encode())
+    for arcname, source in members:
+        if isinstance(source, bytes):
+            identity = hashlib.sha256(source).hexdigest()
+        else:
+            stat = os.stat(source)
+            identity = [str(Path(source).resolve()), stat.st_size, stat.st_mtime_ns]
+        digest.update(json.dumps([arcname, identity]).encode())
+    return digest.hexdigest()
+
+def assign_shards(sizes, shard_bytes=0):
+    """Shard index per member; a new shard starts before a member that would overflow shard_bytes (0: one shard)"""
+    shards = []
+    shard, used = 0, 0
+    for size in sizes:
+        if shard_bytes and used and used + size > shard_bytes:
+            shard, used = shard + 1, 0
+        shards.append(shard)
+        used += size
+    return shards
+
+def shard_paths(output, count):
+    """Archive path per shard: output itself, or output-00000.tar, output-00001.tar, ..."""
+    output = Path(output)
+    if count == 1:
+        return [output]
+    return [output.with_name(f"{output.stem}-{index:05d}{output.suffix}") for index in range(count)]
+
+class _ZipShard:
+    """
+    Uncompressed zip being written
+
+    A checkpoint closes the archive, which writes its central directory, and keeps
+    a copy of that directory next to it. Appending overwrites the directory in the
+    archive, so resuming cuts the file back to the checkpoint and puts the copy back.
+    """
+
+    def __init__(self, path, members=0, size=0):
+        self.path = Path(path)
+        self.tail_path = self.path.with_name(f".{self.path.name}.tail")
+        if members:
+            tail = self.tail_path.read_bytes()
+            with open(self.path, "r+b") as f:
+                f.truncate(size)
+                f.seek(size)
+                f.write(tail)
+        self.zf = zipfile.ZipFile(self.path, "a" if members else "w", zipfile.ZIP_STORED, allowZip64=True)
+        if len(self.zf.infolist()) != members:
+            self.zf.close()
+            raise ValueError(f"{self.path.name} does not match its checkpoint")
+
+    def add(self, arcname, source):
+        if isinstance(source, bytes):
+            self.zf.writestr(zipfile.ZipInfo(arcname, time.localtime()[:6]), source)
+            return
+        info = zipfile.ZipInfo.from_file(source, arcname)
+        with open(source, "rb") as src, self.zf.open(info, "w") as dst:
+            shutil.copyfileobj(src, dst, _COPY_BUFFER)
+
+    def checkpoint(self):
+        """Make everything written so far recoverable; returns the resume offset"""
+        self.zf.close()
+        offset = self.zf.start_dir
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            tail = f.read()
+        tmp_path = self.tail_path.with_name(self.tail_path.name + ".tmp")
+        tmp_path.write_bytes(tail)
+        os.replace(tmp_path, self.tail_path)
+        self.zf = zipfile.ZipFile(self.path, "a", zipfile.ZIP_STORED, allowZip64=True)
+        return offset
+
+    def close(self):
+        """Finish the archive; returns its size"""
+        self.zf.close()
+        self.tail_path.unlink(missing_ok=True)
+        return self.path.stat().st_size
+
+class _TarShard:
+    """Tar shard being written; members are only appended, so resuming just cuts off a partial member"""
+
+    def __init__(self, path, members=0, size=0):
+        self.path = Path(path)
+        if members:
+            with open(self.path, "r+b") as f:
+                f.truncate(size)
+                f.seek(size)
+                # End-of-archive marker, so append mode stops at the last complete member
+                f.write(b"\0" * tarfile.BLOCKSIZE * 2)
+            self.tf = tarfile.open(self.path, "a", copybufsize=_COPY_BUFFER)
+            if len(self.tf.members) != members:
+                self.tf.close()
+                raise ValueError(f"{self.path.name} does not match its checkpoint")
+        else:
+            self.tf = tarfile.open(self.path, "w", format=tarfile.PAX_FORMAT, copybufsize=_COPY_BUFFER)
+
+    def add(self, arcname, source):
+        if isinstance(source, bytes):
+            info = tarfile.TarInfo(arcname)
+            info.size = len(source)
+            info.mtime = int(time.time())
+            self.tf.addfile(info, io.BytesIO(source))
+            return
+        with open(source, "rb") as f:
+            # fstat of the opened file, so a symlinked source is packed with its target's bytes
+            info = self.tf.gettarinfo(arcname=arcname, fileobj=f)
+            info.uid = info.gid = 0
+            info.uname = info.gname = ""
+            self.tf.addfile(info, f)
+
+    def checkpoint(self):
+        self.tf.fileobj.flush()
+        return self.tf.offset
+
+    def close(self):
+        self.tf.close()
+        return self.path.stat().st_size
+
+_WRITERS = {"zip": _ZipShard, "tar": _TarShard}
+
+def _load_state(state_path):
+    try:
+        with open(state_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _save_state(state_path, state):
+    tmp_path = state_path.with_name(state_path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, state_path)
+
+def pack_dataset(members, output, archive_format="zip", shard_mb=0,
+                 checkpoint_mb=DEFAULT_CHECKPOINT_MB, resume=True):
+    """
+    Stream members ((arcname, path or bytes) pairs, see plan_members) into archives
+
+    Files are read once and written once, uncompressed (images are already
+    compressed). shard_mb > 0 splits the members over archives of at most that
+    many MB of file data each. Progress is kept in <output>.pack.json: a rerun
+    with the same members and settings skips finished shards and continues the
+    unfinished one from its last checkpoint; anything else starts over.
+
+    Returns:
+        List of archive paths
+    """
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ValueError(f"Unknown archive format '{archive_format}' (expected one of {', '.join(ARCHIVE_FORMATS)})")
+
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    sizes = [_member_size(source) for _, source in members]
+    shards = assign_shards(sizes, shard_mb * _MB)
+    paths = shard_paths(output, shards[-1] + 1 if shards else 1)
+
+    state_path = output.with_name(output.name + STATE_SUFFIX)
+    fingerprint = _fingerprint(members, archive_format, shard_mb)
+    state = _load_state(state_path) if resume else None
+    if state is None or state.get("fingerprint") != fingerprint:
+        if state is not None:
+            print("🔄 Inputs or settings changed since the last run, packing from scratch")
+            for name in state.get("shards", {}):
+                if name not in {path.name for path in paths}:
+                    (output.parent / name).unlink(missing_ok=True)
+        state = {"fingerprint": fingerprint, "format": archive_format, "shards": {}}
+
+    # Members of each shard are a contiguous range
+    bounds = {}
+    for index, shard in enumerate(shards):
+        first, _ = bounds.get(shard, (index, index))
+        bounds[shard] = (first, index + 1)
+
+    done_bytes = 0
+    for shard, path in enumerate(paths):
+        entry = state["shards"].get(path.name)
+        if entry:
+            first, _ = bounds.get(shard, (0, 0))
+            done_bytes += sum(sizes[first:first + entry["members"]])
+
+    total_bytes = sum(sizes)
+    written = 0
+    start_time = time.perf_counter()
+    checkpoint_bytes = checkpoint_mb * _MB
+    with tqdm(total=total_bytes, initial=done_bytes, unit="B", unit_scale=True, unit_divisor=1024,
+              desc=f"Packing {output.name}") as progress:
+        for shard, path in enumerate(paths):
+            first, last = bounds.get(shard, (0, 0))
+            entry = state["shards"].get(path.name, {"members": 0, "size": 0, "complete": False})
+            if entry["complete"] and path.exists() and path.stat().st_size == entry["size"]:
+                continue
+
+            try:
+                writer = _WRITERS[archive_format](path, entry["members"], entry["size"]) if entry["members"] else None
+            except (OSError, ValueError, tarfile.TarError, zipfile.BadZipFile) as e:
+                print(f"⚠️  Cannot resume {path.name} ({e}), rewriting it")
+                writer = None
+            if writer is None:
+                progress.update(-sum(sizes[first:first + entry["members"]]))
+                entry = {"members": 0, "size": 0, "complete": False}
+                writer = _WRITERS[archive_format](path)
+
+            since_checkpoint = 0
+            for index in range(first + entry["members"], last):
+                arcname, source = members[index]
+                writer.add(arcname, source)
+                progress.update(sizes[index])
+                written += sizes[index]
+                since_checkpoint += sizes[index]
+                if since_checkpoint >= checkpoint_bytes and index + 1 < last:
+                    entry.update(members=index + 1 - first, size=writer.checkpoint())
+                    state["shards"][path.name] = entry
+                    _save_state(state_path, state)
+                    since_checkpoint = 0
+
+            entry.update(members=last - first, size=writer.close(), complete=True)
+            state["shards"][path.name] = entry
+            _save_state(state_path, state)
+
+    elapsed = time.perf_counter() - start_time
+    archive_bytes = sum(path.stat().st_size for path in paths)
+    print(f"📦 Packed {len(members)} files into {len(paths)} {archive_format} archive(s), "
+          f"{archive_bytes / 1e6:.1f} MB")
+    if written:
+        print(f"   Wrote {written / 1e6:.1f} MB in {elapsed:.1f}s ({written / 1e6 / max(elapsed, 1e-9):.1f} MB/s)")
+    else:
+        print(f"   Already up to date")
+    return paths
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Stratified, Group-Aware Train/Val Splitter
+Keeps all pages of a source document and all augmented copies of an image on the same
+side of the split, and balances class presence between train and val
+
+    python dataset_split.py --labels_dir ../augmented_dataset/labels --class_index class_index.json
+    python prepare_colab_dataset.py --class_index class_index.json
+"""
+
+import re
+import json
+import random
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+import class_balance
+from create_training_dataset import VARIANTS, ROTATIONS
+
+# <stem>_aug_<name> from augment_dataset.py, <stem>_<variant> from create_training_dataset.py
+_AUGMENTED = re.compile(r"^(?P<parent>.+?)(?:_aug_[A-Za-z0-9]+|_(?:%s))$"
+                        % "|".join(re.escape(variant) for variant in list(VARIANTS) + list(ROTATIONS)))
+# Rendered PDF pages: <document>_page_001 (batch_detect), <document>_page1 (annotation tool)
+_PAGE = re.compile(r"^(?P<document>.+)_page_?\d+$")
+# augment_dataset.py --mosaics output, built from four originals
+_MOSAIC = re.compile(r"^mosaic_\d+$")
+
+def parent_stem(stem):
+    """Stem of the original an augmented image was made from (the stem itself for originals)"""
+    match = _AUGMENTED.match(stem)
+    while match:
+        stem = match.group("parent")
+        match = _AUGMENTED.match(stem)
+    return stem
+
+def is_mosaic(stem):
+    """True for augment_dataset.py mosaics and their augmented copies"""
+    return bool(_MOSAIC.match(parent_stem(stem)))
+
+def _document(parent):
+    match = _PAGE.match(parent)
+    return match.group("document") if match else parent
+
+def group_of(stem):
+    """
+    Split group of an image: its source document for PDF pages, else its original
+
+    >>> group_of("CO25S001783_page_002_aug_hflip"), group_of("CO25S001783_page2_hflip")
+    ('CO25S001783', 'CO25S001783')
+    >>> group_of("p7_aug_noise")
+    'p7'
+    """
+    return _document(parent_stem(stem))
+
+def recipe_mosaics(recipe_path):
+    """{mosaic stem: stems of its four tiles} from an augment_dataset.py recipe.json"""
+    with open(recipe_path) as f:
+        recipe = json.load(f)
+    return {entry["name"]: [Path(tile["image"]).stem for tile in entry["mosaic"]]
+            for entry in recipe["entries"] if "mosaic" in entry}
+
+def stratified_group_split(index, val_ratio=0.2, seed=42, mosaics=None):
+    """
+    Split {stem: annotations per class} (a class_balance index) into train and val
+
+    Groups (see group_of) are placed whole, the groups with the rarest classes
+    first (largest first among equals, shuffled by seed before that). Each goes to
+    the split with the larger share still missing of the images containing the
+    group's rarest class, or of all images for groups without annotations.
+    A mosaic goes to train when every tile (mosaics, see recipe_mosaics) is in
+    train and is left out otherwise; mosaics without tile information go to train.
+
+    Returns:
+        ({"train": [stems], "val": [stems]}, [left-out mosaic stems])
+    """
+    groups = {}
+    mosaic_stems = []
+    for stem in sorted(index):
+        parent = parent_stem(stem)
+        if _MOSAIC.match(parent):
+            mosaic_stems.append(stem)
+        else:
+            groups.setdefault(_document(parent), []).append(stem)
+
+    # Images containing each class, per group
+    names = list(groups)
+    stems = [stem for name in names for stem in groups[name]]
+    num_classes = max([len(class_balance.CLASS_NAMES)] + [len(counts) for counts in index.values()])
+    stem_presence = np.array([index[stem] + [0] * (num_classes - len(index[stem])) for stem in stems]).reshape(-1, num_classes) > 0
+    group_ids = np.repeat(np.arange(len(names)), [len(groups[name]) for name in names])
+    presence = np.zeros((len(names), num_classes))
+    np.add.at(presence, group_ids, stem_presence)
+    sizes = np.bincount(group_ids, minlength=len(names)).astype(np.float64)
+
+    class_totals = presence.sum(axis=0)
+    rarest_total = np.where(presence > 0, class_totals, np.inf).min(axis=1)
+    rarest = np.where(np.isfinite(rarest_total), np.where(presence > 0, class_totals, np.inf).argmin(axis=1), -1)
+
+    shares = np.array([1 - val_ratio, val_ratio])
+    target = np.column_stack([shares[:, None] * class_totals, shares * sizes.sum()])
+    filled = np.zeros_like(target)
+    counts = np.column_stack([presence, sizes])
+
+    order = list(range(len(names)))
+    random.Random(seed).shuffle(order)
+    order.sort(key=lambda row: (rarest_total[row], -sizes[row]))
+
+    assignment = {}
+    for row in order:
+        # Column of the group's rarest class, or the image count
+        column = rarest[row] if rarest[row] >= 0 else num_classes
+        missing = (target[:, column] - filled[:, column]) / np.maximum(target[:, column], 1e-9)
+        if missing[0] == missing[1]:
+            missing = (target[:, num_classes] - filled[:, num_classes]) / np.maximum(target[:, num_classes], 1e-9)
+        side = int(np.argmax(missing))
+        filled[side] += counts[row]
+        assignment[names[row]] = side
+
+    splits = {"train": [], "val": []}
+    for name, side in assignment.items():
+        splits["val" if side else "train"].extend(groups[name])
+
+    left_out = []
+    for stem in mosaic_stems:
+        tiles = (mosaics or {}).get(parent_stem(stem))
+        if tiles is None or all(assignment.get(group_of(tile), 0) == 0 for tile in tiles):
+            splits["train"].append(stem)
+        else:
+            left_out.append(stem)
+    return {split: sorted(stems) for split, stems in splits.items()}, left_out
+
+def format_split(index, splits):
+    """Images, groups and share of the images containing each class, per split"""
+    num_classes = max([len(class_balance.CLASS_NAMES)] + [len(counts) for counts in index.values()])
+    names = [class_balance.CLASS_NAMES.get(class_id, str(class_id)) for class_id in range(num_classes)]
+    presence = {split: np.zeros(num_classes) for split in splits}
+    for split, stems in splits.items():
+        for stem in stems:
+            counts = np.asarray(index[stem])
+            presence[split][:len(counts)] += counts > 0
+    totals = np.maximum(sum(presence.values()), 1)
+
+    lines = [f"   {'split':<8}{'images':>8}{'groups':>8}" + "".join(f"{name:>10}" for name in names)]
+    for split, stems in splits.items():
+        groups = len({group_of(stem) for stem in stems})
+        shares = "".join(f"{share * 100:>9.1f}%" for share in presence[split] / totals)
+        lines.append(f"   {split:<8}{len(stems):>8}{groups:>8}{shares}")
+    return "\n".join(lines)
+
+def print_mosaic_notes(splits, left_out, mosaics):
+    """Report mosaics that were left out, or placed without knowing their tiles"""
+    if left_out:
+        print(f"   {len(left_out)} mosaics mix train and val pages and are left out")
+    unplaced = [stem for stem in splits["train"] if is_mosaic(stem)] if mosaics is None else []
+    if unplaced:
+        print(f"⚠️  {len(unplaced)} mosaics went to train without knowing their tiles; "
+              f"pass the recipe.json so mosaics of val pages are left out")
+
+def main():
+    parser = argparse.ArgumentParser(description="Preview a stratified, group-aware train/val split")
+    parser.add_argument("--labels_dir", default="augmented_dataset/labels", help="YOLO label files")
+    parser.add_argument("--class_index", default=None,
+                        help="Class-count index from class_balance.py (written if missing)")
+    parser.add_argument("--recipe", default=None, help="augment_dataset.py recipe.json, to place mosaics")
+    parser.add_argument("--val_ratio", type=float, default=0.2, help="Share of images used for validation")
+    parser.add_argument("--seed", type=int, default=42, help="Tie-break seed")
+    parser.add_argument("--output", default=None, help="Write the split as JSON {train: [...], val: [...]}")
+    args = parser.parse_args()
+
+    label_paths = sorted(Path(args.labels_dir).glob("*.txt"))
+    if not label_paths:
+        print(f"❌ No label files in {args.labels_dir}")
+        exit(1)
+    index = class_balance.index_for(label_paths, args.class_index)
+    mosaics = recipe_mosaics(args.recipe) if args.recipe else None
+    splits, left_out = stratified_group_split(index, args.val_ratio, args.seed, mosaics)
+
+    print(f"✂️  Split {len(index)} images into {len({group_of(stem) for stem in index})} groups:")
+    print(format_split(index, splits))
+    print_mosaic_notes(splits, left_out, mosaics)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(dict(splits, left_out=left_out), f, indent=1)
+        print(f"✅ Split written to {args.output}")
+
+if __name__ == "__main__":
+    main()
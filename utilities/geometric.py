@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Geometric Augmentations
+Flips, quarter-turn rotations, scale, translate, crop and mosaic with vectorized box transforms
+
+Box transforms work on (N, 4) arrays of normalized x_center, y_center, width, height and
+move all boxes at once. Those that can push boxes out of the image clip them and return
+a keep mask that drops degenerate ones: thinner than MIN_BOX_PIXELS, or with less than
+MIN_VISIBILITY of their area left. The image-level functions take labels as (N, 5)
+arrays (class first, YOLO order) and return them with dropped boxes removed.
+
+Box math uses continuous pixel coordinates (the image spans 0..width), so a box drawn
+on the image and the transformed box agree to within interpolation error.
+"""
+
+import math
+
+import cv2
+import numpy as np
+
+MIN_BOX_PIXELS = 2
+MIN_VISIBILITY = 0.25
+
+# Background for areas a transform uncovers - the drawings are on white paper
+FILL = 255
+
+# Recipe op names handled by apply()
+GEOMETRIC_OPS = ("hflip", "vflip", "rot90", "scale", "translate", "crop")
+
+def yolo_to_xyxy(boxes, width, height):
+    """(N, 4) normalized x_center, y_center, w, h -> (N, 4) pixel x1, y1, x2, y2"""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    half = boxes[:, 2:] / 2
+    return np.hstack([boxes[:, :2] - half, boxes[:, :2] + half]) * [width, height, width, height]
+
+def xyxy_to_yolo(xyxy, width, height):
+    """(N, 4) pixel x1, y1, x2, y2 -> (N, 4) normalized x_center, y_center, w, h"""
+    xyxy = np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)
+    return np.hstack([(xyxy[:, :2] + xyxy[:, 2:]) / 2, xyxy[:, 2:] - xyxy[:, :2]]) / [width, height, width, height]
+
+def clip_boxes(xyxy, window, min_size=MIN_BOX_PIXELS, min_visibility=MIN_VISIBILITY):
+    """
+    Clip pixel boxes to window (x1, y1, x2, y2)
+
+    Returns:
+        (clipped boxes, keep mask) - keep is False for boxes thinner than min_size
+        or with less than min_visibility of their area inside the window
+    """
+    xyxy = np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)
+    clipped = np.clip(xyxy, [window[0], window[1]] * 2, [window[2], window[3]] * 2)
+    sizes = clipped[:, 2:] - clipped[:, :2]
+    area = np.prod(np.maximum(xyxy[:, 2:] - xyxy[:, :2], 0), axis=1)
+    visible = np.prod(sizes, axis=1)
+    keep = (sizes >= min_size).all(axis=1) & (visible >= min_visibility * area)
+    return clipped, keep
+
+def transform_corners(xyxy, matrix):
+    """Axis-aligned bounds of pixel boxes mapped through a 2x3 affine matrix"""
+    xyxy = np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)
+    corners = xyxy[:, [[0, 1], [2, 1], [0, 3], [2, 3]]]          # (N, 4 corners, 2)
+    mapped = corners @ np.asarray(matrix)[:, :2].T + np.asarray(matrix)[:, 2]
+    return np.hstack([mapped.min(axis=1), mapped.max(axis=1)])
+
+# Box transforms on (N, 4) normalized x_center, y_center, w, h arrays.
+# The ones that can push boxes out of the image also return a keep mask.
+
+def flip_boxes(boxes, horizontal=True):
+    boxes = np.array(boxes, dtype=np.float64).reshape(-1, 4)
+    axis = 0 if horizontal else 1
+    boxes[:, axis] = 1.0 - boxes[:, axis]
+    return boxes
+
+def rotate90_boxes(boxes, turns):
+    """Boxes after rotating the image by `turns` quarter turns clockwise"""
+    x, y, w, h = np.asarray(boxes, dtype=np.float64).reshape(-1, 4).T
+    turns %= 4
+    if turns == 1:
+        return np.column_stack([1.0 - y, x, h, w])
+    if turns == 2:
+        return np.column_stack([1.0 - x, 1.0 - y, w, h])
+    if turns == 3:
+        return np.column_stack([y, 1.0 - x, h, w])
+    return np.column_stack([x, y, w, h])
+
+def affine_boxes(boxes, size, matrix, out_size=None, min_size=MIN_BOX_PIXELS, min_visibility=MIN_VISIBILITY):
+    """Boxes and keep mask after warping a size=(width, height) image by matrix into out_size (default: same)"""
+    out_width, out_height = out_size or size
+    xyxy = transform_corners(yolo_to_xyxy(boxes, *size), matrix)
+    xyxy, keep = clip_boxes(xyxy, (0, 0, out_width, out_height), min_size, min_visibility)
+    return xyxy_to_yolo(xyxy, out_width, out_height), keep
+
+def crop_boxes(boxes, size, window, min_size=MIN_BOX_PIXELS, min_visibility=MIN_VISIBILITY):
+    """Boxes and keep mask after cropping a size=(width, height) image to the pixel window (x1, y1, x2, y2)"""
+    x1, y1, x2, y2 = window
+    xyxy = yolo_to_xyxy(boxes, *size) - [x1, y1, x1, y1]
+    xyxy, keep = clip_boxes(xyxy, (0, 0, x2 - x1, y2 - y1), min_size, min_visibility)
+    return xyxy_to_yolo(xyxy, x2 - x1, y2 - y1), keep
+
+def _labels(labels):
+    return np.asarray(labels, dtype=np.float64).reshape(-1, 5)
+
+def _relabel(labels, boxes, keep=None):
+    """Class column with new boxes, dropped boxes removed"""
+    labels = np.column_stack([labels[:, 0], boxes])
+    return labels if keep is None else labels[keep]
+
+def scale_matrix(size, factor):
+    """Zoom by factor about the image center (continuous pixel coordinates)"""
+    cx, cy = size[0] / 2, size[1] / 2
+    return np.array([[factor, 0, cx * (1 - factor)], [0, factor, cy * (1 - factor)]])
+
+def translate_matrix(size, dx, dy):
+    """Shift by dx, dy as fractions of the image width and height"""
+    return np.array([[1, 0, dx * size[0]], [0, 1, dy * size[1]]], dtype=np.float64)
+
+def warp(image, matrix, out_size=None, fill=FILL):
+    """cv2.warpAffine with a continuous-coordinate matrix (pixel centers at +0.5)"""
+    matrix = np.asarray(matrix, dtype=np.float64)
+    pixel_matrix = matrix.copy()
+    pixel_matrix[:, 2] += matrix[:, :2] @ [0.5, 0.5] - 0.5
+    out_size = out_size or (image.shape[1], image.shape[0])
+    border = (fill,) * (image.shape[2] if image.ndim == 3 else 1)
+    return cv2.warpAffine(image, pixel_matrix, out_size, flags=cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=border)
+
+_ROTATIONS = {1: cv2.ROTATE_90_CLOCKWISE, 2: cv2.ROTATE_180, 3: cv2.ROTATE_90_COUNTERCLOCKWISE}
+
+def crop_window(size, window):
+    """Pixel window for a normalized (x1, y1, x2, y2) crop, at least one pixel each way"""
+    width, height = size
+    x1, y1 = int(round(window[0] * width)), int(round(window[1] * height))
+    x2 = max(int(round(window[2] * width)), x1 + 1)
+    y2 = max(int(round(window[3] * height)), y1 + 1)
+    return x1, y1, x2, y2
+
+def apply(op, params, labels, size, image=None, fill=FILL):
+    """
+    One geometric recipe op on labels, and on image if given
+
+    size is the (width, height) of the image before the op, so boxes can be moved
+    without decoding the pixels. Returns (image, labels, size after the op).
+    Params: hflip/vflip none, rot90 [turns clockwise], scale [factor],
+    translate [dx, dy] (fractions), crop [x1, y1, x2, y2] (normalized window).
+    """
+    labels = _labels(labels)
+    if op in ("hflip", "vflip"):
+        labels = _relabel(labels, flip_boxes(labels[:, 1:], horizontal=op == "hflip"))
+        if image is not None:
+            image = cv2.flip(image, 1 if op == "hflip" else 0)
+    elif op == "rot90":
+        turns = int(params[0]) % 4
+        labels = _relabel(labels, rotate90_boxes(labels[:, 1:], turns))
+        if image is not None and turns:
+            image = cv2.rotate(image, _ROTATIONS[turns])
+        if turns % 2:
+            size = (size[1], size[0])
+    elif op in ("scale", "translate"):
+        matrix = scale_matrix(size, *params) if op == "scale" else translate_matrix(size, *params)
+        labels = _relabel(labels, *affine_boxes(labels[:, 1:], size, matrix))
+        if image is not None:
+            image = warp(image, matrix, fill=fill)
+    elif op == "crop":
+        x1, y1, x2, y2 = crop_window(size, params)
+        labels = _relabel(labels, *crop_boxes(labels[:, 1:], size, (x1, y1, x2, y2)))
+        if image is not None:
+            image = image[y1:y2, x1:x2].copy()
+        size = (x2 - x1, y2 - y1)
+    else:
+        raise ValueError(f"Unknown geometric op '{op}'")
+    return image, labels, size
+
+def flip(image, labels, horizontal=True):
+    image, labels, _ = apply("hflip" if horizontal else "vflip", [], labels, image.shape[1::-1], image)
+    return image, labels
+
+def rotate90(image, labels, turns=1):
+    """Rotate by `turns` quarter turns clockwise"""
+    image, labels, _ = apply("rot90", [turns], labels, image.shape[1::-1], image)
+    return image, labels
+
+def scale(image, labels, factor, fill=FILL):
+    """Zoom about the center keeping the canvas size (factor < 1 pads with fill)"""
+    image, labels, _ = apply("scale", [factor], labels, image.shape[1::-1], image, fill)
+    return image, labels
+
+def translate(image, labels, dx, dy, fill=FILL):
+    """Shift by dx, dy as fractions of the image size, padding with fill"""
+    image, labels, _ = apply("translate", [dx, dy], labels, image.shape[1::-1], image, fill)
+    return image, labels
+
+def crop(image, labels, window):
+    """Crop to the normalized window (x1, y1, x2, y2)"""
+    image, labels, _ = apply("crop", list(window), labels, image.shape[1::-1], image)
+    return image, labels
+
+def random_window(rng, min_side=0.6):
+    """Normalized crop window keeping at least min_side of each dimension"""
+    sides = rng.uniform(min_side, 1.0, 2)
+    origin = rng.uniform(0, 1, 2) * (1 - sides)
+    return [round(float(v), 4) for v in (origin[0], origin[1], origin[0] + sides[0], origin[1] + sides[1])]
+
+def mosaic_layout(tile_sizes, size, center=(0.5, 0.5)):
+    """
+    Where each of four tiles goes in a 2x2 mosaic of size (width, height)
+
+    The tiles fill the quadrants around center (normalized) in reading order.
+    Each tile is scaled to cover its quadrant and center-cropped to it.
+    Returns one (quadrant window, resized (width, height), crop offset) per tile,
+    or None for a tile whose quadrant is empty.
+    """
+    width, height = size
+    cx, cy = int(round(center[0] * width)), int(round(center[1] * height))
+    quadrants = [(0, 0, cx, cy), (cx, 0, width, cy), (0, cy, cx, height), (cx, cy, width, height)]
+
+    layout = []
+    for (tile_width, tile_height), (x1, y1, x2, y2) in zip(tile_sizes, quadrants):
+        quad_width, quad_height = x2 - x1, y2 - y1
+        if quad_width <= 0 or quad_height <= 0:
+            layout.append(None)
+            continue
+        factor = max(quad_width / tile_width, quad_height / tile_height)
+        resized = (max(math.ceil(tile_width * factor), quad_width), max(math.ceil(tile_height * factor), quad_height))
+        offset = ((resized[0] - quad_width) // 2, (resized[1] - quad_height) // 2)
+        layout.append(((x1, y1, x2, y2), resized, offset))
+    return layout
+
+def mosaic_labels(tile_labels, tile_sizes, size, center=(0.5, 0.5),
+                  min_size=MIN_BOX_PIXELS, min_visibility=MIN_VISIBILITY):
+    """Labels of a mosaic built from four tiles, without touching any pixels"""
+    width, height = size
+    merged = [np.zeros((0, 5))]
+    for labels, tile_size, placement in zip(tile_labels, tile_sizes, mosaic_layout(tile_sizes, size, center)):
+        if placement is None:
+            continue
+        (x1, y1, x2, y2), resized, offset = placement
+        labels = _labels(labels)
+        # Normalized boxes scale with the resize, so map straight into the resized tile
+        xyxy = yolo_to_xyxy(labels[:, 1:], *resized) - [offset[0] - x1, offset[1] - y1] * 2
+        xyxy, keep = clip_boxes(xyxy, (x1, y1, x2, y2), min_size, min_visibility)
+        merged.append(_relabel(labels, xyxy_to_yolo(xyxy, width, height), keep))
+    return np.vstack(merged)
+
+def mosaic(tiles, center=(0.5, 0.5), size=None, fill=FILL):
+    """
+    2x2 mosaic of four (image, labels) tiles
+
+    size is the output (width, height), default the first tile's. All tiles must have
+    the same channel count.
+    """
+    tile_sizes = [image.shape[1::-1] for image, _ in tiles]
+    size = size or tile_sizes[0]
+    first = tiles[0][0]
+    canvas = np.full((size[1], size[0]) + first.shape[2:], fill, dtype=first.dtype)
+    for (image, _), placement in zip(tiles, mosaic_layout(tile_sizes, size, center)):
+        if placement is None:
+            continue
+        (x1, y1, x2, y2), resized, (ox, oy) = placement
+        resized_image = cv2.resize(image, resized, interpolation=cv2.INTER_AREA)
+        canvas[y1:y2, x1:x2] = resized_image[oy:oy + y2 - y1, ox:ox + x2 - x1]
+    return canvas, mosaic_labels([labels for _, labels in tiles], tile_sizes, size, center)
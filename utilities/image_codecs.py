@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Image Output Codecs
+Encoders for generated images - PNG at a chosen compression level, lossless WebP,
+QOI or JPEG - plus the size/speed numbers to choose between them
+"""
+
+import time
+from functools import lru_cache
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# png[:level]    - lossless; level 0 (fastest, largest) .. 9 (slowest, smallest), default OpenCV's
+# webp           - lossless WebP; smaller than PNG, slower to encode
+# qoi            - lossless QOI; fast on line drawings, PNG-sized; not read by OpenCV builds without QOI or ultralytics
+# jpeg[:quality] - lossy; only safe where exact pixels do not matter (default quality 95)
+CODEC_NAMES = ("png", "webp", "qoi", "jpeg")
+EXTENSIONS = {"png": ".png", "webp": ".webp", "qoi": ".qoi", "jpeg": ".jpg"}
+DEFAULT_JPEG_QUALITY = 95
+
+# Longest run a single QOI_OP_RUN byte encodes
+QOI_RUN_MAX = 62
+
+# Compared by compare_codecs unless told otherwise
+COMPARED_CODECS = ("png", "png:1", "png:9", "webp", "qoi", "jpeg:90")
+
+class ImageCodec:
+    """One output encoding, parsed from a spec such as "png", "png:1", "webp", "qoi" or "jpeg:90" """
+
+    def __init__(self, spec="png"):
+        name, _, param = str(spec).lower().partition(":")
+        if name == "jpg":
+            name = "jpeg"
+        if name not in CODEC_NAMES:
+            raise ValueError(f"Unknown codec '{spec}' (expected one of {', '.join(CODEC_NAMES)})")
+        if param and name not in ("png", "jpeg"):
+            raise ValueError(f"Codec '{name}' takes no parameter")
+
+        self.name = name
+        self.level = None
+        self.quality = None
+        if name == "png" and param:
+            self.level = int(param)
+            if not 0 <= self.level <= 9:
+                raise ValueError(f"PNG compression level must be 0-9, got {self.level}")
+        elif name == "jpeg":
+            self.quality = int(param) if param else DEFAULT_JPEG_QUALITY
+            if not 1 <= self.quality <= 100:
+                raise ValueError(f"JPEG quality must be 1-100, got {self.quality}")
+
+        self.extension = EXTENSIONS[name]
+        self.lossy = name == "jpeg"
+
+    @property
+    def spec(self):
+        if self.level is not None:
+            return f"png:{self.level}"
+        if self.quality is not None:
+            return f"jpeg:{self.quality}"
+        return self.name
+
+    def __str__(self):
+        return self.spec
+
+    def __repr__(self):
+        return f"ImageCodec({self.spec!r})"
+
+    def encode(self, image, bilevel=False):
+        """Encoded bytes of a BGR or single-channel image (bilevel: packed 1-bit PNG)"""
+        if self.name == "png":
+            params = [] if self.level is None else [cv2.IMWRITE_PNG_COMPRESSION, self.level]
+            if bilevel and image.ndim == 2:
+                params += [cv2.IMWRITE_PNG_BILEVEL, 1]
+            return _imencode(".png", image, params)
+        if self.name == "webp":
+            # Quality above 100 selects lossless WebP
+            return _imencode(".webp", image, [cv2.IMWRITE_WEBP_QUALITY, 101])
+        if self.name == "jpeg":
+            return _imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return _encode_qoi(image)
+
+    def write(self, path, image, stats=None, bilevel=False):
+        """
+        Encode image to path with this codec's extension; returns the path written
+
+        path's own extension is replaced, so pass the full file name: a stem such
+        as "plan.rev2_hflip" would lose everything after its dot.
+        stats (a CodecStats) records the encode time and size.
+        """
+        path = Path(path).with_suffix(self.extension)
+        start = time.perf_counter()
+        data = self.encode(image, bilevel)
+        if stats is not None:
+            stats.add(self.spec, len(data), time.perf_counter() - start)
+        # A new file, never written through a hardlink or symlink to a source image
+        path.unlink(missing_ok=True)
+        path.write_bytes(data)
+        return path
+
+def _imencode(extension, image, params):
+    ok, buffer = cv2.imencode(extension, image, params)
+    if not ok:
+        raise ValueError(f"OpenCV could not encode {extension}")
+    return buffer.tobytes()
+
+def _encode_qoi(image):
+    """QOI via OpenCV when it was built with it, otherwise the numpy encoder below"""
+    if cv2.haveImageWriter(".qoi"):
+        return _imencode(".qoi", image, [])
+    if image.ndim == 2:
+        return _encode_qoi_rgb(cv2.cvtColor(image, cv2.COLOR_GRAY2RGB))
+    return _encode_qoi_rgb(cv2.cvtColor(image, cv2.COLOR_BGRA2RGB if image.shape[2] == 4 else cv2.COLOR_BGR2RGB))
+
+def _encode_qoi_rgb(rgb):
+    """
+    QOI bytes of an (H, W, 3) uint8 RGB image, as the reference encoder writes them
+
+    The reference encoder walks the pixels one by one; here only pixels that differ
+    from their predecessor are looked at individually, which on line drawings is
+    about 1% of the page.
+    """
+    height, width = rgb.shape[:2]
+    flat = np.ascontiguousarray(rgb).reshape(-1)
+    n = height * width
+
+    # Pixels equal to their predecessor (the first one is compared to opaque black) extend a run;
+    # only the others - the literals - are written with an op of their own
+    same = np.empty(n, bool)
+    same[0] = not flat[:3].any()
+    equal = flat[3:] == flat[:-3]
+    same[1:] = equal[0::3] & equal[1::3] & equal[2::3]
+    literals = np.flatnonzero(~same)
+
+    # Gathering 3-byte items is much faster than gathering rows of a (n, 3) array
+    items = flat.view("V3")
+    pixels = items[literals].view(np.uint8).reshape(-1, 3)
+    previous = items[np.maximum(literals - 1, 0)].view(np.uint8).reshape(-1, 3).copy()
+    if len(literals) and literals[0] == 0:
+        previous[0] = 0
+    r, g, b = (pixels[:, channel].astype(np.int32) for channel in range(3))
+    hashes = ((r * 3 + g * 5 + b * 7 + 255 * 11) % 64).astype(np.uint8)
+
+    # Index hit: the latest earlier literal with the same hash has the same color (run pixels
+    # repeat the literal that started them, so they never change what the index holds)
+    packed = (r << 16) | (g << 8) | b
+    hit = np.zeros(len(literals), bool)
+    order = np.argsort(hashes, kind="stable")  # radix sort for uint8 keys
+    same_hash = hashes[order[1:]] == hashes[order[:-1]]
+    later, earlier = order[1:][same_hash], order[:-1][same_hash]
+    hit[later] = packed[later] == packed[earlier]
+
+    # Differences to the previous pixel wrap around as signed bytes
+    wrapped = pixels - previous
+    dr, dg, db = (wrapped[:, channel].view(np.int8).astype(np.int32) for channel in range(3))
+    dr_dg = (wrapped[:, 0] - wrapped[:, 1]).view(np.int8).astype(np.int32)
+    db_dg = (wrapped[:, 2] - wrapped[:, 1]).view(np.int8).astype(np.int32)
+    diff = ~hit & (dr >= -2) & (dr <= 1) & (dg >= -2) & (dg <= 1) & (db >= -2) & (db <= 1)
+    luma = (~hit & ~diff & (dg >= -32) & (dg <= 31) & (dr_dg >= -8) & (dr_dg <= 7)
+            & (db_dg >= -8) & (db_dg <= 7))
+    rgb_op = ~hit & ~diff & ~luma
+
+    # The run before each literal (and the one ending the image) is written as
+    # full 62-pixel chunks followed by the remainder
+    bounds = np.concatenate([[-1], literals, [n]])
+    run_lengths = np.diff(bounds) - 1
+    run_bytes = -(-run_lengths // QOI_RUN_MAX)
+    op_bytes = np.ones(len(literals), np.int64) + luma + rgb_op * 3
+    sizes = run_bytes.copy()
+    sizes[:-1] += op_bytes
+    starts = np.cumsum(sizes) - sizes
+
+    body = np.full(int(sizes.sum()), 0xC0 | (QOI_RUN_MAX - 1), np.uint8)
+    remainder = run_lengths % QOI_RUN_MAX
+    partial = remainder > 0
+    body[(starts + run_bytes - 1)[partial]] = 0xC0 | (remainder[partial] - 1)
+
+    at = (starts + run_bytes)[:-1]
+    body[at[hit]] = hashes[hit]
+    body[at[diff]] = 0x40 | ((dr[diff] + 2) << 4) | ((dg[diff] + 2) << 2) | (db[diff] + 2)
+    body[at[luma]] = 0x80 | (dg[luma] + 32)
+    body[at[luma] + 1] = ((dr_dg[luma] + 8) << 4) | (db_dg[luma] + 8)
+    at_rgb = at[rgb_op]
+    body[at_rgb] = 0xFE
+    for channel in range(3):
+        body[at_rgb + 1 + channel] = pixels[rgb_op, channel]
+
+    header = b"qoif" + width.to_bytes(4, "big") + height.to_bytes(4, "big") + bytes([3, 0])
+    return header + body.tobytes() + b"\x00" * 7 + b"\x01"
+
+def image_extensions():
+    """Every extension a codec can write, for globbing generated image folders"""
+    return sorted(set(EXTENSIONS.values()))
+
+class CodecStats:
+    """Images, bytes and encode seconds per codec spec; merge() adds another process's totals"""
+
+    def __init__(self, totals=None):
+        self.totals = {spec: list(values) for spec, values in (totals or {}).items()}
+
+    def add(self, spec, size, seconds):
+        images, total_bytes, total_seconds = self.totals.get(spec, (0, 0, 0.0))
+        self.totals[spec] = [images + 1, total_bytes + size, total_seconds + seconds]
+
+    def merge(self, totals):
+        for spec, (images, size, seconds) in dict(totals).items():
+            current = self.totals.get(spec, [0, 0, 0.0])
+            self.totals[spec] = [current[0] + images, current[1] + size, current[2] + seconds]
+
+    def rows(self):
+        return [(spec, images, size, seconds) for spec, (images, size, seconds) in self.totals.items()]
+
+def compare_codecs(images, specs=COMPARED_CODECS):
+    """
+    Encode sample images with every codec in specs
+
+    Returns rows of (spec, images, bytes, seconds) for format_codec_table
+    (compare against baseline "png").
+    """
+    stats = CodecStats()
+    for spec in specs:
+        codec = ImageCodec(spec)
+        for image in images:
+            start = time.perf_counter()
+            data = codec.encode(image)
+            stats.add(codec.spec, len(data), time.perf_counter() - start)
+    return stats.rows()
+
+def format_codec_table(rows, baseline=None):
+    """Size/speed table; with a baseline spec, each codec's size relative to it"""
+    reference = {spec: size / max(images, 1) for spec, images, size, _ in rows}.get(baseline)
+    header = f"   {'codec':<10}{'images':>8}{'MB':>10}{'KB/img':>10}{'ms/img':>10}"
+    lines = [header + (f"{'vs ' + baseline:>10}" if reference else "")]
+    for spec, images, size, seconds in rows:
+        per_image = size / max(images, 1)
+        line = f"   {spec:<10}{images:>8}{size / 1e6:>10.2f}{per_image / 1e3:>10.1f}{seconds / max(images, 1) * 1000:>10.1f}"
+        if reference:
+            line += f"{per_image / reference:>9.2f}x"
+        lines.append(line)
+    return "\n".join(lines)
+
+@lru_cache(maxsize=None)
+def decodable(spec):
+    """True if OpenCV (and so the labeling tools) can read images written with this codec"""
+    probe = np.zeros((8, 8, 3), np.uint8)
+    try:
+        return cv2.imdecode(np.frombuffer(ImageCodec(spec).encode(probe), np.uint8), cv2.IMREAD_COLOR) is not None
+    except cv2.error:
+        return False
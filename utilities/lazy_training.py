@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Train on a Lazy Augmentation Recipe
+Plugs LazyAugmentedDataset into ultralytics training: augmented images are built
+when the dataloader asks for them, so none of them are ever written to disk
+
+    python augment_dataset.py --lazy --output_dir augmented_dataset
+    python lazy_training.py --recipe augmented_dataset/recipe.json --data yolo_training_dataset/dataset.yaml
+
+or from a notebook:
+    model.train(data="dataset.yaml", trainer=lazy_trainer("augmented_dataset/recipe.json"), ...)
+
+The training split comes from the recipe; validation still uses the val split in dataset.yaml.
+"""
+
+import math
+import argparse
+from pathlib import Path
+
+import cv2
+from ultralytics import YOLO
+from ultralytics.data import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer
+
+from augment_dataset import LazyAugmentedDataset
+
+class LazyYOLODataset(YOLODataset):
+    """YOLODataset whose images and labels come from a recipe instead of files"""
+
+    def __init__(self, recipe_path, *args, **kwargs):
+        self.recipe = LazyAugmentedDataset(recipe_path)
+        # Disk/RAM caching would rebuild exactly the copies the recipe avoids
+        kwargs["cache"] = None
+        super().__init__(*args, **kwargs)
+
+    def get_img_files(self, img_path):
+        # Where materialize() would put each file; only used for names in logs and plots
+        images_dir = self.recipe.recipe_path.parent / "images"
+        return [str(images_dir / f"{entry['name']}.png") for entry in self.recipe.entries]
+
+    def get_labels(self):
+        labels = []
+        for i in range(len(self.recipe)):
+            boxes, (width, height) = self.recipe.labels(i)
+            labels.append({
+                "im_file": self.im_files[i],
+                "shape": (height, width),
+                "cls": boxes[:, :1],
+                "bboxes": boxes[:, 1:],
+                "segments": [],
+                "keypoints": None,
+                "normalized": True,
+                "bbox_format": "xywh",
+            })
+        return labels
+
+    def load_image(self, i, rect_mode=True):
+        """Same contract as BaseDataset.load_image, with the image built from the recipe"""
+        if self.ims[i] is not None:
+            return self.ims[i], self.im_hw0[i], self.im_hw[i]
+
+        im, _ = self.recipe[i]
+        if im.ndim == 2:
+            im = cv2.cvtColor(im, cv2.COLOR_GRAY2BGR)
+        h0, w0 = im.shape[:2]
+        if rect_mode:
+            r = self.imgsz / max(h0, w0)
+            if r != 1:
+                w, h = (min(math.ceil(w0 * r), self.imgsz), min(math.ceil(h0 * r), self.imgsz))
+                im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+        elif not (h0 == w0 == self.imgsz):
+            im = cv2.resize(im, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
+
+        # Mosaic draws its extra images from this buffer
+        if self.augment:
+            self.ims[i], self.im_hw0[i], self.im_hw[i] = im, (h0, w0), im.shape[:2]
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                j = self.buffer.pop(0)
+                self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+
+        return im, (h0, w0), im.shape[:2]
+
+class LazyAugmentTrainer(DetectionTrainer):
+    """DetectionTrainer that builds the training split from recipe_path (set by lazy_trainer)"""
+
+    recipe_path = None
+
+    def build_dataset(self, img_path, mode="train", batch=None):
+        if mode != "train":
+            return super().build_dataset(img_path, mode, batch)
+
+        model = getattr(self.model, "module", self.model)
+        stride = max(int(model.stride.max()), 32) if hasattr(model, "stride") else 32
+        return LazyYOLODataset(
+            self.recipe_path,
+            img_path=img_path,
+            imgsz=self.args.imgsz,
+            batch_size=batch,
+            augment=True,
+            hyp=self.args,
+            rect=False,
+            single_cls=self.args.single_cls or False,
+            stride=stride,
+            pad=0.0,
+            prefix="train (lazy): ",
+            task=self.args.task,
+            classes=self.args.classes,
+            data=self.data,
+            fraction=self.args.fraction,
+        )
+
+def lazy_trainer(recipe_path):
+    """Trainer class for model.train(trainer=...) that trains on the given recipe"""
+    recipe_path = str(Path(recipe_path).resolve())
+    return type("LazyAugmentTrainer", (LazyAugmentTrainer,), {"recipe_path": recipe_path})
+
+def main():
+    parser = argparse.ArgumentParser(description="Train YOLO on a lazy augmentation recipe")
+    parser.add_argument("--recipe", required=True, help="recipe.json written by augment_dataset.py --lazy")
+    parser.add_argument("--data", required=True, help="dataset.yaml (class names and val split)")
+    parser.add_argument("--model", default="yolov8n.pt", help="Starting weights")
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--device", default=None, help="e.g. 0 or cpu (default: auto)")
+    parser.add_argument("--project", default="shape_detection")
+    parser.add_argument("--name", default="yolov8_shapes_lazy")
+    args = parser.parse_args()
+
+    dataset = LazyAugmentedDataset(args.recipe)
+    originals = sum(1 for entry in dataset.entries if not entry["ops"])
+    print(f"🚀 Training on {len(dataset)} images ({originals} originals) from {args.recipe}")
+
+    model = YOLO(args.model)
+    results = model.train(data=args.data, trainer=lazy_trainer(args.recipe), epochs=args.epochs,
+                          imgsz=args.imgsz, batch=args.batch, device=args.device,
+                          project=args.project, name=args.name)
+    print(f"\n✅ Training complete! Weights in {results.save_dir}/weights/")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Dataset Materialization Helpers
+Places files into output trees by hardlink, symlink, reflink or copy instead of
+copying or re-encoding them, many files at a time
+"""
+
+import os
+import errno
+import shutil
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# hardlink - same inode, zero extra bytes; needs the same filesystem
+# symlink  - points at the source; zero bytes, any filesystem, but breaks if the source moves
+# reflink  - copy-on-write clone (btrfs, XFS, APFS); needs filesystem support
+# copy     - plain byte copy, always works
+LINK_STRATEGIES = ("hardlink", "symlink", "reflink", "copy")
+
+# What each strategy falls back to, in order, when the filesystem refuses it
+_FALLBACKS = {
+    "hardlink": ("hardlink", "reflink", "copy"),
+    "symlink": ("symlink", "copy"),
+    "reflink": ("reflink", "copy"),
+    "copy": ("copy",),
+}
+
+# Errors that mean "not between these filesystems", as opposed to a problem with one file
+_FILESYSTEM_ERRORS = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL, errno.ENOSYS}
+
+# (strategy, source device, destination device) combinations that failed that way,
+# so the remaining files of a batch go straight to the fallback
+_unsupported = set()
+
+# Threads for materialize_files; file operations wait on the disk, not the CPU
+DEFAULT_WORKERS = min(16, 4 * (os.cpu_count() or 1))
+
+# Files per thread pool task
+_BATCH_SIZE = 256
+
+# Linux FICLONE ioctl number (_IOW(0x94, 9, int))
+_FICLONE = 0x40049409
+
+def _reflink(src, dst):
+    """Clone src to dst with copy-on-write; raises OSError when unsupported"""
+    if sys.platform.startswith("linux"):
+        import fcntl
+
+        with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+            try:
+                fcntl.ioctl(dst_file.fileno(), _FICLONE, src_file.fileno())
+            except OSError:
+                dst_file.close()
+                os.unlink(dst)
+                raise
+        shutil.copystat(src, dst)
+        return
+
+    if sys.platform == "darwin":
+        import subprocess
+
+        # cp -c uses clonefile(2) on APFS
+        result = subprocess.run(["cp", "-c", str(src), str(dst)], capture_output=True)
+        if result.returncode != 0:
+            raise OSError(result.stderr.decode(errors="replace").strip() or "clonefile failed")
+        return
+
+    raise OSError(f"reflink not supported on {sys.platform}")
+
+def check_strategy(strategy):
+    if strategy not in LINK_STRATEGIES:
+        raise ValueError(f"Unknown link strategy '{strategy}' (expected one of {', '.join(LINK_STRATEGIES)})")
+
+def _place(src, dst, strategy):
+    if strategy == "hardlink":
+        os.link(src, dst)
+    elif strategy == "symlink":
+        os.symlink(src.resolve(), dst)
+    elif strategy == "reflink":
+        _reflink(src, dst)
+    else:
+        shutil.copy2(src, dst)
+
+def link_file(src, dst, strategy="hardlink"):
+    """
+    Place src at dst using the given strategy, falling back toward a plain copy
+    (hardlink -> reflink -> copy, symlink -> copy) where the filesystems refuse it
+
+    An existing dst is replaced, unless it already is the requested hardlink or
+    symlink to src. Returns the strategy that was actually used.
+    """
+    check_strategy(strategy)
+
+    src, dst = Path(src), Path(dst)
+    if os.path.abspath(src) == os.path.abspath(dst):
+        return strategy
+    if os.path.lexists(dst):
+        if (strategy in ("hardlink", "symlink") and dst.exists() and os.path.samefile(src, dst)
+                and dst.is_symlink() == (strategy == "symlink")):
+            return strategy
+        dst.unlink()
+
+    devices = None
+    for candidate in _FALLBACKS[strategy]:
+        if candidate == "copy":
+            break
+        if devices is None:
+            devices = (os.stat(src).st_dev, os.stat(dst.parent).st_dev)
+        if (candidate, *devices) in _unsupported:
+            continue
+        try:
+            _place(src, dst, candidate)
+            return candidate
+        except OSError as e:
+            if e.errno in _FILESYSTEM_ERRORS:
+                _unsupported.add((candidate, *devices))
+
+    shutil.copy2(src, dst)
+    return "copy"
+
+def make_dirs(paths):
+    """Create the parent directory of every path, each distinct one once"""
+    for directory in sorted({Path(path).parent for path in paths}):
+        directory.mkdir(parents=True, exist_ok=True)
+
+def _link_batch(batch, strategy):
+    return Counter(link_file(src, dst, strategy) for src, dst in batch)
+
+def materialize_files(pairs, strategy="hardlink", workers=DEFAULT_WORKERS):
+    """
+    Place many (src, dst) files with link_file
+
+    Destination directories are created up front in one pass, then the files
+    are placed in batches on `workers` threads.
+
+    Returns:
+        Counter of the strategies actually used
+    """
+    check_strategy(strategy)
+    pairs = list(pairs)
+    make_dirs(dst for _, dst in pairs)
+
+    batches = [pairs[i:i + _BATCH_SIZE] for i in range(0, len(pairs), _BATCH_SIZE)]
+    counts = Counter()
+    if workers <= 1 or len(batches) <= 1:
+        for batch in batches:
+            counts += _link_batch(batch, strategy)
+        return counts
+    with ThreadPoolExecutor(min(workers, len(batches))) as pool:
+        for batch_counts in pool.map(_link_batch, batches, [strategy] * len(batches)):
+            counts += batch_counts
+    return counts
+
+def format_link_counts(counts):
+    """'1200 hardlink, 3 copy' for a materialize_files result"""
+    return ", ".join(f"{count} {strategy}" for strategy, count in sorted(counts.items(), key=lambda item: -item[1])) or "none"
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Content-Addressed Output Store
+SQLite manifest of the files a dataset writer produced, so identical files are
+hardlinked instead of stored twice and reruns skip outputs that are already current
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from pathlib import Path
+
+from materialize import link_file
+
+MANIFEST_NAME = "output_manifest.sqlite"
+
+# Bump when the bytes written for an unchanged entry change (encoder, label format, ...)
+STORE_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outputs (
+    path TEXT PRIMARY KEY,
+    entry_key TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS outputs_hash ON outputs (hash);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+"""
+
+def file_sha256(path, chunk_size=1 << 20):
+    """SHA-256 of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class OutputStore:
+    """
+    Manifest of one output directory
+
+    Every output is recorded with the key of the work that produced it (see
+    key) and the hash, size and mtime of its bytes. An output is current
+    when its key matches and the file on disk still has the recorded size and
+    mtime. New bytes whose hash is already on disk are hardlinked to that file.
+    Outputs are replaced, never written in place, so linked copies stay intact.
+    Several worker processes can share one manifest.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.output_dir / MANIFEST_NAME), timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    def source_hash(self, path):
+        """Content hash of a source file, rehashed only when its size or mtime changed"""
+        path = str(Path(path).resolve())
+        stat = os.stat(path)
+        row = self.conn.execute("SELECT size, mtime_ns, hash FROM sources WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+        digest = file_sha256(path)
+        self.conn.execute("INSERT OR REPLACE INTO sources (path, size, mtime_ns, hash) VALUES (?, ?, ?, ?)",
+                          (path, stat.st_size, stat.st_mtime_ns, digest))
+        self.conn.commit()
+        return digest
+
+    @staticmethod
+    def key(*parts):
+        """Key for the work behind an output: any JSON-serializable description of it"""
+        return hashlib.sha256(json.dumps([STORE_VERSION, *parts], sort_keys=True).encode()).hexdigest()
+
+    def _row(self, path):
+        return self.conn.execute("SELECT entry_key, hash, size, mtime_ns FROM outputs WHERE path = ?",
+                                 (self._relative(path),)).fetchone()
+
+    def _relative(self, path):
+        return os.path.relpath(Path(path).resolve(), self.output_dir.resolve())
+
+    @staticmethod
+    def _unchanged(path, size, mtime_ns):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return stat.st_size == size and stat.st_mtime_ns == mtime_ns
+
+    def current(self, path, entry_key):
+        """True if path was written for entry_key and has not changed since"""
+        row = self._row(path)
+        return row is not None and row[0] == entry_key and self._unchanged(path, row[2], row[3])
+
+    def _source_files(self, digest):
+        """(device, inode) of the known sources with these bytes"""
+        files = set()
+        for (path,) in self.conn.execute("SELECT path FROM sources WHERE hash = ?", (digest,)):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.add((stat.st_dev, stat.st_ino))
+        return files
+
+    def _existing(self, digest, path):
+        """
+        Another recorded output with these bytes that is still intact, or None
+
+        Outputs linked to a source (see put_file) are passed over, so a later
+        edit of the source never reaches outputs that were merely deduplicated.
+        """
+        rows = self.conn.execute("SELECT path, size, mtime_ns FROM outputs WHERE hash = ? AND path != ?",
+                                 (digest, self._relative(path))).fetchall()
+        sources = None
+        for other, size, mtime_ns in rows:
+            other = self.output_dir / other
+            if not self._unchanged(other, size, mtime_ns):
+                continue
+            if sources is None:
+                sources = self._source_files(digest)
+            stat = os.stat(other)
+            if (stat.st_dev, stat.st_ino) not in sources:
+                return other
+        return None
+
+    def _record(self, path, entry_key, digest):
+        stat = os.stat(path)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO outputs (path, entry_key, hash, size, mtime_ns, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (self._relative(path), entry_key, digest, stat.st_size, stat.st_mtime_ns, time.time()))
+        self.conn.commit()
+
+    def _place(self, path, digest, write):
+        """Hardlink path to an identical output if there is one, otherwise write it via a temp file"""
+        path = Path(path)
+        existing = self._existing(digest, path)
+        if existing is not None:
+            link_file(existing, path, "hardlink")
+            return "linked"
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        write(tmp_path)
+        os.replace(tmp_path, path)
+        return "written"
+
+    def put_bytes(self, path, data, entry_key):
+        """Store encoded bytes at path; returns 'linked' or 'written'"""
+        digest = hashlib.sha256(data).hexdigest()
+        result = self._place(path, digest, lambda tmp_path: Path(tmp_path).write_bytes(data))
+        self._record(path, entry_key, digest)
+        return result
+
+    def put_file(self, src, path, entry_key, link="copy"):
+        """Store src at path, placed with the link strategy (see materialize.py); returns 'linked' or 'written'"""
+        digest = self.source_hash(src)
+        result = self._place(path, digest, lambda tmp_path: link_file(src, tmp_path, link))
+        self._record(path, entry_key, digest)
+        return result
+
+    def remove(self, path):
+        """Delete an output and forget it"""
+        Path(path).unlink(missing_ok=True)
+        self.conn.execute("DELETE FROM outputs WHERE path = ?", (self._relative(path),))
+        self.conn.commit()
+
+    def summary(self):
+        """(outputs, distinct contents, bytes saved by hardlinks) over the whole manifest"""
+        outputs, distinct = self.conn.execute("SELECT COUNT(*), COUNT(DISTINCT hash) FROM outputs").fetchone()
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM outputs").fetchone()[0]
+        unique = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM outputs GROUP BY hash)").fetchone()[0]
+        return outputs, distinct, total - unique
+
+    def close(self):
+        self.conn.close()
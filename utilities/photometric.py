@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Photometric Augmentations
+Brightness, contrast and noise on uint8 images without float copies of the whole page
+
+Brightness and contrast are 256-entry lookup tables applied with cv2.LUT. A chain of
+them composes into one table, so any number of them costs a single pass over the image.
+The tables hold exactly the values the float32 arithmetic produced, so outputs are unchanged.
+"""
+
+import functools
+
+import cv2
+import numpy as np
+
+# Rows of noise drawn at a time - bounds the float32 scratch to one strip of the page
+NOISE_ROWS = 256
+
+_LEVELS = np.arange(256, dtype=np.float32)
+
+IDENTITY_LUT = np.arange(256, dtype=np.uint8)
+
+def _frozen(lut):
+    # Tables are cached and shared, so nobody may modify one in place
+    lut.flags.writeable = False
+    return lut
+
+@functools.lru_cache(maxsize=None)
+def brightness_lut(factor):
+    """Table for pixel * factor, clipped to 0-255"""
+    return _frozen(np.clip(_LEVELS * factor, 0, 255).astype(np.uint8))
+
+@functools.lru_cache(maxsize=None)
+def contrast_lut(factor):
+    """Table for (pixel - 127.5) * factor + 127.5, clipped to 0-255"""
+    return _frozen(np.clip((_LEVELS - 127.5) * factor + 127.5, 0, 255).astype(np.uint8))
+
+# Ops that are a per-pixel table, by recipe op name
+LUT_OPS = {
+    "brightness": brightness_lut,
+    "contrast": contrast_lut,
+}
+
+def compose(first, second):
+    """One table that applies first, then second"""
+    return second[first]
+
+def chain_lut(ops):
+    """Fused table for a sequence of [op, *params] LUT ops"""
+    lut = IDENTITY_LUT
+    for op, *params in ops:
+        lut = compose(lut, LUT_OPS[op](*params))
+    return lut
+
+def apply_lut(image, lut):
+    """Map every pixel (any channel count) through a 256-entry uint8 table"""
+    return cv2.LUT(image, lut)
+
+def adjust_brightness(image, factor=1.2):
+    """Adjust image brightness"""
+    return apply_lut(image, brightness_lut(factor))
+
+def adjust_contrast(image, factor=1.2):
+    """Adjust image contrast"""
+    return apply_lut(image, contrast_lut(factor))
+
+def add_noise(image, noise_factor=25, rng=None, rows=NOISE_ROWS):
+    """
+    Add Gaussian noise, drawn and added one strip of rows at a time
+
+    The generator yields the same values however the draws are split, so the
+    result matches a full-image draw while the scratch stays a few MB.
+    """
+    rng = rng or np.random.default_rng()
+    noisy_image = np.empty_like(image)
+    for y in range(0, image.shape[0], rows):
+        strip = image[y:y + rows]
+        noise = rng.standard_normal(strip.shape, dtype=np.float32)
+        noise *= noise_factor
+        noise += strip
+        np.clip(noise, 0, 255, out=noise)
+        noisy_image[y:y + rows] = noise
+    return noisy_image
@@ -1,14 +1,24 @@
 #!/usr/bin/env python3
 """
 Prepare YOLO dataset for Google Colab training
-Creates proper train/val split and YOLO format structure
+Creates proper train/val split and YOLO format structure, streamed into a
+zip (or tar shards) ready to upload
+
+    python prepare_colab_dataset.py                                   # yolo_training_dataset.zip
+    python prepare_colab_dataset.py --format tar --shard_mb 2048      # yolo_training_dataset-00000.tar, ...
+    python prepare_colab_dataset.py --format dir                      # yolo_training_dataset/ folder
 """
 
-import os
-import shutil
-import random
+import argparse
 from pathlib import Path
 
+import class_balance
+from image_codecs import image_extensions
+from materialize import LINK_STRATEGIES, materialize_files, format_link_counts
+from dataset_split import stratified_group_split, format_split, recipe_mosaics, print_mosaic_notes
+from dataset_packer import (ARCHIVE_FORMATS, DATASET_ROOT, DEFAULT_CHECKPOINT_MB, find_classes_file,
+                            load_class_names, dataset_yaml, plan_members, pack_dataset)
+
 def create_yolo_dataset_structure():
     """Create YOLO training dataset structure for Colab"""
 
@@ -24,75 +34,59 @@ def create_yolo_dataset_structure():
 
     return dataset_dir
 
-def split_dataset(source_images_dir, source_labels_dir, output_dir, train_ratio=0.8):
-    """Split dataset into train/validation sets"""
-
-    # Get all image files
-    image_files = list(Path(source_images_dir).glob("*.png"))
-
-    # Filter to only files with corresponding labels
-    valid_files = []
-    for img_file in image_files:
-        label_file = Path(source_labels_dir) / f"{img_file.stem}.txt"
-        if label_file.exists():
-            valid_files.append(img_file.stem)
-
-    # Shuffle and split
-    random.seed(42)  # For reproducible splits
-    random.shuffle(valid_files)
-
-    split_idx = int(len(valid_files) * train_ratio)
-    train_files = valid_files[:split_idx]
-    val_files = valid_files[split_idx:]
-
-    print(f"Total files: {len(valid_files)}")
-    print(f"Training files: {len(train_files)}")
-    print(f"Validation files: {len(val_files)}")
-
-    # Copy files to appropriate directories
-    for file_stem in train_files:
-        # Copy image
-        src_img = Path(source_images_dir) / f"{file_stem}.png"
-        dst_img = output_dir / "images" / "train" / f"{file_stem}.png"
-        shutil.copy2(src_img, dst_img)
-
-        # Copy label
-        src_label = Path(source_labels_dir) / f"{file_stem}.txt"
-        dst_label = output_dir / "labels" / "train" / f"{file_stem}.txt"
-        shutil.copy2(src_label, dst_label)
-
-    for file_stem in val_files:
-        # Copy image
-        src_img = Path(source_images_dir) / f"{file_stem}.png"
-        dst_img = output_dir / "images" / "val" / f"{file_stem}.png"
-        shutil.copy2(src_img, dst_img)
-
-        # Copy label
-        src_label = Path(source_labels_dir) / f"{file_stem}.txt"
-        dst_label = output_dir / "labels" / "val" / f"{file_stem}.txt"
-        shutil.copy2(src_label, dst_label)
-
-    return len(train_files), len(val_files)
-
-def create_dataset_yaml(output_dir):
+def find_pairs(source_images_dir, source_labels_dir):
+    """(image, label) paths for every image with a label file, sorted by name"""
+    pairs = []
+    for extension in image_extensions():
+        for img_file in Path(source_images_dir).glob(f"*{extension}"):
+            label_file = Path(source_labels_dir) / f"{img_file.stem}.txt"
+            if label_file.exists():
+                pairs.append((img_file, label_file))
+    return sorted(pairs)
+
+def split_pairs(pairs, train_ratio=0.8, seed=42, class_index=None, mosaics=None):
+    """
+    Cut pairs into {"train": [...], "val": [...]} with dataset_split
+
+    Pages of one document and augmented copies of one image stay together, and
+    class presence is balanced. Only label metadata is read (class_index is a
+    class_balance index, built if missing and
+    refreshed for edited labels); mosaics maps mosaic stems to their tiles.
+    """
+    pairs = list(pairs)
+    by_stem = {img_file.stem: (img_file, label_file) for img_file, label_file in pairs}
+    index = class_balance.index_for([label_file for _, label_file in pairs], class_index)
+    stem_splits, left_out = stratified_group_split(index, 1 - train_ratio, seed, mosaics)
+    splits = {split: [by_stem[stem] for stem in stems] for split, stems in stem_splits.items()}
+
+    print(f"Total files: {len(pairs)}")
+    print(f"Training files: {len(splits['train'])}")
+    print(f"Validation files: {len(splits['val'])}")
+    print(format_split(index, stem_splits))
+    print_mosaic_notes(stem_splits, left_out, mosaics)
+    return splits
+
+def split_dataset(source_images_dir, source_labels_dir, output_dir, train_ratio=0.8, seed=42,
+                  class_index=None, mosaics=None, strategy="hardlink"):
+    """Split dataset into train/validation sets; images placed with strategy (see materialize.py), labels copied"""
+    splits = split_pairs(find_pairs(source_images_dir, source_labels_dir), train_ratio, seed, class_index, mosaics)
+
+    images, labels = [], []
+    for split, pairs in splits.items():
+        for src_img, src_label in pairs:
+            images.append((src_img, output_dir / "images" / split / src_img.name))
+            labels.append((src_label, output_dir / "labels" / split / f"{src_img.stem}.txt"))
+    link_counts = materialize_files(images, strategy) + materialize_files(labels, "copy")
+    print(f"Placed {len(images) + len(labels)} files: {format_link_counts(link_counts)}")
+
+    return len(splits["train"]), len(splits["val"])
+
+def create_dataset_yaml(output_dir, class_names=None):
     """Create dataset.yaml configuration file"""
 
-    yaml_content = """# YOLO Shape Detection Dataset
-# Classes: straight, L-shape, U-shape, complex
-
-# Dataset paths (relative to this file)
-path: .  # dataset root dir
-train: images/train  # train images (relative to 'path')
-val: images/val  # val images (relative to 'path')
-
-# Classes
-nc: 4  # number of classes
-names: ['straight', 'L-shape', 'U-shape', 'complex']  # class names
-"""
-
     yaml_file = output_dir / "dataset.yaml"
-    with open(yaml_file, 'w') as f:
-        f.write(yaml_content)
+    with open(yaml_file, 'w', encoding='utf-8') as f:
+        f.write(dataset_yaml(class_names or load_class_names()))
 
     print(f"Created dataset.yaml at {yaml_file}")
 
@@ -156,10 +150,19 @@ def create_colab_instructions():
     instructions = """# Google Colab Training Instructions
 
 ## 1. Upload Dataset to Google Drive
-1. Compress the 'yolo_training_dataset' folder to ZIP
+1. Run prepare_colab_dataset.py; it writes yolo_training_dataset.zip (no need to compress anything)
 2. Upload the ZIP file to your Google Drive
 3. Or use the upload method below in Colab
 
+With `--format tar --shard_mb N` the dataset comes as yolo_training_dataset-00000.tar, -00001.tar, ...
+Upload them all and extract each one into the same folder:
+```python
+import glob, tarfile
+for shard in sorted(glob.glob('/content/drive/MyDrive/yolo_training_dataset-*.tar')):
+    with tarfile.open(shard) as tar:
+        tar.extractall('/content/')
+```
+
 ## 2. Google Colab Setup
 
 ### Option A: Upload directly to Colab
@@ -221,24 +224,72 @@ After training, download:
     print("Created COLAB_INSTRUCTIONS.md")
 
 def main():
-    print("🚀 Preparing YOLO dataset for Google Colab training")
+    parser = argparse.ArgumentParser(description="Prepare a YOLO train/val dataset for Google Colab")
+    parser.add_argument("--images_dir", default="augmented_dataset/images", help="Source images")
+    parser.add_argument("--labels_dir", default="augmented_dataset/labels", help="Source YOLO labels")
+    parser.add_argument("--format", choices=ARCHIVE_FORMATS + ("dir",), default="zip",
+                        help="Stream into an uncompressed zip, tar archive(s), or copy into a dataset folder")
+    parser.add_argument("--output", default=None,
+                        help=f"Archive path (default: {DATASET_ROOT}.zip / .tar)")
+    parser.add_argument("--link", choices=LINK_STRATEGIES, default="hardlink",
+                        help="With --format dir: how images are placed (falls back to copy across filesystems); labels are copied")
+    parser.add_argument("--shard_mb", type=int, default=0,
+                        help="Split the archive into shards of at most this many MB (0 = one archive)")
+    parser.add_argument("--classes", default=None,
+                        help="classes.txt for dataset.yaml (default: next to the labels, else the four shape classes)")
+    parser.add_argument("--train_ratio", type=float, default=0.8, help="Share of images used for training")
+    parser.add_argument("--seed", type=int, default=42, help="Tie-break seed for the split")
+    parser.add_argument("--class_index", default=None,
+                        help="Class-count index from class_balance.py, so the split reads no label files (written if missing)")
+    parser.add_argument("--recipe", default=None,
+                        help="augment_dataset.py recipe.json, to keep mosaics of val pages out of train "
+                             "(default: recipe.json next to the images folder)")
+    parser.add_argument("--checkpoint_mb", type=int, default=DEFAULT_CHECKPOINT_MB,
+                        help="Save packing progress after this many MB, for resuming")
+    parser.add_argument("--no_resume", action="store_true", help="Repack from scratch even if a previous run was interrupted")
+    args = parser.parse_args()
 
-    # Create dataset structure
-    print("\n📁 Creating YOLO dataset structure...")
-    output_dir = create_yolo_dataset_structure()
+    print("🚀 Preparing YOLO dataset for Google Colab training")
 
-    # Split dataset
-    print("\n🔄 Splitting dataset into train/validation sets...")
-    train_count, val_count = split_dataset(
-        "augmented_dataset/images",
-        "augmented_dataset/labels",
-        output_dir,
-        train_ratio=0.8
-    )
+    classes_file = args.classes or find_classes_file(args.labels_dir, Path(args.labels_dir).parent,
+                                                     Path(args.images_dir).parent)
+    try:
+        class_names = load_class_names(classes_file)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        exit(1)
+    if classes_file:
+        print(f"🏷️  {len(class_names)} classes from {classes_file}: {', '.join(class_names)}")
+    else:
+        print(f"⚠️  No classes.txt found, using the default classes: {', '.join(class_names)}")
+
+    recipe = args.recipe or Path(args.images_dir).parent / "recipe.json"
+    mosaics = recipe_mosaics(recipe) if Path(recipe).exists() else None
+
+    if args.format == "dir":
+        # Create dataset structure
+        print("\n📁 Creating YOLO dataset structure...")
+        output_dir = create_yolo_dataset_structure()
+
+        # Split dataset
+        print("\n🔄 Splitting dataset into train/validation sets...")
+        train_count, val_count = split_dataset(args.images_dir, args.labels_dir, output_dir, args.train_ratio,
+                                               args.seed, args.class_index, mosaics, args.link)
+        create_dataset_yaml(output_dir, class_names)
+    else:
+        # Split dataset and stream it into the archive
+        print("\n🔄 Splitting dataset into train/validation sets...")
+        splits = split_pairs(find_pairs(args.images_dir, args.labels_dir), args.train_ratio,
+                             args.seed, args.class_index, mosaics)
+        train_count, val_count = len(splits["train"]), len(splits["val"])
+        output = Path(args.output or f"{DATASET_ROOT}.{args.format}")
+        print(f"\n📦 Streaming the splits into {output}...")
+        archives = pack_dataset(plan_members(splits, class_names), output, args.format,
+                                args.shard_mb, args.checkpoint_mb, resume=not args.no_resume)
+        upload_name = archives[0].name if len(archives) == 1 else f"{len(archives)} {output.stem}-*{output.suffix} shards"
 
     # Create configuration files
     print("\n📝 Creating configuration files...")
-    create_dataset_yaml(output_dir)
     create_training_script()
     create_colab_instructions()
 
@@ -249,8 +300,11 @@ def main():
     print(f"   Total images: {train_count + val_count}")
 
     print(f"\n📦 Files ready for Colab:")
-    print(f"   1. Compress 'yolo_training_dataset/' folder to ZIP")
-    print(f"   2. Upload ZIP to Google Drive or Colab")
+    if args.format == "dir":
+        print(f"   1. Compress 'yolo_training_dataset/' folder to ZIP")
+    else:
+        print(f"   1. {upload_name} is ready, nothing to compress")
+    print(f"   2. Upload it to Google Drive or Colab")
     print(f"   3. Use colab_training_script.py for training")
     print(f"   4. Follow COLAB_INSTRUCTIONS.md")
 
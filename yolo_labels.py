@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+YOLO Label Conversion
+Vectorized detection-to-label conversion and label file I/O shared by the detection tools
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+# class x_center y_center width height, matching the hand-written label files
+LABEL_FORMAT = "%d %.6f %.6f %.6f %.6f"
+
+# Prediction sidecars keep every detection down to RAW_CONFIDENCE with its score,
+# so a different threshold is a filter over the cached rows instead of a new model run
+PREDICTIONS_SUFFIX = ".pred.npz"
+RAW_CONFIDENCE = 0.05
+
+def boxes_to_arrays(boxes):
+    """
+    Move an ultralytics Boxes object to host memory in one transfer per field
+
+    Returns:
+        (xyxy (N, 4) float32, conf (N,) float32, cls (N,) int) numpy arrays
+    """
+    if boxes is None or len(boxes) == 0:
+        return np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, int)
+    return (boxes.xyxy.cpu().numpy().reshape(-1, 4),
+            boxes.conf.cpu().numpy().reshape(-1),
+            boxes.cls.cpu().numpy().reshape(-1).astype(int))
+
+def result_to_arrays(results):
+    """(xyxy, conf, cls) arrays for the first result of a model call"""
+    if not results:
+        return boxes_to_arrays(None)
+    return boxes_to_arrays(results[0].boxes)
+
+def xyxy_to_yolo(xyxy, cls, img_width, img_height, offset=(0, 0)):
+    """
+    Convert pixel xyxy boxes to normalized YOLO rows
+
+    offset shifts boxes found on a crop back into full-image coordinates
+    before normalizing by the full image size.
+
+    Returns:
+        (N, 5) float array of class, x_center, y_center, width, height
+    """
+    xyxy = np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)
+    labels = np.empty((len(xyxy), 5), dtype=np.float64)
+    labels[:, 0] = np.asarray(cls).reshape(-1)
+    labels[:, 1] = ((xyxy[:, 0] + xyxy[:, 2]) / 2 + offset[0]) / img_width
+    labels[:, 2] = ((xyxy[:, 1] + xyxy[:, 3]) / 2 + offset[1]) / img_height
+    labels[:, 3] = (xyxy[:, 2] - xyxy[:, 0]) / img_width
+    labels[:, 4] = (xyxy[:, 3] - xyxy[:, 1]) / img_height
+    return labels
+
+def write_yolo_labels(label_path, labels):
+    """
+    Write (N, 5) labels as one string in one write; N == 0 writes an empty file
+
+    Same bytes as np.savetxt with LABEL_FORMAT, which formats and writes row by row
+    and is slower at every page size (benchmark_label_conversion.py).
+    """
+    labels = np.asarray(labels, dtype=np.float64).reshape(-1, 5)
+    text = "".join(LABEL_FORMAT % tuple(row) + "\n" for row in labels.tolist())
+    with open(label_path, 'w') as f:
+        f.write(text)
+
+def labels_to_list(labels):
+    """Label rows as [int class, x, y, w, h] lists for the editing tools"""
+    return [[int(row[0]), float(row[1]), float(row[2]), float(row[3]), float(row[4])] for row in labels]
+
+def predictions_path(label_path):
+    """Sidecar path next to a label file: name.txt -> name.pred.npz"""
+    return Path(label_path).with_suffix(PREDICTIONS_SUFFIX)
+
+def save_predictions(path, labels, conf, img_width, img_height, confidence, raw_confidence=RAW_CONFIDENCE):
+    """
+    Store raw pre-threshold detections as normalized label rows plus confidences
+
+    confidence is the threshold the written label file was filtered with.
+    """
+    np.savez_compressed(str(path),
+                        labels=np.asarray(labels, dtype=np.float32).reshape(-1, 5),
+                        conf=np.asarray(conf, dtype=np.float32).reshape(-1),
+                        image_size=np.array([img_width, img_height], dtype=np.int64),
+                        confidence=np.float32(confidence),
+                        raw_confidence=np.float32(raw_confidence))
+
+def load_predictions(path):
+    """
+    Load a prediction sidecar
+
+    Returns:
+        dict with labels (N, 5), conf (N,), image_size (width, height),
+        confidence and raw_confidence, or None if there is no sidecar
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    with np.load(str(path)) as data:
+        return {
+            "labels": data["labels"].astype(np.float64),
+            "conf": data["conf"],
+            "image_size": tuple(int(v) for v in data["image_size"]),
+            "confidence": round(float(data["confidence"]), 6),
+            "raw_confidence": round(float(data["raw_confidence"]), 6),
+        }
+
+def filter_predictions(predictions, confidence):
+    """(labels, conf) of the cached detections at or above a confidence threshold"""
+    keep = predictions["conf"] >= confidence
+    return predictions["labels"][keep], predictions["conf"][keep]
+
+def refilter_labels(labels, predictions, confidence, shown_confidence, rejected, tolerance=1e-4):
+    """
+    Labels at a new confidence threshold, keeping the user's edits
+
+    Rows that are unedited cached predictions (same class, coordinates within
+    tolerance) are re-filtered at confidence; drawn, moved or reclassified boxes
+    are kept as they are. Predictions that were shown at shown_confidence but are
+    no longer in labels were deleted by hand: their indices are added to rejected
+    (a set, kept by the caller per image) and they are not brought back.
+
+    Returns:
+        (N, 5) float array: the user's boxes, then the predictions at confidence
+    """
+    labels = np.asarray(labels, dtype=np.float64).reshape(-1, 5)
+    cached, conf = predictions["labels"], predictions["conf"]
+
+    matched = set()
+    edited = np.ones(len(labels), bool)
+    for i, row in enumerate(labels):
+        close = (cached[:, 0] == row[0]) & (np.abs(cached[:, 1:] - row[1:]) <= tolerance).all(axis=1)
+        for index in np.flatnonzero(close):
+            if index not in matched:
+                matched.add(index)
+                edited[i] = False
+                break
+
+    rejected.update(int(index) for index in np.flatnonzero(conf >= shown_confidence) if index not in matched)
+    keep = conf >= confidence
+    keep[list(rejected)] = False
+    return np.concatenate([labels[edited], cached[keep]])